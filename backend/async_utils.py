@@ -0,0 +1,39 @@
+"""
+async_utils.py
+
+Runs blocking Firestore and Firebase Auth calls on a bounded thread pool so
+they never block the event loop.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Maximum number of blocking calls in flight at once per worker process
+BLOCKING_IO_WORKERS = int(os.environ.get("BLOCKING_IO_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS,
+                               thread_name_prefix="blocking-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking function on the bounded executor and awaits its result.
+
+    Input:
+        func: The blocking function to call
+        *args, **kwargs: Arguments passed to func
+
+    Output:
+        Whatever func returns. Exceptions raised by func are re-raised.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+def shutdown_executor():
+    """
+    Waits for in-flight blocking calls and shuts the executor down.
+    """
+    _executor.shutdown(wait=True)
@@ -0,0 +1,277 @@
+"""
+audio_analysis.py
+
+Parses and summarizes the WAV recordings uploaded by the stethoscope.
+
+The firmware (hardware.ino writeWavHeader) writes a canonical 44-byte RIFF
+header followed by 16-bit little endian mono PCM at 44.1 kHz. Samples are
+read in large chunks and reduced with NumPy, so a recording is read once and
+never touched sample by sample.
+
+The firmware writes the header for a full 30 s recording before it starts
+recording, and its record loop stops up to one I2S buffer short of that, so
+uploads usually hold fewer samples than their header declares. Such files
+are treated as truncated audio: the samples that exist are read and the
+recording is flagged as truncated rather than rejected.
+"""
+
+import struct
+import numpy as np
+
+WAV_HEADER_BYTES = 44
+BYTES_PER_SAMPLE = 2
+
+# Samples per read. About 1 MB of audio per chunk.
+CHUNK_SAMPLES = 1 << 19
+
+# A sample at or beyond this magnitude (relative to full scale) is clipped
+CLIP_LEVEL = 32767 / 32768
+
+# Silence is measured on 10 ms frames whose RMS is below this level
+# (relative to full scale, about -40 dBFS)
+SILENCE_FRAME_SECONDS = 0.01
+SILENCE_LEVEL = 0.01
+
+
+class WavFormatError(ValueError):
+    """
+    Raised when a recording is not a WAV file the backend can read.
+    """
+
+
+def parse_wav_header(header: bytes, total_bytes: int = None):
+    """
+    Parses and validates the 44-byte RIFF header written by the firmware.
+
+    Input:
+        header (bytes): The first 44 bytes of the file
+        total_bytes (int): Size of the whole file, used to check the declared lengths
+
+    Output:
+        dict: sample_rate, channels, bits_per_sample, data_bytes (whole
+        samples present, when total_bytes is known) and declared_data_bytes
+
+    Raises:
+        WavFormatError: If the header is malformed or the lengths do not add up
+    """
+    if len(header) < WAV_HEADER_BYTES:
+        raise WavFormatError("File is shorter than a WAV header")
+
+    (riff, riff_size, wave, fmt, fmt_size, audio_format, channels, sample_rate,
+     byte_rate, block_align, bits_per_sample, data, data_bytes) = struct.unpack(
+         "<4sI4s4sIHHIIHH4sI", header[:WAV_HEADER_BYTES])
+
+    if riff != b"RIFF" or wave != b"WAVE" or fmt != b"fmt " or data != b"data":
+        raise WavFormatError("Missing RIFF/WAVE/fmt/data markers")
+    if fmt_size != 16 or audio_format != 1:
+        raise WavFormatError("Only uncompressed PCM is supported")
+    if channels != 1 or bits_per_sample != 16:
+        raise WavFormatError("Only 16-bit mono audio is supported")
+    if sample_rate == 0 or byte_rate != sample_rate * block_align \
+            or block_align != channels * bits_per_sample // 8:
+        raise WavFormatError("Inconsistent sample rate, byte rate or block align")
+    if riff_size != data_bytes + 36:
+        raise WavFormatError("RIFF size does not match the data size")
+    if data_bytes % block_align:
+        raise WavFormatError("Data size is not a whole number of samples")
+
+    declared_data_bytes = data_bytes
+    if total_bytes is not None:
+        available = total_bytes - WAV_HEADER_BYTES
+        if available > declared_data_bytes:
+            raise WavFormatError(
+                f"Declared {declared_data_bytes} data bytes but file holds {available}")
+        # Shorter than declared is truncated audio, see the module docstring
+        data_bytes = available - available % block_align
+        if declared_data_bytes and not data_bytes:
+            raise WavFormatError("File holds no samples")
+
+    return {
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits_per_sample": bits_per_sample,
+        "data_bytes": data_bytes,
+        "declared_data_bytes": declared_data_bytes,
+    }
+
+
+def build_wav_header(sample_rate: int, data_bytes: int) -> bytes:
+    """
+    Builds the 44-byte RIFF header the firmware writes for 16-bit mono PCM.
+
+    Input:
+        sample_rate (int): Samples per second
+        data_bytes (int): Size of the sample data in bytes
+
+    Output:
+        bytes: The header
+    """
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", data_bytes + 36, b"WAVE", b"fmt ", 16,
+                       1, 1, sample_rate, sample_rate * BYTES_PER_SAMPLE, BYTES_PER_SAMPLE,
+                       16, b"data", data_bytes)
+
+
+class SampleStats:
+    """
+    Accumulates summary statistics over chunks of 16-bit samples.
+    """
+
+    def __init__(self, sample_rate: int):
+        """
+        Input:
+            sample_rate (int): Samples per second
+        """
+        self.sample_rate = sample_rate
+        self.frame_samples = max(1, int(sample_rate * SILENCE_FRAME_SECONDS))
+        self.count = 0
+        self.sum_squares = 0.0
+        self.peak = 0.0
+        self.clipped = 0
+        self.frames = 0
+        self.silent_frames = 0
+        self._partial = np.empty(0, dtype=np.float32)
+
+    def add(self, samples: np.ndarray):
+        """
+        Adds a chunk of int16 samples.
+
+        Input:
+            samples (np.ndarray): int16 samples in recording order
+        """
+        if samples.size == 0:
+            return
+        values = samples.astype(np.float32) / 32768.0
+        squares = np.square(values, dtype=np.float64)
+
+        self.count += values.size
+        self.sum_squares += float(squares.sum())
+        self.peak = max(self.peak, float(np.abs(values).max()))
+        self.clipped += int(np.count_nonzero(np.abs(values) >= CLIP_LEVEL))
+
+        # Silence frames may straddle chunks, so keep the leftover samples
+        frame_values = np.concatenate((self._partial, values))
+        whole = frame_values.size - frame_values.size % self.frame_samples
+        self._count_silent_frames(frame_values[:whole])
+        self._partial = frame_values[whole:]
+
+    def _count_silent_frames(self, values: np.ndarray):
+        """
+        Counts silent frames in a buffer holding a whole number of frames, or
+        in a single (frames, samples) array.
+        """
+        if values.size == 0:
+            return
+        frames = values if values.ndim == 2 else values.reshape(-1, self.frame_samples)
+        frame_rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+        self.frames += frames.shape[0]
+        self.silent_frames += int(np.count_nonzero(frame_rms < SILENCE_LEVEL))
+
+    def summary(self):
+        """
+        Output:
+            dict: Recording document fields describing the audio. Levels are
+            relative to full scale (0 to 1).
+        """
+        if self._partial.size:
+            # A recording that is not a whole number of frames long, such as
+            # a truncated upload, ends with one shorter frame
+            self._count_silent_frames(self._partial.reshape(1, -1))
+            self._partial = np.empty(0, dtype=np.float32)
+
+        rms = (self.sum_squares / self.count) ** 0.5 if self.count else 0.0
+        return {
+            "sampleRate": self.sample_rate,
+            "durationSeconds": self.count / self.sample_rate,
+            "rms": rms,
+            "peak": self.peak,
+            "clippingRatio": self.clipped / self.count if self.count else 0.0,
+            "silenceFraction": self.silent_frames / self.frames if self.frames else 1.0,
+        }
+
+
+class WavReader:
+    """
+    Reads a WAV file's header and then its samples in large chunks.
+    """
+
+    def __init__(self, stream, total_bytes: int = None):
+        """
+        Input:
+            stream: Binary file-like object positioned at the start of the WAV
+            total_bytes (int): Size of the file if known, to validate declared lengths
+
+        Raises:
+            WavFormatError: If the header is malformed
+        """
+        self.stream = stream
+        self.header = parse_wav_header(stream.read(WAV_HEADER_BYTES), total_bytes)
+        # Bytes of whole samples read so far
+        self.data_bytes = 0
+
+    def chunks(self):
+        """
+        Yields the samples as int16 arrays of up to CHUNK_SAMPLES each. A file
+        that ends before its declared data size yields the whole samples it
+        holds, and truncated is then true.
+
+        Raises:
+            WavFormatError: If the file holds no samples at all
+        """
+        remaining = self.header["data_bytes"]
+        while remaining:
+            chunk = self.stream.read(min(remaining, CHUNK_SAMPLES * BYTES_PER_SAMPLE))
+            if len(chunk) % BYTES_PER_SAMPLE:
+                chunk += self.stream.read(1)
+            whole = len(chunk) - len(chunk) % BYTES_PER_SAMPLE
+            if whole:
+                self.data_bytes += whole
+                remaining -= whole
+                yield np.frombuffer(chunk[:whole], dtype="<i2")
+            if whole < len(chunk) or not chunk:
+                # The file ended, possibly part way through a sample
+                break
+
+        if self.header["declared_data_bytes"] and not self.data_bytes:
+            raise WavFormatError("File holds no samples")
+
+    @property
+    def truncated(self) -> bool:
+        """
+        Whether fewer samples were read than the header declares.
+        """
+        return self.data_bytes < self.header["declared_data_bytes"]
+
+    def length_fields(self):
+        """
+        Output:
+            dict: Recording document fields with the data size read, the
+            size the header declares and whether the file is truncated
+        """
+        return {
+            "dataBytes": self.data_bytes,
+            "declaredDataBytes": self.header["declared_data_bytes"],
+            "truncated": self.truncated,
+        }
+
+
+def analyze_wav(stream, total_bytes: int = None):
+    """
+    Validates a WAV file and computes its summary statistics, reading it once
+    in large chunks.
+
+    Input:
+        stream: Binary file-like object positioned at the start of the WAV
+        total_bytes (int): Size of the file if known, to validate declared lengths
+
+    Output:
+        dict: Recording document fields from SampleStats.summary and
+        WavReader.length_fields
+
+    Raises:
+        WavFormatError: If the file is malformed or holds no samples
+    """
+    reader = WavReader(stream, total_bytes)
+    stats = SampleStats(reader.header["sample_rate"])
+    for samples in reader.chunks():
+        stats.add(samples)
+    return {**stats.summary(), **reader.length_fields()}
@@ -0,0 +1,176 @@
+"""
+audio_codec.py
+
+Lossless compact format for recordings. Samples are delta encoded (heart
+sounds change slowly from sample to sample, so most deltas are small), the
+low and high bytes of each block of deltas are split into separate planes,
+and the result is deflated with zlib. A CRC-32 of the original PCM is kept in
+the header and checked on every decode.
+
+Because the firmware always writes the canonical 44-byte header, decoding
+rebuilds a WAV byte for byte identical to the original. The exception is a
+truncated upload (see audio_analysis.py), whose rebuilt header declares the
+samples actually stored rather than the full recording.
+
+Binary layout (little endian):
+    header:   4s magic "WVDZ", B version, B reserved, H reserved,
+              I sample rate, I sample count, I CRC-32 of the PCM bytes
+    data:     zlib stream of BLOCK_SAMPLES sample blocks, each the low bytes
+              of the block's int16 deltas followed by their high bytes
+"""
+
+import os
+import struct
+import zlib
+import numpy as np
+from audio_analysis import build_wav_header
+
+# Samples per block. The last block of a recording may be shorter.
+BLOCK_SAMPLES = 1 << 16
+COMPRESSION_LEVEL = 6
+
+# Compressed recordings are stored in the recordings bucket under this prefix
+COMPRESSED_PREFIX = "compressed/"
+
+MAGIC = b"WVDZ"
+VERSION = 1
+HEADER_FORMAT = "<4sBBHIII"
+
+# Whether the ingest pipeline stores a compressed copy of each recording
+COMPRESS_RECORDINGS = os.environ.get("COMPRESS_RECORDINGS", "0") == "1"
+
+
+class CodecError(ValueError):
+    """
+    Raised when compressed data is malformed or fails its checksum.
+    """
+
+
+def compressed_path(recording_id: str) -> str:
+    """
+    Gets the storage object name of a recording's compressed copy.
+
+    Input:
+        recording_id (str): The recording document id
+
+    Output:
+        str: Storage object name
+    """
+    return f"{COMPRESSED_PREFIX}{recording_id}.wdz"
+
+
+class DeltaEncoder:
+    """
+    Compresses chunks of 16-bit samples as they are read.
+    """
+
+    def __init__(self, sample_rate: int):
+        """
+        Input:
+            sample_rate (int): Samples per second
+        """
+        self.sample_rate = sample_rate
+        self.sample_count = 0
+        self.crc = 0
+        self._previous = 0
+        self._partial = np.empty(0, dtype=np.int16)
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        self._parts = []
+
+    def add(self, samples: np.ndarray):
+        """
+        Adds a chunk of int16 samples.
+
+        Input:
+            samples (np.ndarray): int16 samples in recording order
+        """
+        self.crc = zlib.crc32(samples.astype("<i2").tobytes(), self.crc)
+        self.sample_count += samples.size
+
+        buffer = np.concatenate((self._partial, samples))
+        whole = buffer.size - buffer.size % BLOCK_SAMPLES
+        for start in range(0, whole, BLOCK_SAMPLES):
+            self._add_block(buffer[start:start + BLOCK_SAMPLES])
+        self._partial = buffer[whole:]
+
+    def _add_block(self, block: np.ndarray):
+        """
+        Delta encodes and compresses one block, continuing from the last
+        sample of the previous block.
+        """
+        deltas = np.diff(block, prepend=self._previous).astype("<i2")
+        self._previous = int(block[-1])
+        raw = deltas.view(np.uint8)
+        self._parts.append(self._compressor.compress(raw[0::2].tobytes() + raw[1::2].tobytes()))
+
+    def finish(self) -> bytes:
+        """
+        Output:
+            bytes: The compressed recording
+        """
+        if self._partial.size:
+            self._add_block(self._partial)
+            self._partial = np.empty(0, dtype=np.int16)
+        self._parts.append(self._compressor.flush())
+
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0, 0,
+                             self.sample_rate, self.sample_count, self.crc)
+        return header + b"".join(self._parts)
+
+
+def decode_pcm(data: bytes):
+    """
+    Decodes a compressed recording and checks it against its CRC-32.
+
+    Input:
+        data (bytes): The compressed recording
+
+    Output:
+        (int, bytes): Sample rate and 16-bit little endian PCM
+
+    Raises:
+        CodecError: If the data is malformed or the checksum does not match
+    """
+    header_size = struct.calcsize(HEADER_FORMAT)
+    if len(data) < header_size:
+        raise CodecError("Data is shorter than the header")
+    magic, version, _, _, sample_rate, count, crc = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC or version != VERSION:
+        raise CodecError("Not a compressed recording")
+
+    try:
+        planes = np.frombuffer(zlib.decompress(data[header_size:]), dtype=np.uint8)
+    except zlib.error as exc:
+        raise CodecError(f"Corrupt data: {exc}") from exc
+    if planes.size != 2 * count:
+        raise CodecError(f"Expected {count} samples but found {planes.size // 2}")
+
+    # Interleave each block's low and high planes back into int16 deltas
+    full = count // BLOCK_SAMPLES * BLOCK_SAMPLES
+    tail = count - full
+    deltas = np.concatenate((
+        planes[:2 * full].reshape(-1, 2, BLOCK_SAMPLES).transpose(0, 2, 1).reshape(-1),
+        planes[2 * full:].reshape(2, tail).T.reshape(-1),
+    )).view("<i2")
+
+    pcm = np.cumsum(deltas, dtype=np.int16).astype("<i2").tobytes()
+    if zlib.crc32(pcm) != crc:
+        raise CodecError("Checksum mismatch")
+    return sample_rate, pcm
+
+
+def decode_to_wav(data: bytes) -> bytes:
+    """
+    Decodes a compressed recording to a complete WAV file.
+
+    Input:
+        data (bytes): The compressed recording
+
+    Output:
+        bytes: The WAV file
+
+    Raises:
+        CodecError: If the data is malformed or the checksum does not match
+    """
+    sample_rate, pcm = decode_pcm(data)
+    return build_wav_header(sample_rate, len(pcm)) + pcm
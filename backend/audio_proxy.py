@@ -0,0 +1,152 @@
+"""
+audio_proxy.py
+
+Streams recording audio from Firebase Storage to clients with HTTP Range
+support. Objects are read in fixed size chunks and forwarded as they arrive,
+so memory per connection stays bounded. Small, recently played objects are
+kept whole in an LRU cache and served without touching storage.
+
+Recordings stored only in the compressed format (see audio_codec.py) are
+decoded to WAV on demand.
+"""
+
+import os
+from firestore import bucket
+from cache_utils import TTLCache
+from audio_codec import decode_to_wav
+
+# Bytes read from storage and sent to the client at a time
+STREAM_CHUNK_BYTES = 256 * 1024
+
+# Recently played objects kept in memory, and the largest object kept
+AUDIO_CACHE_SIZE = int(os.environ.get("AUDIO_CACHE_SIZE", "32"))
+AUDIO_CACHE_TTL_SECONDS = 600
+HOT_OBJECT_MAX_BYTES = 8 * 1024 * 1024
+
+hot_objects = TTLCache(maxsize=AUDIO_CACHE_SIZE, ttl=AUDIO_CACHE_TTL_SECONDS)
+
+
+class RangeNotSatisfiable(ValueError):
+    """
+    Raised when a Range header does not overlap the object.
+    """
+
+
+def parse_range(header: str, size: int):
+    """
+    Parses a single range Range header.
+
+    Input:
+        header (str): The Range header value, or None
+        size (int): Size of the object in bytes
+
+    Output:
+        (int, int): First and last byte (inclusive) requested
+        None: If the whole object should be sent (no header, or a form that
+        is not supported such as multiple ranges)
+
+    Raises:
+        RangeNotSatisfiable: If the range starts past the end of the object
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def get_audio_object(file_path: str):
+    """
+    Looks up a recording's audio object.
+
+    Input:
+        file_path (str): Name of the object in Firebase Storage
+
+    Output:
+        dict: size and content_type, plus data for cached objects or blob otherwise
+        None: If the object does not exist
+    """
+    cached = hot_objects.get(file_path)
+    if cached is not None:
+        data, content_type = cached
+        return {"size": len(data), "content_type": content_type, "data": data}
+
+    blob = bucket.get_blob(file_path)
+    if blob is None:
+        return None
+    return {"size": blob.size, "content_type": blob.content_type or "audio/wav", "blob": blob}
+
+
+def get_decoded_audio(file_path: str, compressed_file_path: str):
+    """
+    Decodes a recording's compressed copy to WAV. The decoded WAV is cached
+    under the recording's own storage path so replays skip decoding.
+
+    Input:
+        file_path (str): Name of the .wav object in Firebase Storage
+        compressed_file_path (str): Name of the compressed object
+
+    Output:
+        dict: Audio object like get_audio_object returns, holding the WAV data
+        None: If there is no compressed copy
+
+    Raises:
+        CodecError: If the compressed copy is corrupt
+    """
+    blob = bucket.get_blob(compressed_file_path)
+    if blob is None:
+        return None
+
+    data = decode_to_wav(blob.download_as_bytes())
+    if len(data) <= HOT_OBJECT_MAX_BYTES:
+        hot_objects.set(file_path, (data, "audio/wav"))
+    return {"size": len(data), "content_type": "audio/wav", "data": data}
+
+
+def iter_audio(audio: dict, file_path: str, start: int, end: int):
+    """
+    Yields the requested bytes of an audio object in STREAM_CHUNK_BYTES pieces.
+    When a small object is sent whole it is added to the hot object cache.
+
+    Input:
+        audio (dict): Object returned by get_audio_object
+        file_path (str): Name of the object in Firebase Storage
+        start (int): First byte to send
+        end (int): Last byte to send (inclusive)
+
+    Output:
+        Generator of bytes
+    """
+    if "data" in audio:
+        for offset in range(start, end + 1, STREAM_CHUNK_BYTES):
+            yield audio["data"][offset:min(offset + STREAM_CHUNK_BYTES, end + 1)]
+        return
+
+    keep = start == 0 and end == audio["size"] - 1 and audio["size"] <= HOT_OBJECT_MAX_BYTES
+    parts = []
+    remaining = end - start + 1
+
+    with audio["blob"].open("rb", chunk_size=STREAM_CHUNK_BYTES) as reader:
+        reader.seek(start)
+        while remaining > 0:
+            chunk = reader.read(min(remaining, STREAM_CHUNK_BYTES))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if keep:
+                parts.append(chunk)
+            yield chunk
+
+    if keep and remaining == 0:
+        hot_objects.set(file_path, (b"".join(parts), audio["content_type"]))
@@ -1,7 +1,39 @@
 '''Token verification'''
 
+import hashlib
+import os
 from fastapi import Request, HTTPException
 from firebase_admin import auth
+from cache_utils import TTLCache
+from firestore import get_app
+
+# Verified tokens are cached until their exp claim so repeat requests with
+# the same token skip signature verification.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
+
+
+def _verify_id_token(token: str) -> str:
+    """
+        Verifies a Firebase ID token, using the cache when possible.
+
+        Input:
+            token (str): The raw Firebase ID token.
+
+        Output:
+            uid (str): The Firebase UID the token belongs to.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    uid = token_cache.get(key)
+    if uid is not None:
+        return uid
+
+    # Verification uses the default Firebase app, created on first use
+    get_app()
+    decoded_token = auth.verify_id_token(token)
+    token_cache.set(key, decoded_token["uid"], expires_at=decoded_token["exp"])
+    return decoded_token["uid"]
+
 
 def verify_token(request: Request) -> str:
     """
@@ -17,7 +49,6 @@ def verify_token(request: Request) -> str:
     curr_token = auth_header.split(" ")[1]
 
     try:
-        decoded_token = auth.verify_id_token(curr_token)
-        return decoded_token["uid"]
+        return _verify_id_token(curr_token)
     except Exception as exc:
         raise HTTPException(status_code=401, detail="Invalid Firebase ID token") from exc
@@ -0,0 +1,809 @@
+"""
+fakes.py
+
+In-memory stand-ins for the Firestore client, the Firebase Storage bucket and
+Firebase Auth, covering the parts of their APIs the backend uses.
+
+install() puts a fake firebase_admin package in sys.modules, so importing
+firestore.py (and everything built on it) connects to these instead of the
+real project. Every call that would be a network round trip in production is
+counted in `rpcs`, which is what the benchmarks report.
+
+Equality filters are answered from per-field indexes built on first use, so
+a query costs about as much as the documents it returns, as it does in
+Firestore. Range filters are then checked against each of those documents.
+"""
+
+import io
+import operator
+import sys
+import threading
+import time
+import types
+import uuid
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+
+class RpcCounter:
+    """
+    Thread safe counts of simulated network calls, by kind.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, count: int = 1):
+        """
+        Input:
+            kind (str): Kind of call, e.g. "firestore.query"
+            count (int): Number of calls
+        """
+        with self._lock:
+            self._counts[kind] += count
+
+    def snapshot(self) -> dict:
+        """
+        Output:
+            dict: Counts so far, by kind
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        """
+        Clears every count.
+        """
+        with self._lock:
+            self._counts.clear()
+
+
+class FakeClock:
+    """
+    Hands out strictly increasing timestamps, so server timestamps and object
+    update times order the same way on every run.
+    """
+
+    def __init__(self, start: datetime = datetime(2025, 1, 1, tzinfo=timezone.utc)):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        """
+        Output:
+            datetime: A timestamp later than every one returned before
+        """
+        with self._lock:
+            self._now += timedelta(microseconds=1)
+            return self._now
+
+
+class _ServerTimestamp:
+    """
+    Sentinel replaced with the commit time when a document is written.
+    """
+
+    def __repr__(self):
+        return "SERVER_TIMESTAMP"
+
+
+SERVER_TIMESTAMP = _ServerTimestamp()
+
+rpcs = RpcCounter()
+clock = FakeClock()
+
+
+def _resolve(data: dict) -> dict:
+    """
+    Copies document data, replacing SERVER_TIMESTAMP with the current time.
+    """
+    now = None
+    resolved = {}
+    for key, value in data.items():
+        if value is SERVER_TIMESTAMP:
+            now = now or clock.now()
+            value = now
+        resolved[key] = value
+    return resolved
+
+
+def _project(data: dict, fields):
+    """
+    Copies the selected fields of document data, or all of it.
+    """
+    if data is None:
+        return None
+    if fields is None:
+        return dict(data)
+    return {field: data[field] for field in fields if field in data}
+
+
+class FakeSnapshot:
+    """
+    A document read, like firestore.DocumentSnapshot.
+    """
+
+    def __init__(self, doc_id: str, data: dict):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        """
+        Output:
+            dict: The document fields, None if the document does not exist
+        """
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field: str):
+        """
+        Raises:
+            KeyError: If the field is not set
+        """
+        if self._data is None or field not in self._data:
+            raise KeyError(field)
+        return self._data[field]
+
+
+class FakeDocumentReference:
+    """
+    A document in a FakeCollection, like firestore.DocumentReference.
+    """
+
+    def __init__(self, collection, doc_id: str):
+        self.id = doc_id
+        self._collection = collection
+
+    def get(self, field_paths=None, transaction=None):
+        """
+        Reads the document, optionally only some of its fields. Reads in a
+        transaction see the same data, since transactions run one at a time.
+        """
+        del transaction
+        rpcs.add("firestore.get")
+        return FakeSnapshot(self.id, _project(self._collection.read(self.id), field_paths))
+
+    def create(self, data: dict):
+        """
+        Raises:
+            AlreadyExists: If the document exists
+        """
+        rpcs.add("firestore.write")
+        self._collection.apply([("create", self.id, data)])
+
+    def set(self, data: dict, merge: bool = False):
+        """
+        Writes the document, replacing it unless merge is set.
+        """
+        rpcs.add("firestore.write")
+        self._collection.apply([("merge" if merge else "set", self.id, data)])
+
+    def update(self, data: dict):
+        """
+        Raises:
+            NotFound: If the document does not exist
+        """
+        rpcs.add("firestore.write")
+        self._collection.apply([("update", self.id, data)])
+
+    def delete(self):
+        """
+        Deletes the document if it exists.
+        """
+        rpcs.add("firestore.write")
+        self._collection.apply([("delete", self.id, None)])
+
+
+class FakeAggregation:
+    """
+    A count() aggregation over a query.
+    """
+
+    def __init__(self, query):
+        self._query = query
+
+    def get(self):
+        """
+        Output:
+            list: [[result]] where result.value is the count, like
+            firestore's AggregationQuery.get()
+        """
+        rpcs.add("firestore.aggregate")
+        return [[types.SimpleNamespace(alias="count", value=len(self._query.run()))]]
+
+
+# Filter operators the backend uses, e.g. processingAttempts < max when
+# picking pending recordings and updatedAt > since when watching a device
+_OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+              ">": operator.gt, ">=": operator.ge}
+
+
+def _matches(data: dict, field: str, op: str, value) -> bool:
+    """
+    Checks one filter against a document. Like Firestore, documents without
+    the field, or whose value cannot be compared with the filter's, never match.
+    """
+    if field not in data:
+        return False
+    try:
+        return _OPERATORS[op](data[field], value)
+    except TypeError:
+        return False
+
+
+class FakeQuery:
+    """
+    An immutable query over a FakeCollection. Equality and range filters are
+    supported; the first equality filter is answered from an index.
+    """
+
+    def __init__(self, collection, filters=(), orders=(), limit_count=None,
+                 cursor=None, fields=None):
+        self._collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_count
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {"filters": self._filters, "orders": self._orders,
+                 "limit_count": self._limit, "cursor": self._cursor, "fields": self._fields}
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field: str, op: str, value):
+        """
+        Adds a filter with one of the operators in _OPERATORS.
+        """
+        if op not in _OPERATORS:
+            raise NotImplementedError(f"Unsupported operator {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        """
+        Adds a sort key. "__name__" sorts by document id.
+        """
+        return self._copy(orders=self._orders + ((field, direction == "DESCENDING"),))
+
+    def limit(self, count: int):
+        """
+        Limits the number of results.
+        """
+        return self._copy(limit_count=count)
+
+    def start_after(self, values: dict):
+        """
+        Starts after the position described by the sort key values.
+        """
+        return self._copy(cursor=values)
+
+    def select(self, fields):
+        """
+        Only returns the given fields.
+        """
+        return self._copy(fields=list(fields))
+
+    def count(self):
+        """
+        Output:
+            FakeAggregation counting the matching documents
+        """
+        return FakeAggregation(self)
+
+    def run(self) -> list:
+        """
+        Evaluates the query without counting a call.
+
+        Output:
+            list: (document id, data) pairs
+        """
+        equal = next(((field, value) for field, op, value in self._filters if op == "=="), None)
+        if equal:
+            ids = self._collection.matching(*equal)
+        else:
+            ids = self._collection.ids()
+        docs = [(doc_id, self._collection.read(doc_id)) for doc_id in ids]
+        docs = [(doc_id, data) for doc_id, data in docs if data is not None and
+                all(_matches(data, *condition) for condition in self._filters)]
+
+        def sort_value(doc, field):
+            return doc[0] if field == "__name__" else doc[1].get(field)
+
+        # Stable sorts applied from the last key to the first
+        for field, descending in reversed(self._orders or (("__name__", False),)):
+            docs.sort(key=lambda doc, field=field: sort_value(doc, field), reverse=descending)
+
+        if self._cursor is not None:
+            cursor = tuple(self._cursor[field] for field, _ in self._orders)
+            docs = [doc for doc in docs
+                    if tuple(sort_value(doc, field) for field, _ in self._orders) > cursor]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return docs
+
+    def stream(self):
+        """
+        Yields the matching documents as snapshots.
+        """
+        rpcs.add("firestore.query")
+        docs = self.run()
+        rpcs.add("firestore.documents_read", len(docs))
+        for doc_id, data in docs:
+            yield FakeSnapshot(doc_id, _project(data, self._fields))
+
+
+class FakeCollection(FakeQuery):
+    """
+    A collection of documents, which is also the query matching all of them.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(self)
+        self.name = name
+        self._docs = {}
+        self._indexes = {}
+        self._lock = threading.RLock()
+
+    def document(self, doc_id: str = None):
+        """
+        Output:
+            FakeDocumentReference for the id, or a new random id
+        """
+        return FakeDocumentReference(self, doc_id or uuid.uuid4().hex)
+
+    def read(self, doc_id: str):
+        """
+        Output:
+            dict: The stored document, None if it does not exist
+        """
+        return self._docs.get(doc_id)
+
+    def ids(self) -> list:
+        """
+        Output:
+            list: Every document id
+        """
+        with self._lock:
+            return list(self._docs)
+
+    def matching(self, field: str, value) -> list:
+        """
+        Output:
+            list: Ids of documents whose field equals value
+        """
+        with self._lock:
+            if field not in self._indexes:
+                index = {}
+                for doc_id, data in self._docs.items():
+                    if field in data:
+                        index.setdefault(data[field], set()).add(doc_id)
+                self._indexes[field] = index
+            return list(self._indexes[field].get(value, ()))
+
+    def _store(self, doc_id: str, data):
+        """
+        Replaces a document and keeps the indexes in step.
+        """
+        old = self._docs.get(doc_id)
+        for field, index in self._indexes.items():
+            if old is not None and field in old:
+                index.get(old[field], set()).discard(doc_id)
+            if data is not None and field in data:
+                index.setdefault(data[field], set()).add(doc_id)
+        if data is None:
+            self._docs.pop(doc_id, None)
+        else:
+            self._docs[doc_id] = data
+
+    def apply(self, writes: list):
+        """
+        Applies writes atomically: none are applied if any precondition fails.
+
+        Input:
+            writes (list): (kind, document id, data) tuples, where kind is
+            create, set, merge, update or delete
+
+        Raises:
+            AlreadyExists: If a created document exists
+            NotFound: If an updated document does not exist
+        """
+        with self._lock:
+            for kind, doc_id, _ in writes:
+                if kind == "create" and doc_id in self._docs:
+                    raise AlreadyExists(f"{self.name}/{doc_id}")
+                if kind == "update" and doc_id not in self._docs:
+                    raise NotFound(f"{self.name}/{doc_id}")
+
+            for kind, doc_id, data in writes:
+                if kind == "delete":
+                    self._store(doc_id, None)
+                elif kind in ("create", "set"):
+                    self._store(doc_id, _resolve(data))
+                else:
+                    self._store(doc_id, {**self._docs.get(doc_id, {}), **_resolve(data)})
+
+    def seed(self, docs: dict):
+        """
+        Loads documents directly, without counting calls.
+
+        Input:
+            docs (dict): Document id to data
+        """
+        with self._lock:
+            for doc_id, data in docs.items():
+                self._store(doc_id, _resolve(data))
+
+
+class FakeWriteBatch:
+    """
+    Writes committed together, like firestore.WriteBatch.
+    """
+
+    def __init__(self):
+        self._writes = []
+
+    def create(self, reference, data):
+        """
+        Queues a create.
+        """
+        self._writes.append((reference, "create", data))
+
+    def set(self, reference, data, merge: bool = False):
+        """
+        Queues a set.
+        """
+        self._writes.append((reference, "merge" if merge else "set", data))
+
+    def update(self, reference, data):
+        """
+        Queues an update.
+        """
+        self._writes.append((reference, "update", data))
+
+    def delete(self, reference):
+        """
+        Queues a delete.
+        """
+        self._writes.append((reference, "delete", None))
+
+    def commit(self):
+        """
+        Applies every queued write, or none of them.
+        """
+        rpcs.add("firestore.commit")
+        by_collection = {}
+        for reference, kind, data in self._writes:
+            by_collection.setdefault(reference._collection, []).append(  # pylint: disable=protected-access
+                (kind, reference.id, data))
+        for collection, writes in by_collection.items():
+            collection.apply(writes)
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Reads and writes committed together, like firestore.Transaction.
+    """
+
+
+# Transactions run one at a time, which is what Firestore's optimistic
+# concurrency amounts to for the few documents the backend touches in them
+_transaction_lock = threading.Lock()
+
+
+def transactional(func):
+    """
+    Stand-in for firestore.transactional: runs func with the transaction
+    and commits its writes.
+    """
+    def run(transaction, *args, **kwargs):
+        with _transaction_lock:
+            result = func(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+    """
+    Stand-in for the client returned by firebase_admin.firestore.client().
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> FakeCollection:
+        """
+        Output:
+            FakeCollection: The named collection, created on first use
+        """
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name)
+            return self._collections[name]
+
+    def batch(self) -> FakeWriteBatch:
+        """
+        Output:
+            FakeWriteBatch: An empty batch
+        """
+        return FakeWriteBatch()
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        """
+        Reads several documents in one call, like Client.get_all.
+
+        Output:
+            Generator of FakeSnapshot, one per reference
+        """
+        del transaction
+        references = list(references)
+        rpcs.add("firestore.get_all")
+        rpcs.add("firestore.documents_read", len(references))
+        for reference in references:
+            data = reference._collection.read(reference.id)  # pylint: disable=protected-access
+            yield FakeSnapshot(reference.id, _project(data, field_paths))
+
+    def transaction(self) -> FakeTransaction:
+        """
+        Output:
+            FakeTransaction: A transaction to pass to a transactional function
+        """
+        return FakeTransaction()
+
+    def reset(self):
+        """
+        Deletes every document, keeping collection objects (which modules
+        hold on to) valid.
+        """
+        with self._lock:
+            for collection in self._collections.values():
+                with collection._lock:  # pylint: disable=protected-access
+                    collection._docs.clear()  # pylint: disable=protected-access
+                    collection._indexes.clear()  # pylint: disable=protected-access
+
+
+class _StoredObject:
+    """
+    Contents and metadata of one storage object.
+    """
+
+    def __init__(self, data: bytes, content_type: str, generation: int):
+        self.data = data
+        self.content_type = content_type
+        self.generation = generation
+        self.updated = clock.now()
+
+
+class _CountingReader(io.BytesIO):
+    """
+    Reads an object, counting one ranged download per chunk_size block
+    touched, the way google.cloud.storage's BlobReader fetches them.
+    """
+
+    def __init__(self, data: bytes, chunk_size: int):
+        super().__init__(data)
+        self._chunk_size = chunk_size or max(len(data), 1)
+        self._fetched = set()
+
+    def read(self, size=-1):
+        start = self.tell()
+        data = super().read(size)
+        if data:
+            blocks = set(range(start // self._chunk_size,
+                               (start + len(data) - 1) // self._chunk_size + 1))
+            rpcs.add("storage.download", len(blocks - self._fetched))
+            self._fetched |= blocks
+        return data
+
+
+class FakeBlob:
+    """
+    A handle to a storage object, like google.cloud.storage.Blob.
+    """
+
+    def __init__(self, fake_bucket, name: str, stored: _StoredObject = None):
+        self.name = name
+        self._bucket = fake_bucket
+        self._stored = stored
+
+    def _object(self) -> _StoredObject:
+        stored = self._stored or self._bucket.objects.get(self.name)
+        if stored is None:
+            raise NotFound(self.name)
+        return stored
+
+    @property
+    def size(self):
+        """
+        Size in bytes, None if the object does not exist.
+        """
+        stored = self._stored or self._bucket.objects.get(self.name)
+        return None if stored is None else len(stored.data)
+
+    @property
+    def updated(self):
+        """
+        Time the object was last written.
+        """
+        return self._object().updated
+
+    @property
+    def content_type(self):
+        """
+        The object's content type.
+        """
+        return self._object().content_type
+
+    @property
+    def generation(self):
+        """
+        The object's generation number.
+        """
+        return self._object().generation
+
+    def open(self, mode: str = "rb", chunk_size: int = None):
+        """
+        Opens the object for reading.
+        """
+        if mode != "rb":
+            raise NotImplementedError(mode)
+        return _CountingReader(self._object().data, chunk_size)
+
+    def download_as_bytes(self, start: int = None, end: int = None):
+        """
+        Downloads the object, or the inclusive byte range start to end.
+        """
+        rpcs.add("storage.download")
+        data = self._object().data
+        return data[start or 0:None if end is None else end + 1]
+
+    def upload_from_string(self, data, content_type: str = None):
+        """
+        Writes the object.
+        """
+        rpcs.add("storage.upload")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._bucket.put(self.name, data, content_type)
+
+    def upload_from_filename(self, filename: str, content_type: str = None):
+        """
+        Writes the object from a local file.
+        """
+        with open(filename, "rb") as source:
+            self.upload_from_string(source.read(), content_type)
+
+
+class _BlobListing:
+    """
+    Result of list_blobs, iterated one page at a time through .pages.
+    """
+
+    def __init__(self, fake_bucket, prefix: str, page_size: int):
+        self._bucket = fake_bucket
+        self._prefix = prefix or ""
+        self._page_size = page_size or 1000
+
+    @property
+    def pages(self):
+        """
+        Yields lists of blobs, counting one listing call per page.
+        """
+        names = self._bucket.sorted_names()
+        position = bisect_left(names, self._prefix)
+        while True:
+            rpcs.add("storage.list")
+            page = []
+            while position < len(names) and len(page) < self._page_size \
+                    and names[position].startswith(self._prefix):
+                name = names[position]
+                page.append(FakeBlob(self._bucket, name, self._bucket.objects[name]))
+                position += 1
+            yield page
+            if len(page) < self._page_size:
+                return
+
+
+class FakeBucket:
+    """
+    Stand-in for the bucket returned by firebase_admin.storage.bucket().
+    """
+
+    def __init__(self, name: str = "benchmark-bucket"):
+        self.name = name
+        self.objects = {}
+        self._sorted = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def put(self, name: str, data: bytes, content_type: str = None):
+        """
+        Writes an object without counting a call.
+        """
+        with self._lock:
+            self._generation += 1
+            if name not in self.objects:
+                self._sorted = None
+            self.objects[name] = _StoredObject(data, content_type, self._generation)
+
+    def sorted_names(self) -> list:
+        """
+        Output:
+            list: Object names in listing order
+        """
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self.objects)
+            return self._sorted
+
+    def blob(self, name: str) -> FakeBlob:
+        """
+        Output:
+            FakeBlob: A handle to the object, which may not exist
+        """
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str):
+        """
+        Output:
+            FakeBlob: The object with its metadata, None if it does not exist
+        """
+        rpcs.add("storage.metadata")
+        stored = self.objects.get(name)
+        return None if stored is None else FakeBlob(self, name, stored)
+
+    def list_blobs(self, prefix: str = None, page_size: int = None, fields: str = None):
+        """
+        Lists objects by name prefix. fields is accepted and ignored.
+        """
+        del fields
+        return _BlobListing(self, prefix, page_size)
+
+    def reset(self):
+        """
+        Deletes every object.
+        """
+        with self._lock:
+            self.objects.clear()
+            self._sorted = None
+
+
+def verify_id_token(token: str, check_revoked: bool = False):
+    """
+    Stand-in for firebase_admin.auth.verify_id_token. The token is the uid.
+    """
+    del check_revoked
+    rpcs.add("auth.verify")
+    return {"uid": token, "exp": time.time() + 3600}
+
+
+db = FakeFirestore()
+bucket = FakeBucket()
+
+
+def install():
+    """
+    Registers a fake firebase_admin package backed by `db`, `bucket` and
+    verify_id_token. Must be called before any backend module is imported.
+    Creating the Firebase app and each client counts as a call.
+    """
+    def connect(kind: str, client):
+        rpcs.add(kind)
+        return client
+
+    module = types.ModuleType("firebase_admin")
+    module.initialize_app = lambda *args, **kwargs: connect("firebase.initialize_app",
+                                                            types.SimpleNamespace())
+    module.credentials = types.SimpleNamespace(Certificate=lambda *args, **kwargs: None)
+    module.firestore = types.SimpleNamespace(
+        client=lambda *args, **kwargs: connect("firestore.client", db),
+        SERVER_TIMESTAMP=SERVER_TIMESTAMP, transactional=transactional)
+    module.storage = types.SimpleNamespace(
+        bucket=lambda *args, **kwargs: connect("storage.client", bucket))
+    module.auth = types.SimpleNamespace(verify_id_token=verify_id_token)
+    sys.modules["firebase_admin"] = module
@@ -0,0 +1,320 @@
+"""
+run.py
+
+Offline benchmark suite. Seeds the in-memory Firestore and bucket stand-ins
+(see fakes.py) at each requested size and measures the backend's endpoints
+and sync against them, reporting latency and the number of Firestore,
+Storage and Auth calls each operation makes. No network access is needed.
+
+Latency here is the backend's own overhead plus the fakes', not production
+latency; the RPC counts are what map to production cost and are exact.
+
+Usage (from the backend directory):
+    python -m benchmarks.run --sizes 10000,100000 --repeat 20 --json results.json
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import fakes
+
+fakes.install()
+
+# pylint: disable=wrong-import-position
+from fastapi.testclient import TestClient
+import firestore
+from benchmarks.seed import seed, device_name, make_recording, BENCH_USER
+from main import app
+from waveform import PeakPyramid, encode_pyramid, waveform_path
+from storage_notifications import pubsub_push_payload
+from recording_processing import ingest_new_recordings, shutdown_denoise_pool
+from audio_analysis import WavReader
+# pylint: enable=wrong-import-position
+
+# Per-sync info logs would drown out the results
+logging.disable(logging.INFO)
+
+AUTH_HEADERS = {"Authorization": f"Bearer {BENCH_USER}"}
+
+# New recordings uploaded before each "new files" sync
+NEW_FILES_PER_SYNC = 100
+
+# New recordings uploaded before each ingest run, each of which is
+# downloaded, analyzed and denoised
+NEW_FILES_PER_INGEST = 10
+
+# Callers starting a whole-bucket sync at the same moment, as when many
+# users log in at once
+CONCURRENT_SYNCS = 8
+
+# Importing the app must stay under this. It creates no Firebase clients, so
+# it is mostly FastAPI and NumPy imports.
+STARTUP_TARGET_MS = 1500
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter so nothing is imported yet
+STARTUP_SCRIPT = """
+import json, time
+from benchmarks import fakes
+fakes.install()
+start = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - start) * 1000
+import_rpcs = fakes.rpcs.snapshot()
+start = time.perf_counter()
+main.firestore.initialize()
+print(json.dumps({"import_ms": import_ms, "import_rpcs": import_rpcs,
+                  "initialize_ms": (time.perf_counter() - start) * 1000,
+                  "initialize_rpcs": fakes.rpcs.snapshot()}))
+"""
+
+
+def measure(name: str, size: int, func, repeat: int, setup=None):
+    """
+    Times an operation and counts the calls it makes. One untimed warm-up
+    run comes first, so caches and the fakes' indexes are populated as they
+    would be in a long running server.
+
+    Input:
+        name (str): Name of the operation
+        size (int): Number of recordings seeded
+        func: The operation, called with no arguments
+        repeat (int): Number of timed runs
+        setup: Called before each run, not timed or counted
+
+    Output:
+        dict: name, size, p50_ms, p95_ms, max_ms and rpcs (mean calls per run by kind)
+    """
+    timings = []
+    counts = {}
+    for run in range(repeat + 1):
+        if setup:
+            setup()
+        fakes.rpcs.reset()
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        if run == 0:
+            continue
+        timings.append(elapsed)
+        for kind, count in fakes.rpcs.snapshot().items():
+            counts[kind] = counts.get(kind, 0) + count
+
+    return _summarize(name, timings, counts, repeat, size)
+
+
+def _summarize(name: str, timings: list, counts: dict, repeat: int, size: int = 0):
+    """
+    Builds a result dict from timings in milliseconds and total call counts.
+    """
+    timings = sorted(timings)
+    return {
+        "name": name,
+        "size": size,
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "max_ms": round(timings[-1], 3),
+        "rpcs": {kind: round(count / repeat, 2) for kind, count in sorted(counts.items())},
+    }
+
+
+def measure_startup(repeat: int):
+    """
+    Times importing the app and then creating the Firebase clients, each in
+    a fresh interpreter, and counts the calls each step makes.
+
+    Input:
+        repeat (int): Number of interpreters started
+
+    Output:
+        list: Result dicts for the import and for initialize(); the import
+        result also carries target_ms
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=BACKEND_DIR,
+                                check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = []
+    for step, name in (("import", "startup: import main"),
+                       ("initialize", "startup: firestore.initialize()")):
+        counts = {}
+        for run in runs:
+            for kind, count in run[f"{step}_rpcs"].items():
+                counts[kind] = counts.get(kind, 0) + count
+        results.append(_summarize(name, [run[f"{step}_ms"] for run in runs], counts, repeat))
+    results[0]["target_ms"] = STARTUP_TARGET_MS
+    return results
+
+
+def _expect(response, status_code: int):
+    """
+    Fails the benchmark if an endpoint did not answer as expected.
+    """
+    if response.status_code != status_code:
+        raise RuntimeError(f"{response.request.method} {response.request.url} returned "
+                           f"{response.status_code}, expected {status_code}")
+    return response
+
+
+def _upload_new_files(count: int = NEW_FILES_PER_SYNC):
+    """
+    Uploads new recordings for the benchmark user's device without counting
+    calls.
+
+    Input:
+        count (int): Number of recordings
+    """
+    wav = make_recording(0.1)
+    for _ in range(count):
+        fakes.bucket.put(f"/{device_name(0)}_new{time.perf_counter_ns()}.wav", wav, "audio/wav")
+
+
+def _concurrent_syncs():
+    """
+    Starts CONCURRENT_SYNCS whole-bucket syncs at once and waits for them.
+    """
+    with ThreadPoolExecutor(max_workers=CONCURRENT_SYNCS) as pool:
+        list(pool.map(lambda _: firestore.sync_new_files(), range(CONCURRENT_SYNCS)))
+
+
+def run_size(size: int, devices: int, repeat: int):
+    """
+    Seeds one data size and runs every benchmark against it.
+
+    Input:
+        size (int): Number of recordings
+        devices (int): Number of devices they are spread over
+        repeat (int): Timed runs per benchmark
+
+    Output:
+        list: One result dict per benchmark
+    """
+    own_ids = seed(size, devices)
+    client = TestClient(app)
+    recording_id = own_ids[0]
+
+    # The waveform of one recording, as the processing stage would store it
+    reader = WavReader(io.BytesIO(make_recording()))
+    pyramid = PeakPyramid(reader.header["sample_rate"])
+    for samples in reader.chunks():
+        pyramid.add(samples)
+    fakes.bucket.put(waveform_path(recording_id), encode_pyramid(pyramid))
+
+    etag = _expect(client.get("/recordings/compile", headers=AUTH_HEADERS),
+                   200).headers["ETag"]
+    page_size = min(50, max(1, len(own_ids)))
+
+    endpoints = [
+        ("GET /login",
+         lambda: _expect(client.get("/login", headers=AUTH_HEADERS), 200)),
+        (f"GET /recordings/compile ({len(own_ids)} recordings)",
+         lambda: _expect(client.get("/recordings/compile", headers=AUTH_HEADERS), 200)),
+        (f"GET /recordings/compile?limit={page_size}",
+         lambda: _expect(client.get("/recordings/compile", params={"limit": page_size},
+                                    headers=AUTH_HEADERS), 200)),
+        ("GET /recordings/compile (304)",
+         lambda: _expect(client.get("/recordings/compile",
+                                    headers={**AUTH_HEADERS, "If-None-Match": etag}), 304)),
+        ("PUT /recordings/update-view",
+         lambda: _expect(client.put("/recordings/update-view", headers=AUTH_HEADERS,
+                                    json={"recordingID": recording_id, "view": True}), 200)),
+        ("GET /recordings/{id}/waveform",
+         lambda: _expect(client.get(f"/recordings/{recording_id}/waveform",
+                                    params={"level": 2}, headers=AUTH_HEADERS), 200)),
+        ("GET /recordings/{id}/audio (range)",
+         lambda: _expect(client.get(f"/recordings/{recording_id}/audio",
+                                    headers={**AUTH_HEADERS, "Range": "bytes=0-65535"}), 206)),
+    ]
+
+    results = [measure(name, size, func, repeat) for name, func in endpoints]
+
+    # One new upload per run, ingested from its finalize notification
+    uploads = []
+    new_recording = make_recording(0.1)
+
+    def upload_one():
+        uploads.append(f"/{device_name(0)}_notified{time.perf_counter_ns()}.wav")
+        fakes.bucket.put(uploads[-1], new_recording, "audio/wav")
+
+    results.append(measure(
+        "POST /notifications/storage", size,
+        lambda: _expect(client.post("/notifications/storage",
+                                    json=pubsub_push_payload(fakes.bucket.name, uploads[-1])),
+                        201),
+        repeat, setup=upload_one))
+    # Before the syncs below, whose recordings would otherwise still be pending
+    results.append(measure(
+        f"ingest_new_recordings() {NEW_FILES_PER_INGEST} new", size, ingest_new_recordings,
+        repeat, setup=lambda: _upload_new_files(NEW_FILES_PER_INGEST)))
+    results += [
+        measure("sync_new_files() idle", size, firestore.sync_new_files, repeat),
+        measure(f"sync_new_files() {NEW_FILES_PER_SYNC} new", size,
+                firestore.sync_new_files, repeat, setup=_upload_new_files),
+        measure("sync_new_files(device) idle", size,
+                lambda: firestore.sync_new_files(device_name(0)), repeat),
+        measure(f"sync_new_files() x{CONCURRENT_SYNCS} concurrent, {NEW_FILES_PER_SYNC} new",
+                size, _concurrent_syncs, repeat, setup=_upload_new_files),
+    ]
+    return results
+
+
+def format_results(results: list) -> str:
+    """
+    Formats results as a plain text table.
+
+    Input:
+        results (list): Result dicts from measure
+
+    Output:
+        str: The table
+    """
+    lines = [f"{'benchmark':<44} {'size':>9} {'p50 ms':>9} {'p95 ms':>9}  rpcs per call"]
+    for result in results:
+        rpcs = " ".join(f"{kind}={count:g}" for kind, count in result["rpcs"].items())
+        lines.append(f"{result['name']:<44} {result['size']:>9} {result['p50_ms']:>9.2f} "
+                     f"{result['p95_ms']:>9.2f}  {rpcs}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    Parses arguments, runs the benchmarks for every size and prints a table.
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="Comma separated recording counts to seed (default 10000,100000)")
+    parser.add_argument("--devices", type=int, default=100,
+                        help="Devices the recordings are spread over (default 100)")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Timed runs per benchmark (default 20)")
+    parser.add_argument("--json", help="Also write the results to this file as JSON")
+    args = parser.parse_args(argv)
+
+    results = measure_startup(min(args.repeat, 5))
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            results += run_size(size, args.devices, args.repeat)
+    finally:
+        shutdown_denoise_pool()
+
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+seed.py
+
+Fills the fake Firestore and bucket with a fleet of devices and recordings.
+"""
+
+import struct
+import numpy as np
+from benchmarks import fakes
+
+# The user the benchmarks authenticate as. The fake auth uses the token as uid.
+BENCH_USER = "bench-user"
+SAMPLE_RATE = 44100
+
+
+def device_name(index: int) -> str:
+    """
+    Output:
+        str: The id of the index-th device
+    """
+    return f"bench{index:05d}"
+
+
+def make_recording(seconds: float = 5.0) -> bytes:
+    """
+    Builds a WAV with a 72 BPM beat, shared by every seeded recording.
+
+    Input:
+        seconds (float): Length of the recording
+
+    Output:
+        bytes: The WAV file
+    """
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    beats = ((t % (60 / 72)) < 0.08) * np.sin(2 * np.pi * 60 * t) * 8000
+    noise = np.random.default_rng(0).normal(0, 200, t.size)
+    data = (beats + noise).astype("<i2").tobytes()
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", len(data) + 36, b"WAVE", b"fmt ",
+                         16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16, b"data", len(data))
+    return header + data
+
+
+def seed(size: int, devices: int):
+    """
+    Replaces the fake data with `size` synced and processed recordings spread
+    evenly over `devices` devices, and a user whose current device is the
+    first one. The sync watermark is set to the newest object.
+
+    Input:
+        size (int): Number of recordings
+        devices (int): Number of devices
+
+    Output:
+        list: Recording ids of the benchmark user's current device
+    """
+    # Imported here so fakes.install() has run first
+    import firestore  # pylint: disable=import-outside-toplevel
+
+    fakes.db.reset()
+    fakes.bucket.reset()
+
+    wav = make_recording()
+    docs = {}
+    own_ids = []
+    for index in range(size):
+        device = device_name(index % devices)
+        file_path = f"/{device}_{index}.wav"
+        fakes.bucket.put(file_path, wav, "audio/wav")
+        doc = firestore._build_recording_doc(file_path)  # pylint: disable=protected-access
+        doc["processed"] = True
+        recording_id = firestore.recording_id_for_path(file_path)
+        docs[recording_id] = doc
+        if index % devices == 0:
+            own_ids.append(recording_id)
+
+    fakes.db.collection("recordings").seed(docs)
+    fakes.db.collection("users").seed({BENCH_USER: {
+        "email": "bench@example.com", "firstName": "Bench", "timeZone": "UTC",
+        "deviceIDs": [device_name(0)], "deviceNicknames": {},
+        "currentDeviceID": device_name(0)}})
+
+    newest = max((stored.updated for stored in fakes.bucket.objects.values()), default=None)
+    if newest is not None:
+        names = sorted(name for name, stored in fakes.bucket.objects.items()
+                       if stored.updated == newest)
+        fakes.db.collection(firestore.SYNC_STATE_COLLECTION).seed(
+            {firestore.SYNC_STATE_DOCUMENT: {"lastUpdated": newest, "namesAtWatermark": names}})
+    return own_ids
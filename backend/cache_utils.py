@@ -0,0 +1,160 @@
+"""
+cache_utils.py
+
+Small thread-safe in-memory cache used to avoid repeating Firebase calls,
+and single-flight coalescing of concurrent identical calls.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire at a given time.
+
+    Entries expire either at the time passed to set() or after the cache's
+    default ttl. When the cache is full the least recently used entry is
+    evicted. All methods are safe to call from multiple threads.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None, clock=time.time):
+        """
+        Input:
+            maxsize (int): Maximum number of entries kept
+            ttl (float): Default seconds an entry lives, None for no default expiry
+            clock: Function returning the current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Gets a cached value and marks it as recently used.
+
+        Input:
+            key: The cache key
+            default: Returned when the key is missing or expired
+
+        Output:
+            The cached value or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at: float = None):
+        """
+        Stores a value, evicting the least recently used entry if full.
+
+        Input:
+            key: The cache key
+            value: The value to cache
+            expires_at (float): Time the entry expires, defaults to now + ttl
+        """
+        if expires_at is None and self.ttl is not None:
+            expires_at = self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Removes a key from the cache if present.
+
+        Input:
+            key: The cache key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Output:
+            dict: Hit and miss counts, current size and maximum size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function and callers arriving while it runs wait for and share its
+    result (or exception) instead of repeating the work. Calls made after it
+    finishes run again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Input:
+            key: Calls with equal keys are coalesced
+            func: The function to run
+            *args, **kwargs: Arguments passed to func
+
+        Output:
+            Whatever the shared call of func returned
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as exc:
+            with self._lock:
+                del self._calls[key]
+            call.set_exception(exc)
+            raise
+        with self._lock:
+            del self._calls[key]
+        call.set_result(result)
+        return result
+
+    def in_flight(self, key) -> bool:
+        """
+        Output:
+            bool: Whether a call for the key is running
+        """
+        with self._lock:
+            return key in self._calls
@@ -0,0 +1,126 @@
+"""
+denoise.py
+
+Cleans stethoscope recordings for listening. Heart sounds sit between about
+20 and 400 Hz, so everything outside that band is removed, and a spectral
+gate attenuates stationary noise (handling rumble, hum, hiss) inside it.
+
+Both steps run on one short-time Fourier transform of the whole recording:
+frames are windowed, transformed, multiplied by a per-bin gain and
+overlap-added back. Everything is vectorized with NumPy.
+
+This module only depends on NumPy so it can be imported cheaply by the
+worker processes that run it (see recording_processing.py).
+"""
+
+import numpy as np
+from audio_analysis import build_wav_header
+
+LOW_HZ = 20
+HIGH_HZ = 400
+
+# STFT frame and hop. 4096 samples at 44.1 kHz gives about 11 Hz bins.
+FRAME_SAMPLES = 4096
+OVERLAP = 4
+HOP_SAMPLES = FRAME_SAMPLES // OVERLAP
+
+# A bin is kept when its magnitude is this many times the noise floor, which
+# is estimated per frequency as a low percentile of magnitudes over time.
+# Gated bins are attenuated to GATE_FLOOR rather than zeroed, and the gain is
+# averaged over GATE_SMOOTH_FRAMES frames to avoid "musical noise".
+NOISE_PERCENTILE = 20
+GATE_THRESHOLD = 2.0
+GATE_FLOOR = 0.1
+GATE_SMOOTH_FRAMES = 3
+
+# Cleaned recordings are stored in the recordings bucket under this prefix.
+# They are named .wave rather than .wav so storage sync never takes them for
+# uploaded recordings (see firestore.is_recording_object).
+CLEANED_PREFIX = "cleaned/"
+
+
+def cleaned_path(recording_id: str) -> str:
+    """
+    Gets the storage object name of a recording's cleaned WAV.
+
+    Input:
+        recording_id (str): The recording document id
+
+    Output:
+        str: Storage object name
+    """
+    return f"{CLEANED_PREFIX}{recording_id}.wave"
+
+
+def _overlap_add(frames: np.ndarray) -> np.ndarray:
+    """
+    Overlap-adds frames spaced HOP_SAMPLES apart.
+
+    Input:
+        frames (np.ndarray): (frame count, FRAME_SAMPLES) array
+
+    Output:
+        np.ndarray: The summed signal
+    """
+    count = frames.shape[0]
+    blocks = frames.reshape(count, OVERLAP, HOP_SAMPLES)
+    out = np.zeros((count + OVERLAP - 1, HOP_SAMPLES), dtype=frames.dtype)
+    for index in range(OVERLAP):
+        out[index:index + count] += blocks[:, index]
+    return out.reshape(-1)
+
+
+def bandpass_denoise(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Band-passes and spectrally gates a recording.
+
+    Input:
+        samples (np.ndarray): int16 samples
+        sample_rate (int): Samples per second
+
+    Output:
+        np.ndarray: The cleaned int16 samples, same length as the input
+    """
+    count = samples.size
+    if count == 0:
+        return samples.astype(np.int16)
+
+    # Pad a full frame on both sides so every sample is covered by OVERLAP frames
+    padded = np.pad(samples.astype(np.float32),
+                    (FRAME_SAMPLES, FRAME_SAMPLES + (-count) % HOP_SAMPLES))
+    window = np.hanning(FRAME_SAMPLES + 1)[:-1].astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(padded, FRAME_SAMPLES)[::HOP_SAMPLES]
+    spectrum = np.fft.rfft(frames * window, axis=1)
+
+    magnitude = np.abs(spectrum)
+    noise_floor = np.percentile(magnitude, NOISE_PERCENTILE, axis=0)
+    gain = np.where(magnitude > GATE_THRESHOLD * noise_floor, 1.0, GATE_FLOOR).astype(np.float32)
+
+    # Moving average of the gain over time
+    edge = GATE_SMOOTH_FRAMES // 2
+    summed = np.cumsum(np.pad(gain, ((edge + 1, edge), (0, 0)), mode="edge"), axis=0)
+    gain = (summed[GATE_SMOOTH_FRAMES:] - summed[:-GATE_SMOOTH_FRAMES]) / GATE_SMOOTH_FRAMES
+
+    freqs = np.fft.rfftfreq(FRAME_SAMPLES, 1 / sample_rate)
+    gain *= (freqs >= LOW_HZ) & (freqs <= HIGH_HZ)
+
+    cleaned = np.fft.irfft(spectrum * gain, n=FRAME_SAMPLES, axis=1).astype(np.float32) * window
+    norm = _overlap_add(np.broadcast_to(window * window, frames.shape))
+    out = _overlap_add(cleaned)
+    out = out[FRAME_SAMPLES:FRAME_SAMPLES + count] / norm[FRAME_SAMPLES:FRAME_SAMPLES + count]
+    return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+def clean_recording(samples: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Cleans a recording and encodes it as a WAV file. Runs in a worker process.
+
+    Input:
+        samples (np.ndarray): int16 samples
+        sample_rate (int): Samples per second
+
+    Output:
+        bytes: The cleaned WAV file
+    """
+    data = bandpass_denoise(samples, sample_rate).astype("<i2").tobytes()
+    return build_wav_header(sample_rate, len(data)) + data
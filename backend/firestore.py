@@ -1,63 +1,788 @@
-"""Handles Firestore database operations for the backend."""
+"""Handles Firestore database operations for the backend.
 
+The Firebase app and the Firestore and Storage clients are created on first
+use rather than at import, once per process, so importing the backend (e.g.
+in tests or tooling) never loads credentials or opens connections. The app's
+lifespan calls initialize() so requests do not pay for it.
+"""
+
+import hashlib
+import logging
 import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
+from google.api_core.exceptions import AlreadyExists
 from urllib.parse import quote
+from metrics_utils import track_rpc, track_pages
+from lazy_utils import LazyProxy
+from cache_utils import SingleFlight
+
+SERVICE_ACCOUNT_KEY_PATH = "config/serviceAccountKey.json"
+STORAGE_BUCKET = "scopeface-10e9a.firebasestorage.app"
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "config/serviceAccountKey.json"
+logger = logging.getLogger(__name__)
 
-cred = credentials.Certificate("config/serviceAccountKey.json")
-firebase_admin.initialize_app(cred, {
-    'storageBucket': 'scopeface-10e9a.firebasestorage.app'
-})
+_app = None
+_app_lock = threading.Lock()
 
-db = firestore.client()
-bucket = storage.bucket()
 
+def get_app():
+    """
+    Initializes the default Firebase app on first use.
 
-## TODO: Add the check to see if the object is done processing and only pull if 
-## field will be called processed. 
-def sync_new_files():
+    Output:
+        firebase_admin.App: The default app
     """
-    Syncs new .wav files from Firebase Storage to Firestore.
+    global _app  # pylint: disable=global-statement
+    with _app_lock:
+        if _app is None:
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_KEY_PATH
+            cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_PATH)
+            _app = firebase_admin.initialize_app(cred, {'storageBucket': STORAGE_BUCKET})
+        return _app
+
+
+db = LazyProxy(lambda: firestore.client(get_app()))
+bucket = LazyProxy(lambda: storage.bucket(app=get_app()))
+
+
+def initialize():
     """
+    Creates the Firebase app and the Firestore and Storage clients now
+    instead of on first use.
+
+    Output:
+        float: Seconds it took, 0 if they already existed
+    """
+    start = time.perf_counter()
+    db.resolve()
+    bucket.resolve()
+    seconds = time.perf_counter() - start
+    logger.info("Firebase clients ready", extra={"seconds": round(seconds, 3)})
+    return seconds
+
+# Sentinel that makes Firestore stamp a field with the commit time
+SERVER_TIMESTAMP = firestore.SERVER_TIMESTAMP
+
+# Number of storage objects requested per listing page. Only one page is
+# held in memory at a time while syncing.
+LIST_PAGE_SIZE = 1000
+
+# Only the metadata sync needs is requested from the storage listing API.
+LIST_FIELDS = "items(name,updated,generation),nextPageToken"
+
+# Firestore allows at most 500 writes per batch.
+WRITE_BATCH_SIZE = 500
 
-    # get all files from the recordings folder in Firebase storage
-    blobs = list(bucket.list_blobs())
-    all_storage_files = [blob.name for blob in blobs if blob.name.endswith(".wav")]
+# Number of batches committed concurrently when adding recordings.
+WRITE_WORKERS = int(os.environ.get("SYNC_WRITE_WORKERS", "4"))
 
-    print(f"Found {len(all_storage_files)} .wav files in Storage.")
+# New recordings found while listing are written once this many are waiting,
+# enough to give every write worker a full batch. A sync therefore holds at
+# most this many names, however many objects are new.
+SYNC_FLUSH_FILES = WRITE_BATCH_SIZE * WRITE_WORKERS
+
+# Attempts per batch before its recordings are counted as failed.
+WRITE_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.5
+
+# Firestore documents that persist the incremental sync watermarks. The
+# whole-bucket watermark uses SYNC_STATE_DOCUMENT, device scoped syncs keep
+# their own watermark each.
+SYNC_STATE_COLLECTION = "sync_state"
+SYNC_STATE_DOCUMENT = "recordings"
+
+# Listing storage is not a snapshot: an upload finalized while a listing runs
+# is missed if its name sorts before the page being read. The watermark never
+# advances past the time the listing started, less this margin for clock
+# skew, so such uploads are listed again by the next sync.
+SYNC_WATERMARK_MARGIN_SECONDS = float(os.environ.get("SYNC_WATERMARK_MARGIN_SECONDS", "60"))
+
+# A sync holds a lease document in the sync state collection so only one
+# worker process (on any host) runs the same sync at a time. A lease left by
+# a crashed worker expires after this long; it should exceed the longest sync.
+SYNC_LEASE_SECONDS = float(os.environ.get("SYNC_LEASE_SECONDS", "300"))
+
+# A worker claims a pending recording before processing it, so workers
+# processing the same pending recordings do not each download and analyze
+# them. A claim left by a crashed worker expires after this long.
+PROCESS_CLAIM_SECONDS = float(os.environ.get("PROCESS_CLAIM_SECONDS", "600"))
+
+# Every claim counts as a processing attempt. A recording is claimed again
+# only after PROCESS_RETRY_SECONDS, doubled for each earlier attempt, and the
+# ingest pass stops picking it up after PROCESS_MAX_ATTEMPTS (e.g. when its
+# object was deleted), so failing recordings cannot crowd out new ones.
+PROCESS_RETRY_SECONDS = float(os.environ.get("PROCESS_RETRY_SECONDS", "60"))
+PROCESS_MAX_ATTEMPTS = int(os.environ.get("PROCESS_MAX_ATTEMPTS", "5"))
+
+# Identifies this process as a lease holder
+LEASE_HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Concurrent syncs in this process share one run per device (None for the
+# whole bucket)
+_sync_flights = SingleFlight()
+
+# Device ID used when an object name does not contain one.
+DEFAULT_DEVICE_ID = "Stethy’s Device"
+
+# Prefixes the processing stage stores derived copies under in the same
+# bucket: denoise.CLEANED_PREFIX, audio_codec.COMPRESSED_PREFIX and
+# waveform.WAVEFORM_PREFIX. Objects under them are never recordings.
+DERIVED_PREFIXES = ("cleaned/", "compressed/", "waveforms/")
+
+
+def device_id_for_path(file_path: str):
+    """
+    Extracts the device ID from a storage object name. Both layouts the
+    firmware can upload with are understood:
+        {device_id}/{anything}.wav  (per-device prefix)
+        /{device_id}_{rand}.wav     (flat, from generate_filename)
+
+    Input:
+        file_path (str): Name of the .wav object in Firebase Storage.
+
+    Output:
+        str: The device ID, or DEFAULT_DEVICE_ID if the name has none.
+    """
+    path = file_path.lstrip("/")
+    if "/" in path:
+        return path.split("/", 1)[0]
+
+    stem = path.removesuffix(".wav")
+    if "_" in stem:
+        return stem.rsplit("_", 1)[0]
+    return DEFAULT_DEVICE_ID
+
+
+def is_recording_object(name: str) -> bool:
+    """
+    Checks whether a storage object is an uploaded recording, rather than
+    another file or a copy derived from a recording.
+
+    Input:
+        name (str): Storage object name.
+
+    Output:
+        bool: True for .wav objects outside DERIVED_PREFIXES.
+    """
+    return name.endswith(".wav") and not name.lstrip("/").startswith(DERIVED_PREFIXES)
+
+
+def _device_prefixes(device_id: str):
+    """
+    Gets the object name prefixes a device's recordings can be stored under.
+
+    Input:
+        device_id (str): The device ID.
+
+    Output:
+        list: Storage prefixes for both upload layouts.
+    """
+    return [f"{device_id}/", f"/{device_id}_", f"{device_id}_"]
+
+
+def _iter_wav_blobs(device_id: str = None):
+    """
+    Lazily yields recording blobs, one listing page at a time. When a device
+    is given only that device's prefixes are listed.
+
+    Input:
+        device_id (str): Device to list recordings for, None for the whole bucket.
+
+    Output:
+        Generator of storage blobs passing is_recording_object
+    """
+    prefixes = _device_prefixes(device_id) if device_id else [None]
+    for prefix in prefixes:
+        pages = bucket.list_blobs(prefix=prefix, page_size=LIST_PAGE_SIZE,
+                                  fields=LIST_FIELDS).pages
+        for page in track_pages(pages, "storage", "list"):
+            for blob in page:
+                if not is_recording_object(blob.name):
+                    continue
+                if device_id and device_id_for_path(blob.name) != device_id:
+                    continue
+                yield blob
+
+
+def _build_recording_doc(file_path: str):
+    """
+    Builds the Firestore document for a newly discovered recording.
 
-    # get recordings in DB
+    Input:
+        file_path (str): Name of the .wav object in Firebase Storage.
+
+    Output:
+        dict: The recording document data.
+    """
+    encoded_path = quote(file_path, safe='')
+    url = f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{encoded_path}?alt=media"
+
+    return {
+        'deviceID': device_id_for_path(file_path),
+        'notes': "",
+        'sessionDateTime': SERVER_TIMESTAMP,
+        'updatedAt': SERVER_TIMESTAMP,
+        'sessionTitle': "",
+        'viewed': False,
+        'file_path': file_path,
+        'processed': False,
+        'processingAttempts': 0,
+        "wavFileURL": url
+    }
+
+
+def recording_id_for_path(file_path: str):
+    """
+    Derives the recording document id from a storage path. The same object
+    always maps to the same document, which makes ingest idempotent.
+
+    Input:
+        file_path (str): Name of the .wav object in Firebase Storage.
+
+    Output:
+        str: The recording document id.
+    """
+    return hashlib.sha256(file_path.encode()).hexdigest()
+
+
+def _missing_recordings(file_paths: list):
+    """
+    Reads the recording documents of the given objects in one call.
+
+    Input:
+        file_paths (list): Names of the .wav objects.
+
+    Output:
+        list: The names that have no recording document yet.
+    """
     recordings_ref = db.collection("recordings")
-    existing_docs = recordings_ref.stream()
-    existing_recordings = set(doc.to_dict().get("file_path") for doc in existing_docs)
+    references = [recordings_ref.document(recording_id_for_path(file_path))
+                  for file_path in file_paths]
+    with track_rpc("firestore", "get_all", "recordings") as rpc:
+        found = set(snapshot.id for snapshot in db.get_all(references, field_paths=["file_path"])
+                    if snapshot.exists)
+        rpc.documents_read = len(references)
+    return [file_path for file_path in file_paths
+            if recording_id_for_path(file_path) not in found]
+
+
+def _commit_recording_batch(file_paths: list):
+    """
+    Creates one batch of recording documents, retrying with exponential backoff.
+
+    Documents are created only if absent. A batch is rejected as a whole when
+    any of its documents already exists (e.g. another worker synced it first),
+    in which case the batch's documents are read in one call and the batch is
+    retried with only the missing ones.
+
+    Input:
+        file_paths (list): Names of the .wav objects in the batch.
+
+    Output:
+        (int, int, int): Number of documents created, already existing and failed.
+    """
+    recordings_ref = db.collection("recordings")
+    existing = 0
+    conflicted = False
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            if conflicted:
+                missing = _missing_recordings(file_paths)
+                existing += len(file_paths) - len(missing)
+                file_paths, conflicted = missing, False
+            if not file_paths:
+                return 0, existing, 0
+
+            batch = db.batch()
+            for file_path in file_paths:
+                batch.create(recordings_ref.document(recording_id_for_path(file_path)),
+                             _build_recording_doc(file_path))
+            with track_rpc("firestore", "batch_commit", "recordings") as rpc:
+                batch.commit()
+                rpc.documents_written = len(file_paths)
+            return len(file_paths), existing, 0
+        except AlreadyExists:
+            conflicted = True
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Recording batch failed",
+                           extra={"batch_size": len(file_paths), "attempt": attempt + 1,
+                                  "error": str(exc)})
+            if attempt + 1 < WRITE_ATTEMPTS:
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+    return 0, existing, len(file_paths)
+
+
+def add_recording(file_path: str):
+    """
+    Creates the Firestore document for a single recording uploaded through
+    the backend, unless it already exists.
+
+    Input:
+        file_path (str): Name of the .wav object in Firebase Storage.
+
+    Output:
+        (str, bool): The recording id and whether the document was created.
+    """
+    recording_id = recording_id_for_path(file_path)
+    try:
+        with track_rpc("firestore", "create", "recordings") as rpc:
+            db.collection("recordings").document(recording_id).create(
+                _build_recording_doc(file_path))
+            rpc.documents_written = 1
+    except AlreadyExists:
+        return recording_id, False
+    return recording_id, True
+
+
+def add_recordings(file_paths: list):
+    """
+    Creates Firestore recording documents for the given storage objects using
+    batched writes committed in parallel. Objects that already have a
+    recording document are skipped.
+
+    Input:
+        file_paths (list): Names of the .wav objects in Firebase Storage.
+
+    Output:
+        dict: Number of documents added, already existing and failed, elapsed
+        seconds and throughput in documents per second.
+    """
+    start = time.perf_counter()
+    chunks = [file_paths[i:i + WRITE_BATCH_SIZE]
+              for i in range(0, len(file_paths), WRITE_BATCH_SIZE)]
+
+    added = existing = failed = 0
+    if chunks:
+        with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+            for created, skipped, errors in pool.map(_commit_recording_batch, chunks):
+                added += created
+                existing += skipped
+                failed += errors
+
+    seconds = time.perf_counter() - start
+    docs_per_second = added / seconds if seconds > 0 else 0.0
+    logger.info("Recordings added to Firestore",
+                extra={"added": added, "existing": existing, "failed": failed,
+                       "seconds": round(seconds, 3),
+                       "docs_per_second": round(docs_per_second, 1)})
+
+    return {
+        "added": added,
+        "existing": existing,
+        "failed": failed,
+        "seconds": seconds,
+        "docs_per_second": docs_per_second,
+    }
+
+
+class _RecordingWriter:
+    """
+    Collects the new recordings found while listing storage and writes them
+    with add_recordings every SYNC_FLUSH_FILES, totalling the statistics.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.flushes = 0
+        self.totals = {"added": 0, "existing": 0, "failed": 0, "seconds": 0.0}
+
+    def add(self, file_path: str):
+        """
+        Queues a recording, writing the queue once it is full.
+        """
+        self.pending.append(file_path)
+        if len(self.pending) >= SYNC_FLUSH_FILES:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the queued recordings.
+        """
+        stats = add_recordings(self.pending)
+        self.pending = []
+        self.flushes += 1
+        for key in self.totals:
+            self.totals[key] += stats.get(key, 0)
+
+    def finish(self):
+        """
+        Writes what is left in the queue.
+
+        Output:
+            dict: Totals in the format returned by add_recordings.
+        """
+        if self.pending or not self.flushes:
+            self.flush()
+        seconds = self.totals["seconds"]
+        return {**self.totals,
+                "docs_per_second": self.totals["added"] / seconds if seconds > 0 else 0.0}
+
 
-    # add files not in db to list
-    new_files = [f for f in all_storage_files if f not in existing_recordings]
-    print(f"{len(new_files)} new files to add to Firestore.")
+def _sync_state_document(device_id: str = None):
+    """
+    Gets the name of the document holding a sync watermark.
+
+    Input:
+        device_id (str): Device the sync is scoped to, None for the whole bucket.
+
+    Output:
+        str: Document id in the sync state collection.
+    """
+    return f"device_{device_id}" if device_id else SYNC_STATE_DOCUMENT
+
+
+def get_sync_watermark(device_id: str = None):
+    """
+    Gets the update time every storage object before which is already
+    synced, and the names of the synced objects updated at or after it.
+
+    Input:
+        device_id (str): Device the sync is scoped to, None for the whole bucket.
+
+    Output:
+        (datetime, set): The persisted watermark and the names synced since it.
+        (None, set): If no sync has completed yet.
+    """
+    with track_rpc("firestore", "get", SYNC_STATE_COLLECTION) as rpc:
+        state = db.collection(SYNC_STATE_COLLECTION).document(
+            _sync_state_document(device_id)).get()
+        rpc.documents_read = 1
+    if state.exists:
+        data = state.to_dict()
+        return data.get("lastUpdated"), set(data.get("namesAtWatermark", []))
+    return None, set()
+
+
+def set_sync_watermark(last_updated, names, device_id: str = None):
+    """
+    Persists the sync watermark.
+
+    Input:
+        last_updated (datetime): Every object updated before this is synced.
+        names (set): Names of the synced objects updated at or after last_updated.
+        device_id (str): Device the sync is scoped to, None for the whole bucket.
+    """
+    state_ref = db.collection(SYNC_STATE_COLLECTION).document(_sync_state_document(device_id))
+    with track_rpc("firestore", "set", SYNC_STATE_COLLECTION) as rpc:
+        state_ref.set({"lastUpdated": last_updated, "namesAtWatermark": sorted(names)},
+                      merge=True)
+        rpc.documents_written = 1
+
+
+def _lease_reference(device_id: str = None):
+    """
+    Gets the lease document of a sync.
+
+    Input:
+        device_id (str): Device the sync is scoped to, None for the whole bucket.
+
+    Output:
+        DocumentReference of the lease.
+    """
+    return db.collection(SYNC_STATE_COLLECTION).document(
+        f"lease_{_sync_state_document(device_id)}")
+
+
+def _take_lease(transaction, lease_ref, now: datetime) -> bool:
+    """
+    Takes a lease inside a transaction unless another holder's lease is
+    still unexpired.
+
+    Output:
+        bool: True if this process now holds the lease.
+    """
+    snapshot = lease_ref.get(transaction=transaction)
+    if snapshot.exists:
+        lease = snapshot.to_dict()
+        if lease.get("holder") != LEASE_HOLDER and lease.get("expiresAt") and \
+                lease["expiresAt"] > now:
+            return False
+    transaction.set(lease_ref, {"holder": LEASE_HOLDER,
+                                "expiresAt": now + timedelta(seconds=SYNC_LEASE_SECONDS),
+                                "updatedAt": SERVER_TIMESTAMP})
+    return True
 
-    #add to firestore
-    for file in new_files:
 
+def _give_up_lease(transaction, lease_ref) -> bool:
+    """
+    Deletes a lease inside a transaction if this process still holds it.
+
+    Output:
+        bool: True if the lease was released.
+    """
+    snapshot = lease_ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.to_dict().get("holder") != LEASE_HOLDER:
+        return False
+    transaction.delete(lease_ref)
+    return True
+
+
+def acquire_sync_lease(device_id: str = None) -> bool:
+    """
+    Tries to take the lease for a sync, so no other worker runs it at the
+    same time.
+
+    Input:
+        device_id (str): Device the sync is scoped to, None for the whole bucket.
+
+    Output:
+        bool: True if the lease was taken, False if another worker holds it.
+    """
+    with track_rpc("firestore", "transaction", SYNC_STATE_COLLECTION) as rpc:
+        taken = firestore.transactional(_take_lease)(
+            db.transaction(), _lease_reference(device_id), datetime.now(timezone.utc))
+        rpc.documents_read = 1
+        rpc.documents_written = 1 if taken else 0
+    return taken
+
+
+def release_sync_lease(device_id: str = None):
+    """
+    Releases a sync lease taken by acquire_sync_lease.
+
+    Input:
+        device_id (str): Device the sync is scoped to, None for the whole bucket.
+    """
+    with track_rpc("firestore", "transaction", SYNC_STATE_COLLECTION) as rpc:
+        released = firestore.transactional(_give_up_lease)(
+            db.transaction(), _lease_reference(device_id))
+        rpc.documents_read = 1
+        rpc.documents_written = 1 if released else 0
+
+
+def _take_claim(transaction, recording_ref, now: datetime) -> bool:
+    """
+    Claims a pending recording inside a transaction unless it has been
+    processed, another holder's claim is still unexpired or its last attempt
+    is too recent to retry yet. The claim counts as an attempt.
+
+    Output:
+        bool: True if this process now holds the claim.
+    """
+    snapshot = recording_ref.get(
+        ["processed", "claimedBy", "claimExpiresAt", "processingAttempts", "lastAttemptAt"],
+        transaction=transaction)
+    if not snapshot.exists:
+        return False
+    recording = snapshot.to_dict()
+    if recording.get("processed") is True:
+        return False
+    if recording.get("claimedBy") not in (None, LEASE_HOLDER) and \
+            recording.get("claimExpiresAt") and recording["claimExpiresAt"] > now:
+        return False
+
+    attempts = recording.get("processingAttempts") or 0
+    if attempts and recording.get("lastAttemptAt") and recording["lastAttemptAt"] + timedelta(
+            seconds=PROCESS_RETRY_SECONDS * 2 ** (attempts - 1)) > now:
+        return False
+
+    transaction.update(recording_ref, {
+        "claimedBy": LEASE_HOLDER,
+        "claimExpiresAt": now + timedelta(seconds=PROCESS_CLAIM_SECONDS),
+        "processingAttempts": attempts + 1,
+        "lastAttemptAt": now})
+    return True
+
+
+def claim_recording(recording_id: str) -> bool:
+    """
+    Tries to claim a pending recording for processing, so no other worker
+    processes it at the same time.
+
+    Input:
+        recording_id (str): The recording document id.
+
+    Output:
+        bool: True if the claim was taken, False if the recording was already
+        processed, another worker holds it or it is not due for a retry.
+    """
+    with track_rpc("firestore", "transaction", "recordings") as rpc:
+        claimed = firestore.transactional(_take_claim)(
+            db.transaction(), db.collection("recordings").document(recording_id),
+            datetime.now(timezone.utc))
+        rpc.documents_read = 1
+        rpc.documents_written = 1 if claimed else 0
+    return claimed
+
+
+def sync_new_files(device_id: str = None):
+    """
+    Incrementally syncs new .wav files from Firebase Storage to Firestore.
+
+    Concurrent calls in this process for the same device (or for the whole
+    bucket) share a single run and its result. Across worker processes and
+    hosts a lease document ensures only one of them runs the sync at a time;
+    the others skip it, since the running sync covers the same objects.
+
+    Input:
+        device_id (str): Device to sync, None for the whole bucket.
+
+    Output:
+        dict: Write statistics from add_recordings, with skipped set to True
+        if another worker was already running the sync.
+    """
+    return _sync_flights.do(device_id, _sync_with_lease, device_id)
+
+
+def _sync_with_lease(device_id: str = None):
+    """
+    Runs a sync while holding its lease, or skips it if another worker
+    holds the lease.
+
+    Input:
+        device_id (str): Device to sync, None for the whole bucket.
+
+    Output:
+        dict: Write statistics, with skipped set.
+    """
+    if not acquire_sync_lease(device_id):
+        logger.info("Sync skipped, another worker holds the lease",
+                    extra={"device_id": device_id})
+        return {"added": 0, "existing": 0, "failed": 0, "seconds": 0.0,
+                "docs_per_second": 0.0, "skipped": True}
+    try:
+        return {**_sync_new_files(device_id), "skipped": False}
+    finally:
+        release_sync_lease(device_id)
+
+
+def _sync_new_files(device_id: str = None):
+    """
+    Lists storage and adds recordings for new .wav files.
+
+    When a device ID is given only that device's storage prefixes are listed
+    and the device keeps its own watermark, so the cost scales with that
+    device's recordings rather than the whole fleet's.
+
+    Only objects updated at or after the persisted watermark are written.
+    Recording document ids are derived from the object name and created only
+    if absent, so the recordings collection is never scanned and concurrent
+    syncs cannot insert duplicates. Objects updated at or after the watermark
+    are retried unless they are among the names stored with it, which keeps
+    uploads that finalize in the same instant, or while the previous listing
+    ran (see SYNC_WATERMARK_MARGIN_SECONDS), from being skipped without
+    rewriting the ones already synced.
+
+    New recordings are written every SYNC_FLUSH_FILES while listing rather
+    than collected first, so a first or catch-up sync over a large bucket
+    holds a bounded number of names. The watermark only advances when every
+    new document was written, so failed writes are picked up again by the
+    next sync.
+
+    A device without a watermark of its own starts from the whole-bucket
+    watermark, since every object before it already has a document. With no
+    watermark at all the sync is seeded by reconcile_all_files, which compares
+    by path and so recognizes recordings created before document ids were
+    derived from the path.
+
+    Input:
+        device_id (str): Device to sync, None for the whole bucket.
+
+    Output:
+        dict: Write statistics from add_recordings.
+    """
+    watermark, synced = get_sync_watermark(device_id)
+    if watermark is None and device_id:
+        watermark, synced = get_sync_watermark()
+    if watermark is None:
+        return reconcile_all_files(device_id)
+
+    limit = _watermark_limit()
+    newest, names_at_newest = watermark, set()
+    writer = _RecordingWriter()
+
+    for blob in _iter_wav_blobs(device_id):
+        if blob.updated < watermark:
+            continue
+
+        if blob.name not in synced:
+            writer.add(blob.name)
+        newest, names_at_newest = _track_newest(newest, names_at_newest, blob, limit)
+
+    stats = writer.finish()
+
+    if stats["failed"] == 0 and (newest != watermark or names_at_newest != synced):
+        set_sync_watermark(newest, names_at_newest, device_id)
+
+    return stats
+
+
+def _watermark_limit():
+    """
+    Gets the latest time a sync starting now may move its watermark to.
+
+    Output:
+        datetime: The current time less SYNC_WATERMARK_MARGIN_SECONDS.
+    """
+    return datetime.now(timezone.utc) - timedelta(seconds=SYNC_WATERMARK_MARGIN_SECONDS)
+
+
+def _track_newest(newest, names: set, blob, limit):
+    """
+    Folds a listed object into the next watermark. Update times are capped
+    at the limit, so objects updated after it are all remembered by name
+    instead of moving the watermark past uploads the listing may have missed.
+
+    Input:
+        newest (datetime): Next watermark so far, None if none yet.
+        names (set): Names of the listed objects updated at or after newest.
+        blob: The listed storage object.
+        limit (datetime): Latest time the watermark may move to.
+
+    Output:
+        (datetime, set): The next watermark and the names updated at or after it.
+    """
+    updated = min(blob.updated, limit if newest is None else max(limit, newest))
+    if newest is None or updated > newest:
+        return updated, {blob.name}
+    if updated == newest:
+        names.add(blob.name)
+    return newest, names
+
+
+def reconcile_all_files(device_id: str = None):
+    """
+    Fully reconciles Firebase Storage with the recordings collection.
+
+    Every .wav object is compared against every recording document, so this
+    is expensive and meant to be run rarely (e.g. after restoring a backup or
+    editing the bucket by hand). The incremental sync also runs it once to
+    seed its first watermark. Comparing file paths also recognizes
+    recordings created before document ids were derived from the path. The
+    sync watermark is reset to the newest object seen, capped as in
+    _sync_new_files.
+
+    Input:
+        device_id (str): Only reconcile this device's objects and watermark,
+        None for the whole bucket.
+
+    Output:
+        dict: Write statistics from add_recordings.
+    """
+    with track_rpc("firestore", "query", "recordings") as rpc:
+        existing_docs = list(db.collection("recordings").select(["file_path"]).stream())
+        rpc.documents_read = len(existing_docs)
+    existing_recordings = set(doc.to_dict().get("file_path") for doc in existing_docs)
 
-        blob = bucket.blob(file)
+    limit = _watermark_limit()
+    newest, names_at_newest = None, set()
+    writer = _RecordingWriter()
 
+    for blob in _iter_wav_blobs(device_id):
+        if blob.name not in existing_recordings:
+            writer.add(blob.name)
+        newest, names_at_newest = _track_newest(newest, names_at_newest, blob, limit)
 
-        encoded_path = quote(blob.name, safe='')
-        bucket_name = bucket.name
-        url = f"https://firebasestorage.googleapis.com/v0/b/{bucket_name}/o/{encoded_path}?alt=media"
+    stats = writer.finish()
 
-        doc_data = {
-            'deviceID': "Stethy’s Device",
-            'notes': "",
-            'sessionDateTime': firestore.SERVER_TIMESTAMP,
-            'sessionTitle': "",
-            'viewed': False,
-            'file_path': file,
-            "wavFileURL": url
-        }
+    if stats["failed"] == 0 and newest is not None:
+        set_sync_watermark(newest, names_at_newest, device_id)
 
-        db.collection("recordings").add(doc_data)
-        print(f"Added Firestore doc for: {file}")
+    return stats
@@ -0,0 +1,109 @@
+"""
+heart_rate.py
+
+Estimates heart rate from a recording. Each chunk of samples is reduced to an
+amplitude envelope at ENVELOPE_RATE frames per second, so the estimate only
+keeps a few KB per recording no matter how long it is. Heart sounds repeat
+once per beat, so the envelope's autocorrelation peaks at the beat period.
+The height of that peak relative to zero lag is the confidence.
+"""
+
+import numpy as np
+
+# Envelope frames per second
+ENVELOPE_RATE = 100
+
+# Heart rates considered, in beats per minute
+MIN_BPM = 40
+MAX_BPM = 200
+
+# Recordings must cover this many of the slowest beats to be estimated
+MIN_BEATS = 2
+
+# Multiples of the beat period correlate almost as well as the period itself,
+# so the shortest lag peaking within this fraction of the best peak wins
+PEAK_TOLERANCE = 0.9
+
+
+class HeartRateEstimator:
+    """
+    Accumulates an amplitude envelope over chunks of 16-bit samples and
+    estimates heart rate from it.
+    """
+
+    def __init__(self, sample_rate: int):
+        """
+        Input:
+            sample_rate (int): Samples per second
+        """
+        self.sample_rate = sample_rate
+        self.frame_samples = max(1, sample_rate // ENVELOPE_RATE)
+        self.envelope_rate = sample_rate / self.frame_samples
+        self._frames = []
+        self._partial = np.empty(0, dtype=np.float32)
+
+    def add(self, samples: np.ndarray):
+        """
+        Adds a chunk of int16 samples.
+
+        Input:
+            samples (np.ndarray): int16 samples in recording order
+        """
+        values = np.concatenate((self._partial, np.abs(samples.astype(np.float32))))
+        whole = values.size - values.size % self.frame_samples
+        if whole:
+            self._frames.append(values[:whole].reshape(-1, self.frame_samples).mean(axis=1))
+        self._partial = values[whole:]
+
+    def summary(self):
+        """
+        Output:
+            dict: Recording document fields. heartRateBpm is None when the
+            recording is too short or has no periodic envelope.
+        """
+        envelope = np.concatenate(self._frames) if self._frames else np.empty(0)
+        bpm, confidence = estimate_bpm(envelope, self.envelope_rate)
+        return {"heartRateBpm": bpm, "heartRateConfidence": confidence}
+
+
+def estimate_bpm(envelope: np.ndarray, envelope_rate: float):
+    """
+    Estimates heart rate from the autocorrelation of an amplitude envelope.
+
+    Input:
+        envelope (np.ndarray): Amplitude envelope
+        envelope_rate (float): Envelope frames per second
+
+    Output:
+        (float, float): Beats per minute (None if it cannot be estimated) and
+        a confidence between 0 and 1
+    """
+    min_lag = int(envelope_rate * 60 / MAX_BPM)
+    max_lag = int(np.ceil(envelope_rate * 60 / MIN_BPM))
+    if envelope.size < MIN_BEATS * max_lag:
+        return None, 0.0
+
+    centered = envelope.astype(np.float64) - envelope.mean()
+    size = 1 << int(np.ceil(np.log2(2 * centered.size)))
+    spectrum = np.fft.rfft(centered, size)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum), size)[:max_lag + 2]
+    if acf[0] <= 0:
+        return None, 0.0
+
+    # Unbiased estimate so longer lags are not penalized for overlapping less
+    acf /= centered.size - np.arange(acf.size)
+    acf /= acf[0]
+
+    lags = np.arange(min_lag, max_lag + 1)
+    peaks = lags[(acf[lags] >= acf[lags - 1]) & (acf[lags] >= acf[lags + 1]) & (acf[lags] > 0)]
+    if peaks.size == 0:
+        return None, 0.0
+    best = acf[peaks].max()
+    lag = int(peaks[np.argmax(acf[peaks] >= PEAK_TOLERANCE * best)])
+    confidence = float(min(acf[lag], 1.0))
+
+    # Parabolic interpolation between neighbouring lags
+    before, peak, after = acf[lag - 1], acf[lag], acf[lag + 1]
+    curvature = before - 2 * peak + after
+    offset = 0.5 * (before - after) / curvature if curvature < 0 else 0.0
+    return float(60 * envelope_rate / (lag + offset)), confidence
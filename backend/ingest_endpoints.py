@@ -0,0 +1,168 @@
+"""
+ingest_endpoints.py
+
+Defines the fast API routes recordings are ingested through: direct uploads
+from devices, and object-finalize notifications for recordings written to
+Firebase Storage.
+"""
+
+import uuid
+from fastapi import APIRouter, Request, Response, HTTPException, Query, BackgroundTasks
+from fastapi.responses import JSONResponse
+from auth_utils import verify_token
+from user_routes import get_user_device_ids
+from async_utils import run_blocking
+from audio_analysis import WavFormatError
+import upload_ingest
+import storage_notifications
+from recording_processing import process_claimed_recording
+
+router = APIRouter()
+
+
+def _resume_response(upload_id: str, received: int) -> Response:
+    """
+    Builds the 308 response telling the client how much of an upload has
+    been received so it can send the rest.
+    """
+    headers = {"X-Upload-ID": upload_id}
+    if received:
+        headers["Range"] = f"bytes=0-{received - 1}"
+    return Response(status_code=308, headers=headers)
+
+
+@router.post("/ingest")
+async def ingest_recording(request: Request, background_tasks: BackgroundTasks,
+                           device_id: str = Query(alias="deviceID", min_length=1)):
+    """
+    Accepts a WAV recording from a device. The body is spooled to disk as it
+    arrives. Once the whole recording is received it is stored in Firebase
+    Storage and its recording document created, and it is processed in the
+    background.
+
+    A recording can be sent as a single (optionally chunked) body, or in
+    pieces each carrying X-Upload-ID and Content-Range: bytes start-end/total.
+    Incomplete uploads are answered with 308 and a Range header of the bytes
+    received. Send Content-Range: bytes */total with no body to ask where to
+    resume after a dropped connection.
+
+    Input:
+    - Firebase User ID
+    - deviceID: the uploading device, which must be one of the user's
+    - X-Upload-ID header (required for piecewise uploads)
+    - Content-Range header (optional)
+
+    Output:
+    - 201 with the recording id once stored, 200 if it was already ingested,
+      308 while pieces are missing
+    - 403 if the device is not one of the user's
+    """
+    user_id = await run_blocking(verify_token, request)
+
+    if "/" in device_id:
+        raise HTTPException(status_code=400, detail="Invalid deviceID")
+    if device_id not in await run_blocking(get_user_device_ids, user_id):
+        raise HTTPException(status_code=403, detail="Device is not registered to this user")
+
+    try:
+        content_range = upload_ingest.parse_content_range(request.headers.get("content-range"))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    upload_id = request.headers.get("x-upload-id")
+    if upload_id is None and content_range is not None:
+        raise HTTPException(status_code=400, detail="X-Upload-ID is required with Content-Range")
+    upload_id = upload_id or uuid.uuid4().hex
+    if not upload_ingest.UPLOAD_ID_PATTERN.match(upload_id):
+        raise HTTPException(status_code=400, detail="Invalid X-Upload-ID")
+
+    start, end, total = content_range or (0, None, None)
+    if total is not None and total > upload_ingest.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Recording is too large")
+
+    path = upload_ingest.spool_path(user_id, upload_id)
+    received = await run_blocking(upload_ingest.spooled_bytes, path)
+    if start is None or (start != 0 and start != received):
+        return _resume_response(upload_id, received)
+
+    spool = await run_blocking(upload_ingest.open_spool, path, start == 0)
+    received = start
+    too_large = False
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > upload_ingest.MAX_UPLOAD_BYTES or \
+                    (end is not None and received > end + 1):
+                too_large = True
+                break
+            await run_blocking(spool.write, chunk)
+    finally:
+        # Whatever arrived before a dropped connection stays spooled for resuming
+        await run_blocking(spool.close)
+
+    if too_large:
+        await run_blocking(upload_ingest.remove_spool, path)
+        raise HTTPException(status_code=413, detail="Body is larger than declared")
+
+    if total is not None and received < total:
+        return _resume_response(upload_id, received)
+
+    file_path = upload_ingest.recording_path(device_id, upload_id)
+    try:
+        recording_id, created = await run_blocking(upload_ingest.finalize_upload, path, file_path)
+    except WavFormatError as exc:
+        await run_blocking(upload_ingest.remove_spool, path)
+        raise HTTPException(status_code=400, detail=f"Invalid recording: {exc}") from exc
+
+    if created:
+        background_tasks.add_task(run_blocking, upload_ingest.process_upload,
+                                  recording_id, file_path, path)
+    else:
+        await run_blocking(upload_ingest.remove_spool, path)
+
+    return JSONResponse(status_code=201 if created else 200,
+                        content={"recordingID": recording_id, "file_path": file_path},
+                        headers={"X-Upload-ID": upload_id})
+
+
+@router.post("/notifications/storage")
+async def storage_notification(request: Request, background_tasks: BackgroundTasks):
+    """
+    Ingests one recording from a Cloud Storage object-finalize notification,
+    delivered by Pub/Sub push or Eventarc. The recording document is created
+    at once and the recording claimed and processed in the background, so
+    the ingest worker does not process it too; no bucket listing is needed.
+    Other events and objects that are not recordings are acknowledged and
+    ignored.
+
+    Input:
+    - Pub/Sub push message or CloudEvent for the finalized object
+    - Authorization: Bearer OIDC token, if NOTIFICATION_AUDIENCE is set
+
+    Output:
+    - 201 with the recording id once created, 200 if it already existed,
+      204 if the notification was ignored
+    """
+    authorized = await run_blocking(storage_notifications.verify_push_token,
+                                    request.headers.get("authorization"))
+    if not authorized:
+        raise HTTPException(status_code=401, detail="Invalid notification token")
+
+    try:
+        body = await request.json()
+        target = storage_notifications.parse_notification(request.headers, body)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid notification: {exc}") from exc
+    if target is None:
+        return Response(status_code=204)
+
+    result = await run_blocking(storage_notifications.ingest_object, *target)
+    if result is None:
+        return Response(status_code=204)
+
+    recording_id, created = result
+    file_path = target[1]
+    if created:
+        background_tasks.add_task(run_blocking, process_claimed_recording, recording_id, file_path)
+    return JSONResponse(status_code=201 if created else 200,
+                        content={"recordingID": recording_id, "file_path": file_path})
@@ -0,0 +1,118 @@
+"""
+ingest_worker.py
+
+Background worker that syncs and processes new recordings from Firebase
+Storage into Firestore off the request path. Endpoints read whatever has already been
+synced and can kick the worker to sync again as soon as possible.
+"""
+
+import asyncio
+import logging
+import os
+from recording_processing import ingest_new_recordings
+
+logger = logging.getLogger(__name__)
+
+# Seconds between syncs when nobody kicks the worker
+SYNC_INTERVAL_SECONDS = float(os.environ.get("SYNC_INTERVAL_SECONDS", "60"))
+
+
+class IngestWorker:
+    """
+    Runs a sync function on an interval in a background asyncio task.
+
+    Interval syncs cover the whole bucket. Kicks can name a device, in which
+    case only that device is synced. Kicks that arrive while a sync is running
+    are coalesced into a single follow-up sync per device.
+    """
+
+    def __init__(self, sync_func, interval: float):
+        """
+        Input:
+            sync_func: Blocking function that performs one sync. It is called
+                with a device ID for device syncs and without one for full syncs
+            interval (float): Seconds to wait between syncs
+        """
+        self.sync_func = sync_func
+        self.interval = interval
+        self.last_result = None
+        self._kicked = asyncio.Event()
+        self._full_sync_requested = True
+        self._pending_devices = set()
+        self._task = None
+
+    def start(self):
+        """
+        Starts the background task on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Cancels the background task and waits for it to finish.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def kick(self, device_id: str = None):
+        """
+        Requests a sync as soon as the current one (if any) finishes.
+        Returns immediately.
+
+        Input:
+            device_id (str): Device to sync, None to sync the whole bucket
+        """
+        if device_id:
+            self._pending_devices.add(device_id)
+        else:
+            self._full_sync_requested = True
+        self._kicked.set()
+
+    async def sync_once(self, device_id: str = None):
+        """
+        Runs one sync in a worker thread so the event loop is never blocked.
+
+        Input:
+            device_id (str): Device to sync, None to sync the whole bucket
+
+        Output:
+            The sync function's result, or None if it failed.
+        """
+        args = (device_id,) if device_id else ()
+        try:
+            self.last_result = await asyncio.to_thread(self.sync_func, *args)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Recording sync failed", extra={"device_id": device_id})
+            return None
+        return self.last_result
+
+    async def _run(self):
+        """
+        Syncs, then sleeps until the interval elapses or the worker is kicked.
+        A full sync covers every device, so pending device kicks are dropped.
+        """
+        while True:
+            self._kicked.clear()
+            devices, self._pending_devices = self._pending_devices, set()
+
+            if self._full_sync_requested:
+                self._full_sync_requested = False
+                await self.sync_once()
+            else:
+                for device_id in sorted(devices):
+                    await self.sync_once(device_id)
+
+            try:
+                await asyncio.wait_for(self._kicked.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                self._full_sync_requested = True
+
+
+worker = IngestWorker(ingest_new_recordings, SYNC_INTERVAL_SECONDS)
@@ -0,0 +1,58 @@
+"""
+lazy_utils.py
+
+Stand-in for an object that is expensive to create, such as a Firestore
+client. The object is created by its factory on first attribute access, once
+per process, and every later access is forwarded to it.
+"""
+
+import threading
+
+
+class LazyProxy:
+    """
+    Creates an object on first use and forwards attribute access to it.
+    Safe to use from several threads; the factory runs only once.
+    """
+
+    def __init__(self, factory):
+        """
+        Input:
+            factory: Called with no arguments to create the object
+        """
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def resolve(self):
+        """
+        Output:
+            The object, created by the factory if this is the first use
+        """
+        target = self._target
+        if target is None:
+            with self._lock:
+                target = self._target
+                if target is None:
+                    target = self._factory()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    @property
+    def created(self) -> bool:
+        """
+        Output:
+            bool: Whether the object has been created yet
+        """
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+    def __repr__(self):
+        if self._target is None:
+            return f"<LazyProxy of {self._factory!r}, not created>"
+        return repr(self._target)
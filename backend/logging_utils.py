@@ -0,0 +1,60 @@
+"""
+logging_utils.py
+
+Structured logging for the backend. Each record is written as one JSON
+object per line, and any fields passed with extra= become top level keys so
+logs can be filtered by them (e.g. device_id or recording_id).
+"""
+
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# Attributes every LogRecord has, which are not copied as extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as single line JSON objects.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Input:
+            record (LogRecord): The record to format
+
+        Output:
+            str: JSON with time, level, logger, message, any extra fields and
+            the exception traceback if there is one
+        """
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """
+    Sends log records of the given level and above to stderr as JSON.
+    Calling it again only changes the level.
+
+    Input:
+        level (str): Minimum level name, e.g. "INFO"
+    """
+    root = logging.getLogger()
+    root.setLevel(level)
+    if not any(isinstance(handler.formatter, JsonFormatter) for handler in root.handlers):
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
@@ -3,16 +3,47 @@ main.py
 
 Minimal FastAPI backend server with a /ping route used
 to verify that the server is running and accepting requests.
-Includes CORS middleware for cross-origin frontend access.
+Includes CORS middleware for cross-origin frontend access, request timing
+middleware and a /metrics route in the Prometheus text format.
 """
 
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from user_endpoints import router as user_router
 from recording_endpoints import router as recording_router
+from ingest_endpoints import router as ingest_router
+from ingest_worker import worker as ingest_worker
+from async_utils import run_blocking, shutdown_executor
+from recording_processing import shutdown_denoise_pool
+from recording_events import hub as recording_event_hub
+from logging_utils import configure_logging
+from metrics_utils import REGISTRY, REQUEST_LATENCY
+import firestore
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Creates the Firebase clients and starts the background recording ingest
+    worker with the app. On shutdown stops the worker, drains the blocking
+    call executor and stops the denoise worker processes. Recording
+    listeners for event streams are stopped first.
+    """
+    await run_blocking(firestore.initialize)
+    ingest_worker.start()
+    yield
+    recording_event_hub.close()
+    await ingest_worker.stop()
+    shutdown_executor()
+    shutdown_denoise_pool()
 
 # Create a new FastAPI application instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add middleware to handle Cross-Origin Resource Sharing (CORS)
 # This allows the frontend (e.g., iOS Swift app) to make requests to this backend
@@ -27,3 +58,36 @@ app.add_middleware(
 app.include_router(recording_router)
 
 app.include_router(user_router)
+
+app.include_router(ingest_router)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """
+    Records how long each request took, labelled by the route template
+    (e.g. /recordings/{recording_id}/audio) so ids do not create new series.
+    Requests that match no route are grouped together.
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method,
+                                route=getattr(route, "path", "unmatched"), status=status)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Exposes request latency and Firestore and Storage call metrics for
+    Prometheus to scrape.
+
+    Output:
+    - Every metric in the Prometheus text exposition format
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,252 @@
+"""
+metrics_utils.py
+
+Minimal Prometheus style metrics: labelled counters and histograms, rendered
+in the Prometheus text exposition format for the /metrics endpoint.
+
+Request latency is recorded by middleware in main.py. Firestore and Storage
+calls are timed and counted by wrapping them in track_rpc.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value) -> str:
+    """
+    Escapes backslashes, double quotes and newlines in a label value.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    """
+    Formats labels as {name="value",...}, escaping values.
+    """
+    if not labels:
+        return ""
+    escaped = (f'{name}="{_escape_label_value(value)}"' for name, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """
+    Formats a sample value, without a trailing .0 for whole numbers.
+    """
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """
+    A monotonically increasing value per label combination.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        """
+        Input:
+            name (str): Metric name
+            documentation (str): HELP text
+            labelnames (tuple): Names of the labels every sample carries
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        Adds to the value for the given labels.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        """
+        Output:
+            list: (metric name, labels dict, value) for every label combination
+        """
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Observations counted into cumulative buckets per label combination.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Input:
+            name (str): Metric name
+            documentation (str): HELP text
+            labelnames (tuple): Names of the labels every sample carries
+            buckets (tuple): Increasing bucket upper bounds
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        Records one observation for the given labels.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        """
+        Output:
+            list: (metric name, labels dict, value) for every bucket, sum and count
+        """
+        with self._lock:
+            series = {key: (list(counts), total, count)
+                      for key, (counts, total, count) in self._series.items()}
+
+        samples = []
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", {**labels, "le": repr(bound)}, bucket_count))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    """
+    The set of metrics exposed at /metrics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Adds a metric and returns it.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Output:
+            str: Every metric in the Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}"
+                         for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to handle HTTP requests, by route.",
+    ("method", "route", "status")))
+RPC_LATENCY = REGISTRY.register(Histogram(
+    "backend_rpc_duration_seconds", "Time spent in Firestore and Storage calls.",
+    ("service", "operation")))
+RPC_ERRORS = REGISTRY.register(Counter(
+    "backend_rpc_errors_total", "Firestore and Storage calls that raised.",
+    ("service", "operation")))
+DOCUMENTS_READ = REGISTRY.register(Counter(
+    "firestore_documents_read_total", "Firestore documents read, by collection.",
+    ("collection",)))
+DOCUMENTS_WRITTEN = REGISTRY.register(Counter(
+    "firestore_documents_written_total", "Firestore documents written, by collection.",
+    ("collection",)))
+
+
+class RpcTracker:
+    """
+    Collects the document counts of one tracked call. Callers set
+    documents_read and documents_written once the call has returned.
+    """
+
+    def __init__(self):
+        self.documents_read = 0
+        self.documents_written = 0
+
+
+@contextmanager
+def track_rpc(service: str, operation: str, collection: str = None):
+    """
+    Times a Firestore or Storage call and records it, along with the
+    documents it read and wrote.
+
+    Input:
+        service (str): "firestore" or "storage"
+        operation (str): What the call does, e.g. "query" or "download"
+        collection (str): Firestore collection the documents belong to
+
+    Output:
+        RpcTracker to record document counts on
+    """
+    tracker = RpcTracker()
+    start = time.perf_counter()
+    try:
+        yield tracker
+    except Exception:
+        RPC_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        RPC_LATENCY.observe(time.perf_counter() - start, service=service, operation=operation)
+        if collection and tracker.documents_read:
+            DOCUMENTS_READ.inc(tracker.documents_read, collection=collection)
+        if collection and tracker.documents_written:
+            DOCUMENTS_WRITTEN.inc(tracker.documents_written, collection=collection)
+
+
+def track_pages(pages, service: str, operation: str):
+    """
+    Times each page fetched from a paged listing, such as the storage
+    listing API, where every page is a separate call.
+
+    Input:
+        pages: Iterator of pages that fetches each one lazily
+        service (str): "firestore" or "storage"
+        operation (str): What the call does, e.g. "list"
+
+    Output:
+        Generator of the same pages
+    """
+    pages = iter(pages)
+    while True:
+        start = time.perf_counter()
+        try:
+            page = next(pages)
+        except StopIteration:
+            # The iterator knows when the last page has been fetched, so
+            # running out makes no call
+            return
+        except Exception:
+            RPC_ERRORS.inc(service=service, operation=operation)
+            RPC_LATENCY.observe(time.perf_counter() - start, service=service, operation=operation)
+            raise
+        RPC_LATENCY.observe(time.perf_counter() - start, service=service, operation=operation)
+        yield page
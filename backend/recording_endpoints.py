@@ -4,38 +4,179 @@ recording_routes.py
 Defines all fast API routes for all recording functions necessary
 """
 
-from fastapi import APIRouter, Request, HTTPException
+import asyncio
+import hashlib
+import json
+import logging
+from fastapi import APIRouter, Request, Response, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from auth_utils import verify_token
-from user_routes import get_current_user_device
+from async_utils import run_blocking
+from user_routes import get_current_user_device, get_user_device_ids
 import recording_routes
-from firestore import sync_new_files
+import audio_proxy
+from audio_codec import compressed_path
+from waveform import decode_level
+from ingest_worker import worker as ingest_worker
+from response_models import Recording, RecordingList
+from response_utils import model_response
+import recording_events
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/recordings/compile")
-async def get_user_recordings(request: Request):
+# Largest page of recordings a client can request at once
+MAX_PAGE_SIZE = 500
+
+# Most recordings a single bulk update may touch
+MAX_BULK_UPDATE = 500
+
+# Seconds between keep-alive comments on an idle event stream, so proxies
+# do not close it
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Milliseconds clients wait before reconnecting a dropped event stream
+STREAM_RETRY_MILLISECONDS = 5000
+
+def _validate_editable_fields(fields) -> None:
+    """
+    Raises a 400 unless fields is a non-empty dict of editable recording
+    fields with values of the right type.
+    """
+    if not isinstance(fields, dict) or not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
+    for field, value in fields.items():
+        expected_type = recording_routes.EDITABLE_FIELDS.get(field)
+        if expected_type is None:
+            raise HTTPException(status_code=400, detail=f"Field {field} cannot be updated")
+        if not isinstance(value, expected_type):
+            raise HTTPException(status_code=400, detail=f"Invalid value for {field}")
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """
+    Checks the request's If-None-Match header against an ETag, using the
+    weak comparison If-None-Match calls for.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+@router.get("/recordings/compile", response_model=list[Recording])
+async def get_user_recordings(request: Request,
+                              limit: int = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                              cursor: str = None):
     """
     Returns a list of recordings tied to the user's current device ID.
 
     Input:
     - Firebase User ID
+    - limit (optional): Page size. Without it every recording is returned.
+    - cursor (optional): X-Next-Cursor header value from the previous page
+
+    Output:
+    - Recordings for the current device, ordered by sessionDateTime when paged,
+      gzip or brotli compressed if the client accepts it
+    - 304 if the If-None-Match header matches the current ETag
+    """
+
+    user_id = await run_blocking(verify_token, request)
+    device_id = await run_blocking(get_current_user_device, user_id)
+
+    logger.debug("Compiling recordings", extra={"user_id": user_id, "device_id": device_id})
+
+    if not device_id:
+        raise HTTPException(status_code=404, detail="No device set for user.")
+    ingest_worker.kick(device_id)
+
+    version = await run_blocking(recording_routes.get_recordings_version, device_id)
+    # Weak, since the gzip, brotli and identity bodies share the tag
+    tag_source = f"{device_id}|{version}|{limit}|{cursor}"
+    etag = f'W/"{hashlib.sha256(tag_source.encode()).hexdigest()[:32]}"'
+
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    headers = {"ETag": etag}
+
+    if limit is None:
+        recordings = await run_blocking(recording_routes.get_unviewed_recordings, device_id)
+    else:
+        try:
+            recordings, next_cursor = await run_blocking(
+                recording_routes.get_recordings_page, device_id, limit, cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+
+    return await run_blocking(model_response, RecordingList, recordings,
+                              request.headers.get("accept-encoding"), headers)
+
+def format_event(kind: str, data: dict) -> str:
+    """
+    Formats an event as a Server-Sent Events message. Recordings are
+    serialized like /recordings/compile serializes them.
+
+    Input:
+        kind (str): Event type: "recording", "removed" or "resync"
+        data (dict): Event data
 
     Output:
-    - All recordings for the current device
+        str: The message
     """
+    if kind == "recording":
+        payload = Recording.model_validate(data).model_dump_json(exclude_unset=True)
+    else:
+        payload = json.dumps(data)
+    return f"event: {kind}\ndata: {payload}\n\n"
 
-    sync_new_files()
+async def _event_stream(subscription: recording_events.Subscription):
+    """
+    Yields a subscription's events as Server-Sent Events until the client
+    disconnects, then unsubscribes.
+    """
+    try:
+        yield f"retry: {STREAM_RETRY_MILLISECONDS}\n\n"
+        while True:
+            try:
+                kind, data = await asyncio.wait_for(subscription.get(),
+                                                    timeout=STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(kind, data)
+    finally:
+        recording_events.hub.unsubscribe(subscription)
 
-    user_id = verify_token(request)
-    device_id = get_current_user_device(user_id)
+@router.get("/recordings/stream")
+async def stream_user_recordings(request: Request):
+    """
+    Streams changes to the recordings of the user's current device as
+    Server-Sent Events, so the app does not need to poll /recordings/compile.
+    Fetch the list once, then apply the events:
+    - recording: a recording was added or changed; data is the recording
+    - removed: data is {"id": ...} of a deleted recording
+    - resync: events were missed; fetch the list again
 
-    print("deviceID: ", device_id)
+    Input:
+    - Firebase User ID
 
+    Output:
+    - text/event-stream that stays open until the client disconnects
+    """
+    user_id = await run_blocking(verify_token, request)
+    device_id = await run_blocking(get_current_user_device, user_id)
     if not device_id:
         raise HTTPException(status_code=404, detail="No device set for user.")
-    recordings = recording_routes.get_unviewed_recordings(device_id)
 
-    return recordings
+    subscription = recording_events.hub.subscribe(device_id)
+    ingest_worker.kick(device_id)
+    return StreamingResponse(_event_stream(subscription), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.put("/recordings/update-title")
 async def update_recording_title(request: Request):
@@ -46,7 +187,7 @@ async def update_recording_title(request: Request):
     - Firebase user ID
     - New title
     """
-    verify_token(request)
+    await run_blocking(verify_token, request)
 
     body = await request.json()
     recording_id = body.get("recordingID")
@@ -55,7 +196,9 @@ async def update_recording_title(request: Request):
     if not recording_id or not new_title:
         raise HTTPException(status_code=400, detail="Missing recordingID or title")
 
-    recording_routes.update_recording_title(recording_id, new_title)
+    updated = await run_blocking(recording_routes.update_recording_title, recording_id, new_title)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Recording not found")
     return {"message": "Current recording title updated successfully"}
 
 @router.put("/recordings/update-notes")
@@ -67,7 +210,7 @@ async def update_recording_notes(request: Request):
     - Firebase User ID
     - New note content
     """
-    verify_token(request)
+    await run_blocking(verify_token, request)
 
     body = await request.json()
     recording_id = body.get("recordingID")
@@ -75,7 +218,9 @@ async def update_recording_notes(request: Request):
 
     if not recording_id or not new_notes:
         raise HTTPException(status_code=400, detail="Missing recordingID or note")
-    recording_routes.update_recording_notes(recording_id, new_notes)
+    updated = await run_blocking(recording_routes.update_recording_notes, recording_id, new_notes)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Recording not found")
     return {"message": "Current recording note updated successfully"}
 
 @router.put("/recordings/update-view")
@@ -87,7 +232,7 @@ async def update_recording_view(request: Request):
     - Firebase User ID
     - View Boolean
     """
-    verify_token(request)
+    await run_blocking(verify_token, request)
 
     body = await request.json()
     recording_id = body.get("recordingID")
@@ -95,5 +240,199 @@ async def update_recording_view(request: Request):
 
     if not recording_id or not view_bool:
         raise HTTPException(status_code=400, detail="Missing recording ID or view bool")
-    recording_routes.update_recording_view(recording_id, view_bool)
+    updated = await run_blocking(recording_routes.update_recording_view, recording_id, view_bool)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Recording not found")
     return {"message": "Current recording view boolean updated successfully"}
+
+async def _get_authorized_recording(user_id: str, recording_id: str) -> str:
+    """
+    Gets the storage object name of a recording on one of the user's devices.
+    Audio and waveforms are read with the service account, which bypasses
+    Storage security rules, and recording ids are derived from predictable
+    paths, so each request is checked against the user's devices here.
+
+    Input:
+        user_id (str): The Firebase UID of the caller
+        recording_id (str): The id tied to the recording
+
+    Output:
+        str: Name of the .wav object in Firebase Storage
+
+    Raises:
+        HTTPException: 404 if the recording does not exist or belongs to a
+        device that is not the user's
+    """
+    source = await run_blocking(recording_routes.get_recording_source, recording_id)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+
+    file_path, device_id = source
+    if device_id not in await run_blocking(get_user_device_ids, user_id):
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return file_path
+
+@router.get("/recordings/{recording_id}/waveform")
+async def get_recording_waveform(recording_id: str, request: Request,
+                                 level: int = Query(default=0, ge=0)):
+    """
+    Returns one level of a recording's waveform peak pyramid.
+
+    Input:
+    - Firebase User ID
+    - level: 0 is the finest level, higher levels are coarser
+
+    Output:
+    - Interleaved int8 min/max pairs. X-Sample-Rate, X-Samples-Per-Peak and
+      X-Peak-Count headers describe them.
+    - 404 if the recording is not on one of the user's devices
+    """
+    user_id = await run_blocking(verify_token, request)
+    await _get_authorized_recording(user_id, recording_id)
+
+    data = await run_blocking(recording_routes.get_waveform, recording_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Waveform not available")
+
+    try:
+        waveform_level = decode_level(data, level)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    return Response(content=waveform_level["peaks"], media_type="application/octet-stream",
+                    headers={
+                        "X-Sample-Rate": str(waveform_level["sample_rate"]),
+                        "X-Samples-Per-Peak": str(waveform_level["samples_per_peak"]),
+                        "X-Peak-Count": str(waveform_level["peak_count"]),
+                        "Cache-Control": "private, max-age=86400",
+                    })
+
+@router.get("/recordings/{recording_id}/audio")
+async def stream_recording_audio(recording_id: str, request: Request,
+                                 audio_format: str = Query(default="wav", alias="format")):
+    """
+    Streams a recording's audio, honoring single byte Range requests so
+    clients can seek without downloading the whole file.
+
+    With format=compressed the losslessly compressed copy is sent as is.
+    Otherwise the WAV is sent, decoded from the compressed copy if the WAV
+    itself is no longer in storage.
+
+    Input:
+    - Firebase User ID
+    - Range header (optional)
+    - format: "wav" (default) or "compressed"
+
+    Output:
+    - 200 with the whole file, 206 with the requested range, or 416 if the
+      range is outside the file
+    - 404 if the recording is not on one of the user's devices
+    """
+    user_id = await run_blocking(verify_token, request)
+
+    if audio_format not in ("wav", "compressed"):
+        raise HTTPException(status_code=400, detail="format must be wav or compressed")
+
+    file_path = await _get_authorized_recording(user_id, recording_id)
+
+    if audio_format == "compressed":
+        file_path = compressed_path(recording_id)
+        audio = await run_blocking(audio_proxy.get_audio_object, file_path)
+    else:
+        audio = await run_blocking(audio_proxy.get_audio_object, file_path)
+        if audio is None:
+            audio = await run_blocking(audio_proxy.get_decoded_audio, file_path,
+                                       compressed_path(recording_id))
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Recording audio not found")
+
+    size = audio["size"]
+    try:
+        byte_range = audio_proxy.parse_range(request.headers.get("range"), size)
+    except audio_proxy.RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    headers = {"Accept-Ranges": "bytes"}
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(audio_proxy.iter_audio(audio, file_path, start, end),
+                             status_code=status_code, media_type=audio["content_type"],
+                             headers=headers)
+
+@router.put("/recordings/bulk-update")
+async def bulk_update_recordings(request: Request):
+    """
+    Applies the same field changes to many recordings in one request, e.g. to
+    mark a page of recordings as viewed.
+
+    Input:
+    - Firebase User ID
+    - recordingIDs: List of recording ids
+    - fields: Any of sessionTitle, notes and viewed
+
+    Output:
+    - Per recording result and the number of recordings updated and missing.
+      Recordings on devices that are not the user's are reported as missing
+      and left untouched.
+    """
+    user_id = await run_blocking(verify_token, request)
+
+    body = await request.json()
+    recording_ids = body.get("recordingIDs")
+    fields = body.get("fields")
+
+    if not isinstance(recording_ids, list) or not recording_ids \
+            or not all(isinstance(recording_id, str) for recording_id in recording_ids):
+        raise HTTPException(status_code=400, detail="Missing recordingIDs")
+    if len(recording_ids) > MAX_BULK_UPDATE:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {MAX_BULK_UPDATE} recordings per request")
+    _validate_editable_fields(fields)
+
+    owners = await run_blocking(recording_routes.get_recording_devices, recording_ids)
+    device_ids = await run_blocking(get_user_device_ids, user_id)
+    owned = [recording_id for recording_id in recording_ids
+             if owners.get(recording_id) in device_ids]
+
+    updates = {}
+    if owned:
+        updates = await run_blocking(recording_routes.update_recordings_bulk, owned, fields)
+    results = {recording_id: updates.get(recording_id, False)
+               for recording_id in dict.fromkeys(recording_ids)}
+
+    updated = sum(1 for ok in results.values() if ok)
+    return {
+        "results": [{"recordingID": recording_id, "updated": ok}
+                    for recording_id, ok in results.items()],
+        "updated": updated,
+        "missing": len(results) - updated,
+    }
+
+@router.patch("/recordings/{recording_id}")
+async def patch_recording(recording_id: str, request: Request):
+    """
+    Updates any subset of a recording's editable fields in one write.
+
+    Input:
+    - Firebase User ID
+    - JSON body with any of sessionTitle, notes and viewed
+
+    Output:
+    - Success message, 400 for invalid fields or 404 if the recording is
+      missing or not on one of the user's devices
+    """
+    user_id = await run_blocking(verify_token, request)
+
+    body = await request.json()
+    _validate_editable_fields(body)
+    await _get_authorized_recording(user_id, recording_id)
+
+    updated = await run_blocking(recording_routes.update_recording, recording_id, body)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return {"message": "Recording updated successfully"}
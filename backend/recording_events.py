@@ -0,0 +1,177 @@
+"""
+recording_events.py
+
+Fans out changes to a device's recordings to every client streaming them.
+One Firestore listener is kept per device with at least one subscriber, no
+matter how many clients are connected, and removed with the last one.
+
+Listener callbacks arrive on Firestore threads and are handed to each
+subscriber's event loop. A subscriber that falls behind by more than
+QUEUE_SIZE events is told to resync rather than holding unbounded memory.
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+import recording_routes
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before it is told to resync
+QUEUE_SIZE = 256
+
+# Event sent to a subscriber whose queue overflowed
+RESYNC_EVENT = ("resync", {})
+
+
+class Subscription:
+    """
+    One client's stream of events for a device.
+    """
+
+    def __init__(self, device_id: str, loop: asyncio.AbstractEventLoop):
+        self.device_id = device_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event: tuple):
+        """
+        Queues an event. Runs on the subscriber's event loop.
+        """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Whatever was missed is recovered by refetching the recordings
+            self.overflowed = True
+
+    async def get(self):
+        """
+        Waits for the next event.
+
+        Output:
+            (str, dict): Event type and its data
+        """
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return RESYNC_EVENT
+        return await self.queue.get()
+
+
+class DeviceEventHub:
+    """
+    Tracks subscribers per device and the listener feeding them.
+    """
+
+    def __init__(self, watch_func=None):
+        """
+        Input:
+            watch_func: Called with a device ID, a start time and a callback
+                taking (event type, data); returns a handle with
+                unsubscribe(). Defaults to recording_routes.watch_device_recordings
+        """
+        self.watch_func = watch_func
+        self._subscribers = {}
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_id: str) -> Subscription:
+        """
+        Adds a subscriber, starting the device's listener if it is the first.
+        Must be called from the event loop the subscriber reads on.
+
+        Input:
+            device_id (str): Device whose recordings to stream
+
+        Output:
+            Subscription: Pass to unsubscribe when the client goes away
+        """
+        subscription = Subscription(device_id, asyncio.get_running_loop())
+        with self._lock:
+            subscribers = self._subscribers.setdefault(device_id, set())
+            subscribers.add(subscription)
+            start_watch = device_id not in self._watches
+            if start_watch:
+                self._watches[device_id] = None
+
+        if start_watch:
+            watch_func = self.watch_func or recording_routes.watch_device_recordings
+            try:
+                watch = watch_func(device_id, datetime.now(timezone.utc),
+                                   lambda kind, data: self.publish(device_id, kind, data))
+            except Exception:
+                with self._lock:
+                    self._watches.pop(device_id, None)
+                    subscribers.discard(subscription)
+                raise
+            with self._lock:
+                self._watches[device_id] = watch
+                # The last subscriber may have left while the listener started
+                if not self._subscribers.get(device_id):
+                    self._stop_watch(device_id)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        Removes a subscriber, stopping the device's listener if it was the last.
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.device_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.device_id, None)
+                if self._watches.get(subscription.device_id) is not None:
+                    self._stop_watch(subscription.device_id)
+
+    def publish(self, device_id: str, kind: str, data: dict):
+        """
+        Delivers an event to every subscriber of a device. Safe to call from
+        any thread.
+
+        Input:
+            device_id (str): Device the event belongs to
+            kind (str): Event type, e.g. "recording"
+            data (dict): Event data
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(device_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, (kind, data))
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self, device_id: str) -> int:
+        """
+        Output:
+            int: Number of clients streaming the device's recordings
+        """
+        with self._lock:
+            return len(self._subscribers.get(device_id, ()))
+
+    def close(self):
+        """
+        Stops every listener. Subscribers receive no further events.
+        """
+        with self._lock:
+            for device_id in list(self._watches):
+                if self._watches[device_id] is not None:
+                    self._stop_watch(device_id)
+            self._subscribers.clear()
+
+    def _stop_watch(self, device_id: str):
+        """
+        Stops a device's listener. Called with the lock held.
+        """
+        watch = self._watches.pop(device_id)
+        try:
+            watch.unsubscribe()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Stopping recording listener failed", extra={"device_id": device_id})
+
+
+hub = DeviceEventHub()
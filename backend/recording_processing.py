@@ -0,0 +1,381 @@
+"""
+recording_processing.py
+
+Ingest pipeline that runs after new recordings are synced from Firebase
+Storage. Each new recording is downloaded once, validated and summarized, and
+the results are stored on its Firestore document with processed set to true.
+A waveform peak pyramid and a heart rate estimate are built in the same
+pass, and the pyramid is stored next to the recording, as
+is a losslessly compressed copy when COMPRESS_RECORDINGS is enabled.
+
+A band-passed and denoised copy (see denoise.py) is also stored. That work is
+CPU bound, so it runs on a process pool rather than the download threads.
+
+Every worker process runs the ingest pass, so each pending recording is
+claimed in a transaction before it is processed and only one worker
+downloads and analyzes it.
+"""
+
+import logging
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from firestore import (db, bucket, SERVER_TIMESTAMP, sync_new_files, claim_recording,
+                       PROCESS_MAX_ATTEMPTS)
+from audio_analysis import WavReader, SampleStats, WavFormatError
+from waveform import PeakPyramid, encode_pyramid, waveform_path
+import audio_codec
+from audio_codec import DeltaEncoder, CodecError, compressed_path
+from denoise import clean_recording, cleaned_path
+from heart_rate import HeartRateEstimator
+
+logger = logging.getLogger(__name__)
+
+# Recordings processed concurrently. Work is mostly download bound and NumPy
+# releases the GIL while reducing samples, so threads are enough here.
+PROCESS_WORKERS = int(os.environ.get("PROCESS_WORKERS", "4"))
+
+# Unprocessed recordings picked up per ingest run
+PROCESS_BATCH_SIZE = 200
+
+# Bytes fetched per storage read while streaming a recording
+DOWNLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Whether a cleaned copy is stored, and the processes that produce it
+DENOISE_RECORDINGS = os.environ.get("DENOISE_RECORDINGS", "1") == "1"
+DENOISE_WORKERS = int(os.environ.get("DENOISE_WORKERS", str(os.cpu_count() or 1)))
+
+_denoise_pool = None
+_denoise_pool_lock = threading.Lock()
+
+
+def _get_denoise_pool() -> ProcessPoolExecutor:
+    """
+    Creates the denoise process pool on first use. Workers are spawned
+    rather than forked since the parent process runs threads.
+    """
+    global _denoise_pool  # pylint: disable=global-statement
+    with _denoise_pool_lock:
+        if _denoise_pool is None:
+            _denoise_pool = ProcessPoolExecutor(
+                max_workers=DENOISE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _denoise_pool
+
+
+def shutdown_denoise_pool():
+    """
+    Waits for running denoise jobs and stops the worker processes.
+    """
+    global _denoise_pool  # pylint: disable=global-statement
+    with _denoise_pool_lock:
+        if _denoise_pool is not None:
+            _denoise_pool.shutdown(wait=True)
+            _denoise_pool = None
+
+
+def _analyze_stream(recording_id: str, stream):
+    """
+    Reads a recording once, computing its summary and waveform pyramid, and
+    uploads the pyramid. When compression is enabled the compressed copy is
+    built in the same pass, checked by decoding it, and uploaded. The samples
+    are then cleaned on the denoise process pool and the cleaned WAV uploaded.
+
+    Input:
+        recording_id (str): The recording document id
+        stream: Binary file-like object with the WAV
+
+    Output:
+        dict: Recording document fields
+    """
+    reader = WavReader(stream)
+    stats = SampleStats(reader.header["sample_rate"])
+    pyramid = PeakPyramid(reader.header["sample_rate"])
+    heart_rate = HeartRateEstimator(reader.header["sample_rate"])
+    encoder = DeltaEncoder(reader.header["sample_rate"]) if audio_codec.COMPRESS_RECORDINGS else None
+    chunks = []
+    for samples in reader.chunks():
+        stats.add(samples)
+        pyramid.add(samples)
+        heart_rate.add(samples)
+        if encoder:
+            encoder.add(samples)
+        if DENOISE_RECORDINGS:
+            chunks.append(samples)
+
+    bucket.blob(waveform_path(recording_id)).upload_from_string(
+        encode_pyramid(pyramid), content_type="application/octet-stream")
+
+    fields = {**stats.summary(), **reader.length_fields(), **heart_rate.summary(),
+              "valid": True, "waveformPath": waveform_path(recording_id)}
+    if encoder:
+        fields.update(_store_compressed(recording_id, encoder))
+    if DENOISE_RECORDINGS:
+        fields.update(_store_cleaned(recording_id, chunks, reader.header["sample_rate"]))
+    return fields
+
+
+def _store_cleaned(recording_id: str, chunks: list, sample_rate: int):
+    """
+    Cleans a recording on the denoise process pool and uploads the result.
+
+    Input:
+        recording_id (str): The recording document id
+        chunks (list): int16 sample chunks in recording order
+        sample_rate (int): Samples per second
+
+    Output:
+        dict: Recording document fields describing the cleaned copy
+    """
+    samples = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int16)
+    data = _get_denoise_pool().submit(clean_recording, samples, sample_rate).result()
+    bucket.blob(cleaned_path(recording_id)).upload_from_string(data, content_type="audio/wav")
+    return {"cleanedPath": cleaned_path(recording_id)}
+
+
+def _store_compressed(recording_id: str, encoder: DeltaEncoder):
+    """
+    Finishes a compressed copy, verifies that it decodes to the original
+    samples and uploads it. A copy that fails verification is not stored.
+
+    Input:
+        recording_id (str): The recording document id
+        encoder (DeltaEncoder): Encoder with every chunk added
+
+    Output:
+        dict: Recording document fields describing the compressed copy
+    """
+    data = encoder.finish()
+    try:
+        audio_codec.decode_pcm(data)
+    except CodecError as exc:
+        logger.warning("Compressed copy failed verification",
+                       extra={"recording_id": recording_id, "error": str(exc)})
+        return {}
+
+    bucket.blob(compressed_path(recording_id)).upload_from_string(
+        data, content_type="application/octet-stream")
+    return {"compressedPath": compressed_path(recording_id), "compressedBytes": len(data)}
+
+
+def process_recording(recording_id: str, file_path: str, stream=None) -> bool:
+    """
+    Downloads one recording, computes its audio summary and waveform pyramid
+    and stores them. Recordings that are not valid WAV files are marked
+    processed with valid set to false so they are not retried.
+
+    Input:
+        recording_id (str): The recording document id
+        file_path (str): Name of the .wav object in Firebase Storage
+        stream: Local copy of the recording to read instead of downloading
+        it (e.g. a spooled upload), optional
+
+    Output:
+        bool: True if the document was updated, False if processing failed
+        and should be retried
+    """
+    try:
+        if stream is not None:
+            fields = _analyze_stream(recording_id, stream)
+        else:
+            with bucket.blob(file_path).open("rb", chunk_size=DOWNLOAD_CHUNK_BYTES) as blob_stream:
+                fields = _analyze_stream(recording_id, blob_stream)
+    except WavFormatError as exc:
+        fields = {"valid": False, "processingError": str(exc)}
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Processing recording failed",
+                       extra={"file_path": file_path, "error": str(exc)})
+        return False
+
+    db.collection("recordings").document(recording_id).update(
+        {**fields, "processed": True, "updatedAt": SERVER_TIMESTAMP})
+    return True
+
+
+def estimate_heart_rate(recording_id: str, file_path: str) -> bool:
+    """
+    Downloads one already processed recording and stores its heart rate
+    estimate. Used to fill in recordings processed before heart rate was
+    part of the pipeline.
+
+    Input:
+        recording_id (str): The recording document id
+        file_path (str): Name of the .wav object in Firebase Storage
+
+    Output:
+        bool: True if the document was updated, False if it failed and should
+        be retried
+    """
+    try:
+        with bucket.blob(file_path).open("rb", chunk_size=DOWNLOAD_CHUNK_BYTES) as stream:
+            reader = WavReader(stream)
+            heart_rate = HeartRateEstimator(reader.header["sample_rate"])
+            for samples in reader.chunks():
+                heart_rate.add(samples)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Estimating heart rate failed",
+                       extra={"file_path": file_path, "error": str(exc)})
+        return False
+
+    db.collection("recordings").document(recording_id).update(
+        {**heart_rate.summary(), "updatedAt": SERVER_TIMESTAMP})
+    return True
+
+
+def process_claimed_recording(recording_id: str, file_path: str, stream=None):
+    """
+    Processes a pending recording after claiming it, so that when several
+    workers pick up the same pending recordings, or an upload or storage
+    notification races the ingest worker, each is processed once.
+
+    Input:
+        recording_id (str): The recording document id
+        file_path (str): Name of the .wav object in Firebase Storage
+        stream: Local copy of the recording, as for process_recording, optional
+
+    Output:
+        bool: As process_recording
+        None: If another worker claimed the recording or already processed it
+    """
+    try:
+        if not claim_recording(recording_id):
+            return None
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Claiming recording failed",
+                       extra={"file_path": file_path, "error": str(exc)})
+        return False
+    return process_recording(recording_id, file_path, stream)
+
+
+def _process_docs(docs: list, handler=None):
+    """
+    Runs a handler over recording snapshots in parallel.
+
+    Input:
+        docs (list): Recording document snapshots with file_path
+        handler: Called with each recording id and file path, returns True on
+        success, False on failure and None if it skipped the recording.
+        Defaults to process_claimed_recording.
+
+    Output:
+        dict: Number of recordings processed and failed
+    """
+    if not docs:
+        return {"processed": 0, "failed": 0}
+    handler = handler or process_claimed_recording
+
+    with ThreadPoolExecutor(max_workers=PROCESS_WORKERS) as pool:
+        results = list(pool.map(lambda doc: handler(doc.id, doc.get("file_path")), docs))
+    return {"processed": sum(1 for ok in results if ok is True),
+            "failed": sum(1 for ok in results if ok is False)}
+
+
+def _process_collection(fields: list, wanted, handler):
+    """
+    Streams the whole recordings collection and runs a handler over the
+    recordings it selects, PROCESS_BATCH_SIZE at a time.
+
+    Input:
+        fields (list): Document fields to read, including file_path
+        wanted: Called with each document's fields, True to handle it
+        handler: Called with each recording id and file path, returns True on success
+
+    Output:
+        dict: Number of recordings processed and failed
+    """
+    totals = {"processed": 0, "failed": 0}
+    pending = []
+
+    for doc in db.collection("recordings").select(fields).stream():
+        if not wanted(doc.to_dict()):
+            continue
+        pending.append(doc)
+        if len(pending) == PROCESS_BATCH_SIZE:
+            for key, value in _process_docs(pending, handler).items():
+                totals[key] += value
+            pending = []
+
+    for key, value in _process_docs(pending, handler).items():
+        totals[key] += value
+    return totals
+
+
+def process_pending_recordings(device_id: str = None, limit: int = PROCESS_BATCH_SIZE):
+    """
+    Processes recordings created by the sync that have not been processed yet.
+
+    Recordings with the fewest processing attempts come first, and ones that
+    failed PROCESS_MAX_ATTEMPTS times are left out, so recordings that keep
+    failing (e.g. because their object was deleted) cannot fill the batch
+    ahead of new ones. Recordings created before attempts were counted are
+    picked up by process_backlog. The query needs a composite index on
+    processed, deviceID and processingAttempts.
+
+    Input:
+        device_id (str): Only process this device's recordings, None for all
+        limit (int): Maximum number of recordings to process
+
+    Output:
+        dict: Number of recordings processed and failed
+    """
+    query = db.collection("recordings").where("processed", "==", False)
+    if device_id:
+        query = query.where("deviceID", "==", device_id)
+    query = (query.where("processingAttempts", "<", PROCESS_MAX_ATTEMPTS)
+             .order_by("processingAttempts"))
+    docs = list(query.select(["file_path"]).limit(limit).stream())
+    return _process_docs(docs)
+
+
+def process_backlog():
+    """
+    Processes every recording that has not been processed, including ones
+    created before the processed flag existed. This streams the whole
+    recordings collection, so it is meant to be run rarely.
+
+    Output:
+        dict: Number of recordings processed and failed
+    """
+    totals = _process_collection(["file_path", "processed"],
+                                 lambda fields: fields.get("processed") is not True,
+                                 process_claimed_recording)
+
+    logger.info("Backlog processed", extra=totals)
+    return totals
+
+
+def heart_rate_backlog():
+    """
+    Estimates heart rate for every valid processed recording that does not
+    have an estimate yet, in parallel batches. Recordings still waiting to be
+    processed get theirs from process_recording. This streams the whole
+    recordings collection, so it is meant to be run rarely.
+
+    Output:
+        dict: Number of recordings updated and failed
+    """
+    totals = _process_collection(
+        ["file_path", "processed", "valid", "heartRateConfidence"],
+        lambda fields: fields.get("processed") is True and fields.get("valid") is not False
+        and "heartRateConfidence" not in fields,
+        estimate_heart_rate)
+
+    logger.info("Heart rate backlog processed", extra=totals)
+    return totals
+
+
+def ingest_new_recordings(device_id: str = None):
+    """
+    Syncs new recordings from storage and then processes them.
+
+    Input:
+        device_id (str): Device to ingest, None for the whole bucket
+
+    Output:
+        dict: Sync write statistics plus processing counts
+    """
+    stats = sync_new_files(device_id)
+    processing = process_pending_recordings(device_id)
+    return {**stats, "processed": processing["processed"],
+            "processing_failed": processing["failed"]}
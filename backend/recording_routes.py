@@ -4,9 +4,31 @@ recording_routes.py
 Defines all routes needed to communicate with Firestore db recording collection
 """
 
-from firestore import db
+import base64
+import json
+from datetime import datetime
+from google.api_core.exceptions import NotFound
+from firestore import db, bucket, SERVER_TIMESTAMP
+from cache_utils import TTLCache
+from metrics_utils import track_rpc
+from lazy_utils import LazyProxy
+from waveform import waveform_path
 
-recordings = db.collection("recordings")
+# Created on first use so importing this module does not create the client
+recordings = LazyProxy(lambda: db.collection("recordings"))
+
+# Recently requested waveform pyramids (a few KB each) kept in memory
+waveform_cache = TTLCache(maxsize=256, ttl=3600)
+
+# Recording id to storage path and device lookups. Neither changes once the
+# recording is created.
+source_cache = TTLCache(maxsize=4096)
+
+# Recording fields clients may edit, with their expected types
+EDITABLE_FIELDS = {"sessionTitle": str, "notes": str, "viewed": bool}
+
+# Firestore allows at most 500 writes per batch
+BULK_BATCH_SIZE = 500
 
 def get_unviewed_recordings(device_id: str):
     """
@@ -20,49 +42,290 @@ def get_unviewed_recordings(device_id: str):
     """
 
     query = recordings.where("deviceID", "==", device_id)
-    results = query.stream()
+    with track_rpc("firestore", "query", "recordings") as rpc:
+        results = list(query.stream())
+        rpc.documents_read = len(results)
     return  [
         {**doc.to_dict(), "id": doc.id}
         for doc in results
         ]
 
-def update_recording_title(recording_id: str, new_title: str):
+def encode_cursor(session_time: datetime, recording_id: str) -> str:
+    """
+    Encodes the position of a recording in the sessionDateTime ordering as an
+    opaque cursor string.
+
+    Input:
+        session_time (datetime): The recording's sessionDateTime
+        recording_id (str): The recording's document id
+
+    Output:
+        cursor (str): URL safe cursor
+    """
+    raw = json.dumps({"t": session_time.isoformat(), "id": recording_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    """
+    Decodes a cursor created by encode_cursor.
+
+    Input:
+        cursor (str): The cursor string
+
+    Output:
+        (datetime, str): sessionDateTime and document id of the last recording seen
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(data["t"]), data["id"]
+    except (TypeError, KeyError, json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+def get_recordings_page(device_id: str, limit: int, cursor: str = None):
+    """
+    Gets one page of a device's recordings ordered by sessionDateTime.
+
+    Input:
+        device_id (str): The device ID tied to the recordings.
+        limit (int): Maximum number of recordings to return.
+        cursor (str): Cursor returned with the previous page, None for the first page.
+
+    Output:
+        (list, str): Recordings (as dicts) and the cursor for the next page,
+        which is None once the last page has been returned.
+    """
+    query = (recordings.where("deviceID", "==", device_id)
+             .order_by("sessionDateTime")
+             .order_by("__name__"))
+
+    if cursor:
+        session_time, recording_id = decode_cursor(cursor)
+        query = query.start_after({"sessionDateTime": session_time, "__name__": recording_id})
+
+    with track_rpc("firestore", "query", "recordings") as rpc:
+        docs = list(query.limit(limit).stream())
+        rpc.documents_read = len(docs)
+    page = [{**doc.to_dict(), "id": doc.id} for doc in docs]
+
+    next_cursor = None
+    if len(docs) == limit:
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get("sessionDateTime"), last.id)
+    return page, next_cursor
+
+def get_recordings_version(device_id: str) -> str:
+    """
+    Gets a marker that changes whenever a device's recordings change, without
+    reading the recordings themselves. It combines the number of recordings
+    with the newest updatedAt stamp, so additions, edits and deletions all
+    produce a new version.
+
+    Input:
+        device_id (str): The device ID tied to the recordings.
+
+    Output:
+        version (str): Opaque version string
+    """
+    query = recordings.where("deviceID", "==", device_id)
+    with track_rpc("firestore", "count", "recordings") as rpc:
+        count = query.count().get()[0][0].value
+        # Aggregations are billed as one read per 1000 entries matched
+        rpc.documents_read = 1
+
+    with track_rpc("firestore", "query", "recordings") as rpc:
+        latest = list(query.order_by("updatedAt", direction="DESCENDING")
+                      .select(["updatedAt"]).limit(1).stream())
+        rpc.documents_read = len(latest)
+    updated_at = latest[0].get("updatedAt").isoformat() if latest else ""
+
+    return f"{count}:{updated_at}"
+
+def update_recording(recording_id: str, fields: dict) -> bool:
+    """
+    Given recording id, updates the given fields in a single write. No read
+    is made first; Firestore rejects the update if the recording is missing.
+
+    Input:
+        recording_id: The id tied to the recording
+        fields: Field names and their new values
+
+    Output:
+        bool: True if the recording was updated, False if it does not exist
+    """
+    try:
+        with track_rpc("firestore", "update", "recordings") as rpc:
+            recordings.document(recording_id).update({**fields, "updatedAt": SERVER_TIMESTAMP})
+            rpc.documents_written = 1
+    except NotFound:
+        return False
+    return True
+
+def update_recordings_bulk(recording_ids: list, fields: dict) -> dict:
+    """
+    Applies the same field changes to many recordings using batched writes.
+
+    Each chunk is committed as one batch. A batch fails as a whole if any of
+    its recordings is missing, so that chunk is then retried one recording at
+    a time to find out which ones exist.
+
+    Input:
+        recording_ids: The ids of the recordings to update
+        fields: Field names and their new values
+
+    Output:
+        dict: Maps each recording id to True if updated, False if it does not exist
+    """
+    data = {**fields, "updatedAt": SERVER_TIMESTAMP}
+    unique_ids = list(dict.fromkeys(recording_ids))
+    results = {}
+
+    for start in range(0, len(unique_ids), BULK_BATCH_SIZE):
+        chunk = unique_ids[start:start + BULK_BATCH_SIZE]
+        batch = db.batch()
+        for recording_id in chunk:
+            batch.update(recordings.document(recording_id), data)
+        try:
+            with track_rpc("firestore", "batch_commit", "recordings") as rpc:
+                batch.commit()
+                rpc.documents_written = len(chunk)
+            results.update({recording_id: True for recording_id in chunk})
+        except NotFound:
+            for recording_id in chunk:
+                results[recording_id] = update_recording(recording_id, fields)
+
+    return results
+
+def update_recording_title(recording_id: str, new_title: str) -> bool:
     """
     Given recording id, updates title corresponding to that recording id.
 
     Input:
-        recording_id: The id tied to the recording 
+        recording_id: The id tied to the recording
         new_title: The new user inputted title
-    """
-    recording_ref = recordings.document(recording_id)
-    curr_data = recording_ref.get()
 
-    if curr_data.exists:
-        recording_ref.update({"sessionTitle": new_title})
+    Output:
+        bool: True if the recording was updated, False if it does not exist
+    """
+    return update_recording(recording_id, {"sessionTitle": new_title})
 
-def update_recording_view(recording_id: str, view_bool: bool):
+def update_recording_view(recording_id: str, view_bool: bool) -> bool:
     """
     Given recording id, updates viewed to true
 
     Input:
-        recording_id: The id tied to the recording 
-    """
-    recording_ref = recordings.document(recording_id)
-    curr_data = recording_ref.get()
+        recording_id: The id tied to the recording
 
-    if curr_data.exists:
-        recording_ref.update({"viewed": view_bool})
+    Output:
+        bool: True if the recording was updated, False if it does not exist
+    """
+    return update_recording(recording_id, {"viewed": view_bool})
 
-def update_recording_notes(recording_id: str, new_notes: str):
+def update_recording_notes(recording_id: str, new_notes: str) -> bool:
     """
     Given recording id, updates notes corresponding to that recording id.
 
     Input:
-        recording_id: The id tied to the recording 
+        recording_id: The id tied to the recording
         new_notes: The new user inputted title
+
+    Output:
+        bool: True if the recording was updated, False if it does not exist
+    """
+    return update_recording(recording_id, {"notes": new_notes})
+
+def get_waveform(recording_id: str):
+    """
+    Gets the encoded waveform peak pyramid stored for a recording.
+
+    Input:
+        recording_id: The id tied to the recording
+
+    Output:
+        bytes: The encoded pyramid
+        None: If the recording has not been processed yet
+    """
+    data = waveform_cache.get(recording_id)
+    if data is not None:
+        return data
+
+    try:
+        with track_rpc("storage", "download"):
+            data = bucket.blob(waveform_path(recording_id)).download_as_bytes()
+    except NotFound:
+        return None
+    waveform_cache.set(recording_id, data)
+    return data
+
+def get_recording_source(recording_id: str):
+    """
+    Gets the storage object name of a recording and the device it belongs to.
+
+    Input:
+        recording_id: The id tied to the recording
+
+    Output:
+        (str, str): Name of the .wav object in Firebase Storage and the device ID
+        None: If the recording does not exist
+    """
+    source = source_cache.get(recording_id)
+    if source is not None:
+        return source
+
+    with track_rpc("firestore", "get", "recordings") as rpc:
+        snapshot = recordings.document(recording_id).get(["file_path", "deviceID"])
+        rpc.documents_read = 1
+    if not snapshot.exists:
+        return None
+    source = (snapshot.get("file_path"), snapshot.get("deviceID"))
+    source_cache.set(recording_id, source)
+    return source
+
+def get_recording_devices(recording_ids: list) -> dict:
+    """
+    Gets the device each of several recordings belongs to, in one read.
+
+    Input:
+        recording_ids: The ids of the recordings
+
+    Output:
+        dict: Maps each existing recording id to its device ID. Missing
+        recordings are left out.
+    """
+    references = [recordings.document(recording_id)
+                  for recording_id in dict.fromkeys(recording_ids)]
+    with track_rpc("firestore", "get_all", "recordings") as rpc:
+        snapshots = list(db.get_all(references, field_paths=["deviceID"]))
+        rpc.documents_read = len(snapshots)
+    return {snapshot.id: snapshot.get("deviceID") for snapshot in snapshots if snapshot.exists}
+
+def watch_device_recordings(device_id: str, since: datetime, callback):
+    """
+    Listens for a device's recordings being created or changed. Every write
+    stamps updatedAt, so listening to recordings updated after `since` sees
+    each change without reading the device's existing recordings. Uses the
+    same (deviceID, updatedAt) index as get_recordings_version.
+
+    Input:
+        device_id (str): The device ID tied to the recordings.
+        since (datetime): Only changes made after this are reported.
+        callback: Called from a Firestore thread with each change as
+        ("recording", recording dict) or ("removed", {"id": recording id})
+
+    Output:
+        Watch handle; call its unsubscribe() to stop listening
     """
-    recording_ref = recordings.document(recording_id)
-    curr_data = recording_ref.get()
+    def on_snapshot(_docs, changes, _read_time):
+        for change in changes:
+            doc = change.document
+            if change.type.name == "REMOVED":
+                callback("removed", {"id": doc.id})
+            else:
+                callback("recording", {**doc.to_dict(), "id": doc.id})
 
-    if curr_data.exists:
-        recording_ref.update({"notes": new_notes})
+    query = (recordings.where("deviceID", "==", device_id)
+             .where("updatedAt", ">", since))
+    with track_rpc("firestore", "listen", "recordings"):
+        return query.on_snapshot(on_snapshot)
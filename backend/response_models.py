@@ -0,0 +1,78 @@
+"""
+response_models.py
+
+Pydantic models for the recordings and profiles the API returns. They are
+validated and serialized to JSON by pydantic-core, which is much faster than
+FastAPI's generic jsonable_encoder for long recording lists.
+
+Fields missing from a document are left out of the response rather than sent
+as null, so responses have the same shape as the stored documents.
+"""
+
+from datetime import datetime
+from typing import Annotated, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, PlainSerializer, TypeAdapter
+
+# Firestore timestamps, serialized with datetime.isoformat as the app expects
+Timestamp = Annotated[datetime, PlainSerializer(lambda value: value.isoformat(),
+                                                return_type=str, when_used="json")]
+
+
+class Recording(BaseModel):
+    """
+    A recording document and its id. Fields the backend does not know
+    about are dropped.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    id: str
+    deviceID: Optional[str] = None
+    notes: Optional[str] = None
+    sessionDateTime: Optional[Timestamp] = None
+    updatedAt: Optional[Timestamp] = None
+    sessionTitle: Optional[str] = None
+    viewed: Optional[bool] = None
+    file_path: Optional[str] = None
+    wavFileURL: Optional[str] = None
+    processed: Optional[bool] = None
+
+    # Set by the processing stage
+    valid: Optional[bool] = None
+    processingError: Optional[str] = None
+    sampleRate: Optional[int] = None
+    durationSeconds: Optional[float] = None
+    rms: Optional[float] = None
+    peak: Optional[float] = None
+    clippingRatio: Optional[float] = None
+    silenceFraction: Optional[float] = None
+    dataBytes: Optional[int] = None
+    declaredDataBytes: Optional[int] = None
+    truncated: Optional[bool] = None
+    heartRateBpm: Optional[float] = None
+    heartRateConfidence: Optional[float] = None
+    waveformPath: Optional[str] = None
+    compressedPath: Optional[str] = None
+    compressedBytes: Optional[int] = None
+    cleanedPath: Optional[str] = None
+
+
+class Profile(BaseModel):
+    """
+    A user profile. Registration stores whatever fields the app sends, so
+    fields beyond the known ones are kept.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+    userID: Optional[str] = None
+    email: Optional[str] = None
+    firstName: Optional[str] = None
+    timeZone: Optional[str] = None
+    deviceIDs: Optional[List[str]] = None
+    deviceNicknames: Optional[Dict[str, str]] = None
+    currentDeviceID: Optional[str] = None
+
+
+RecordingList = TypeAdapter(List[Recording])
+ProfileAdapter = TypeAdapter(Profile)
@@ -0,0 +1,99 @@
+"""
+response_utils.py
+
+Builds JSON responses from response models, compressed with brotli or gzip
+when the client accepts it and the body is large enough to be worth it.
+Brotli is used only if the brotli package is installed.
+"""
+
+import gzip
+import os
+from fastapi import Response
+from pydantic import TypeAdapter
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MINIMUM_BYTES = int(os.environ.get("COMPRESS_MINIMUM_BYTES", "1024"))
+
+# Fast levels: JSON compresses well even at these, and they cost little CPU
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def choose_encoding(accept_encoding: str):
+    """
+    Picks the content encoding for a response.
+
+    Input:
+        accept_encoding (str): The request's Accept-Encoding header
+
+    Output:
+        str: "br" or "gzip"
+        None: If the client accepts neither
+    """
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def encode_body(body: bytes, encoding: str):
+    """
+    Compresses a response body if it is large enough.
+
+    Input:
+        body (bytes): The uncompressed body
+        encoding (str): Encoding from choose_encoding, or None
+
+    Output:
+        (bytes, str): The body and the encoding applied, None if it was left as is
+    """
+    if encoding is None or len(body) < COMPRESS_MINIMUM_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+
+
+def model_response(adapter: TypeAdapter, value, accept_encoding: str = None,
+                   headers: dict = None) -> Response:
+    """
+    Validates a value against a response model and serializes it to a JSON
+    response. Fields that were not in the value are left out. This does the
+    CPU bound work, so call it through run_blocking for large values.
+
+    Input:
+        adapter (TypeAdapter): Adapter for the response model
+        value: Dicts or lists of dicts matching the model
+        accept_encoding (str): The request's Accept-Encoding header
+        headers (dict): Extra response headers
+
+    Output:
+        Response: The JSON response, compressed if worthwhile
+    """
+    body = adapter.dump_json(adapter.validate_python(value), exclude_unset=True)
+    body, encoding = encode_body(body, choose_encoding(accept_encoding))
+
+    response_headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=response_headers)
@@ -0,0 +1,172 @@
+"""
+storage_notifications.py
+
+Ingests recordings from Cloud Storage object-finalize notifications, so each
+upload is picked up on its own instead of by listing the bucket. Both
+delivery shapes are understood:
+
+    Pub/Sub push: {"message": {"attributes": {"eventType": "OBJECT_FINALIZE",
+                   "bucketId": ..., "objectId": ...}, "data": <base64 object>}}
+    Eventarc:     CloudEvent with type google.cloud.storage.object.v1.finalized,
+                  in binary mode (ce-* headers, object as the body) or
+                  structured mode ({"type": ..., "data": <object>})
+
+Notifications can be sent by any local stand-in that posts the same payload;
+pubsub_push_payload builds one.
+"""
+
+import base64
+import binascii
+import json
+import os
+from firestore import bucket, add_recording, is_recording_object
+from metrics_utils import track_rpc
+
+# When set, notifications must carry a Google-signed OIDC token for this
+# audience (the push endpoint's URL), as Pub/Sub push and Eventarc send
+NOTIFICATION_AUDIENCE = os.environ.get("NOTIFICATION_AUDIENCE")
+
+# When set, the OIDC token must belong to this service account
+NOTIFICATION_SERVICE_ACCOUNT = os.environ.get("NOTIFICATION_SERVICE_ACCOUNT")
+
+PUBSUB_FINALIZE_EVENT = "OBJECT_FINALIZE"
+CLOUDEVENT_FINALIZE_TYPE = "google.cloud.storage.object.v1.finalized"
+
+
+class NotificationError(ValueError):
+    """
+    Raised when a notification body is malformed.
+    """
+
+
+def parse_notification(headers, body: dict):
+    """
+    Extracts the finalized object from a notification.
+
+    Input:
+        headers: The request headers (case insensitive mapping)
+        body (dict): The decoded JSON body
+
+    Output:
+        (str, str): Bucket and object name of the finalized object
+        None: If the notification is for some other event, which is ignored
+
+    Raises:
+        NotificationError: If the notification is malformed
+    """
+    if not isinstance(body, dict):
+        raise NotificationError("Notification body must be a JSON object")
+
+    if "message" in body:
+        message = body["message"]
+        if not isinstance(message, dict):
+            raise NotificationError("Malformed Pub/Sub message")
+        attributes = message.get("attributes") or {}
+        if attributes.get("eventType") != PUBSUB_FINALIZE_EVENT:
+            return None
+        resource = {}
+        if message.get("data"):
+            try:
+                resource = json.loads(base64.b64decode(message["data"]))
+            except (binascii.Error, ValueError) as exc:
+                raise NotificationError("Malformed Pub/Sub message data") from exc
+        bucket_name = attributes.get("bucketId") or resource.get("bucket")
+        name = attributes.get("objectId") or resource.get("name")
+    else:
+        event_type = headers.get("ce-type") or body.get("type")
+        if event_type is None:
+            raise NotificationError("Not a Pub/Sub message or CloudEvent")
+        if event_type != CLOUDEVENT_FINALIZE_TYPE:
+            return None
+        resource = body["data"] if "data" in body and "type" in body else body
+        if not isinstance(resource, dict):
+            raise NotificationError("Malformed CloudEvent data")
+        bucket_name = resource.get("bucket")
+        name = resource.get("name")
+
+    if not bucket_name or not name:
+        raise NotificationError("Notification does not name a bucket and object")
+    return bucket_name, name
+
+
+def verify_push_token(authorization: str) -> bool:
+    """
+    Checks the OIDC token Pub/Sub push or Eventarc attaches, if
+    NOTIFICATION_AUDIENCE is configured. Makes a network call the first time
+    Google's signing keys are needed.
+
+    Input:
+        authorization (str): The request's Authorization header
+
+    Output:
+        bool: True if the notification may be processed
+    """
+    if not NOTIFICATION_AUDIENCE:
+        return True
+    if not authorization or not authorization.startswith("Bearer "):
+        return False
+
+    # Imported here since most deployments do not verify tokens
+    # pylint: disable=import-outside-toplevel
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
+
+    try:
+        claims = id_token.verify_oauth2_token(authorization.split(" ", 1)[1],
+                                              google_requests.Request(), NOTIFICATION_AUDIENCE)
+    except ValueError:
+        return False
+    if NOTIFICATION_SERVICE_ACCOUNT:
+        return claims.get("email") == NOTIFICATION_SERVICE_ACCOUNT and \
+            claims.get("email_verified", False)
+    return True
+
+
+def ingest_object(bucket_name: str, name: str):
+    """
+    Creates the recording document for one finalized object. Only recordings
+    (see is_recording_object) in the backend's bucket that still exist are
+    ingested, so a forged or stale notification, or one for a copy the
+    processing stage stored, cannot create a recording.
+
+    Input:
+        bucket_name (str): Bucket the object was written to
+        name (str): Object name
+
+    Output:
+        (str, bool): The recording id and whether its document was created
+        None: If the object is not a recording in this bucket
+    """
+    if bucket_name != bucket.name or not is_recording_object(name):
+        return None
+    with track_rpc("storage", "metadata"):
+        blob = bucket.get_blob(name)
+    if blob is None:
+        return None
+    return add_recording(name)
+
+
+def pubsub_push_payload(bucket_name: str, name: str, **resource) -> dict:
+    """
+    Builds the body Pub/Sub push sends for an object-finalize notification,
+    for local stand-ins and tests.
+
+    Input:
+        bucket_name (str): Bucket the object was written to
+        name (str): Object name
+        **resource: Further object resource fields, e.g. size or contentType
+
+    Output:
+        dict: The push request body
+    """
+    data = json.dumps({"kind": "storage#object", "bucket": bucket_name, "name": name,
+                       **resource}).encode("utf-8")
+    return {
+        "message": {
+            "attributes": {"eventType": PUBSUB_FINALIZE_EVENT, "bucketId": bucket_name,
+                           "objectId": name, "payloadFormat": "JSON_API_V1"},
+            "data": base64.b64encode(data).decode("ascii"),
+            "messageId": "local",
+        },
+        "subscription": "projects/local/subscriptions/recordings",
+    }
@@ -0,0 +1,47 @@
+"""
+test_async_utils.py
+
+Tests that blocking calls run off the event loop.
+"""
+
+import sys
+import os
+import time
+import asyncio
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from async_utils import run_blocking
+
+
+def test_run_blocking_returns_result():
+    """
+    Tests that run_blocking passes arguments through and returns the result.
+    """
+    result = asyncio.run(run_blocking(lambda a, b=0: a + b, 2, b=3))
+    assert result == 5
+
+
+def test_run_blocking_reraises():
+    """
+    Tests that exceptions raised by the blocking function reach the caller.
+    """
+    def fail():
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run_blocking(fail))
+
+
+def test_blocking_calls_overlap():
+    """
+    Tests that concurrent blocking calls run at the same time instead of
+    one after another on the event loop.
+    """
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(run_blocking(time.sleep, 0.2) for _ in range(4)))
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 0.6
@@ -0,0 +1,167 @@
+"""
+test_audio_analysis.py
+
+Tests WAV header validation and the audio summary statistics.
+"""
+
+import sys
+import os
+import io
+import struct
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import audio_analysis
+from audio_analysis import analyze_wav, parse_wav_header, WavFormatError
+
+SAMPLE_RATE = 44100
+
+# hardware.ino RECORD_TIME and sizeof(sBuffer)
+FIRMWARE_RECORD_SECONDS = 30
+FIRMWARE_READ_BYTES = 1024
+
+
+def make_wav(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """
+    Builds a WAV file the same way the firmware's writeWavHeader does.
+
+    Input:
+        samples (np.ndarray): int16 samples
+        sample_rate (int): Samples per second
+
+    Output:
+        bytes: The WAV file
+    """
+    data = samples.astype("<i2").tobytes()
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", len(data) + 36, b"WAVE", b"fmt ",
+                         16, 1, 1, sample_rate, sample_rate * 2, 2, 16, b"data", len(data))
+    return header + data
+
+
+def make_firmware_wav(samples: np.ndarray = None) -> bytes:
+    """
+    Builds a recording the way hardware.ino record_and_transmit does: the
+    header declares a full 30 s of audio, and the record loop stops once
+    another 1024-byte I2S read would not fit, leaving the upload short.
+
+    Input:
+        samples (np.ndarray): int16 samples to repeat through the recording
+
+    Output:
+        bytes: The uploaded file
+    """
+    audio_bytes = SAMPLE_RATE * FIRMWARE_RECORD_SECONDS * 2
+    total_bytes = 44 + audio_bytes
+    offset = 44
+    while offset + FIRMWARE_READ_BYTES <= total_bytes:
+        offset += FIRMWARE_READ_BYTES
+
+    if samples is None:
+        samples = np.zeros(1, dtype=np.int16)
+    data = np.resize(samples.astype("<i2"), (offset - 44) // 2).tobytes()
+    return make_wav(np.zeros(audio_bytes // 2, dtype=np.int16))[:44] + data
+
+
+def test_sine_wave_summary():
+    """
+    Tests duration, RMS and peak of a half scale sine wave.
+    """
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    samples = (0.5 * 32767 * np.sin(2 * np.pi * 100 * t)).astype(np.int16)
+
+    summary = analyze_wav(io.BytesIO(make_wav(samples)))
+
+    assert summary["durationSeconds"] == pytest.approx(1.0)
+    assert summary["rms"] == pytest.approx(0.5 / np.sqrt(2), rel=1e-3)
+    assert summary["peak"] == pytest.approx(0.5, rel=1e-3)
+    assert summary["clippingRatio"] == 0
+    assert summary["silenceFraction"] == 0
+
+
+def test_clipping_and_silence_across_chunks(monkeypatch):
+    """
+    Tests clipping and silence counts when the samples are read in several
+    chunks that do not line up with silence frames.
+    """
+    monkeypatch.setattr(audio_analysis, "CHUNK_SAMPLES", 1000)
+    silent = np.zeros(SAMPLE_RATE // 2, dtype=np.int16)
+    loud = np.full(SAMPLE_RATE // 2, 32767, dtype=np.int16)
+
+    summary = analyze_wav(io.BytesIO(make_wav(np.concatenate((silent, loud)))))
+
+    assert summary["clippingRatio"] == pytest.approx(0.5)
+    assert summary["silenceFraction"] == pytest.approx(0.5, abs=0.01)
+    assert summary["peak"] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_complete_file_is_not_truncated():
+    """
+    Tests the length fields of a file holding its declared data size.
+    """
+    summary = analyze_wav(io.BytesIO(make_wav(np.zeros(1000, dtype=np.int16))))
+
+    assert summary["dataBytes"] == summary["declaredDataBytes"] == 2000
+    assert summary["truncated"] is False
+
+
+def test_firmware_recording_is_truncated_not_rejected():
+    """
+    Tests that a recording shaped like the firmware's uploads, 1008 bytes
+    short of its declared 30 s, is analyzed as truncated audio.
+    """
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    wav = make_firmware_wav((0.5 * 32767 * np.sin(2 * np.pi * 100 * t)).astype(np.int16))
+
+    for total_bytes in (None, len(wav)):
+        summary = analyze_wav(io.BytesIO(wav), total_bytes)
+
+        assert summary["declaredDataBytes"] == SAMPLE_RATE * FIRMWARE_RECORD_SECONDS * 2
+        assert summary["dataBytes"] == summary["declaredDataBytes"] - 1008
+        assert summary["truncated"] is True
+        assert summary["durationSeconds"] == pytest.approx(summary["dataBytes"] / 2 / SAMPLE_RATE)
+        assert summary["peak"] == pytest.approx(0.5, rel=1e-3)
+
+
+def test_truncated_part_way_through_a_sample(monkeypatch):
+    """
+    Tests that a file ending part way through a sample keeps the whole
+    samples before it, including when reads do not line up with samples.
+    """
+    monkeypatch.setattr(audio_analysis, "CHUNK_SAMPLES", 7)
+    wav = make_wav(np.ones(1000, dtype=np.int16))[:-101]
+
+    summary = analyze_wav(io.BytesIO(wav))
+
+    assert summary["dataBytes"] == 1898
+    assert summary["truncated"] is True
+    assert parse_wav_header(wav[:44], total_bytes=len(wav))["data_bytes"] == 1898
+
+
+def test_declared_length_mismatch():
+    """
+    Tests that files longer than their declared data size, or holding no
+    samples at all, are rejected.
+    """
+    wav = make_wav(np.zeros(1000, dtype=np.int16))
+
+    with pytest.raises(WavFormatError):
+        parse_wav_header(wav[:44], total_bytes=len(wav) + 2)
+    with pytest.raises(WavFormatError):
+        analyze_wav(io.BytesIO(wav[:44]))
+    with pytest.raises(WavFormatError):
+        analyze_wav(io.BytesIO(wav[:45]), total_bytes=45)
+
+
+def test_unsupported_format():
+    """
+    Tests that non WAV data and stereo audio are rejected.
+    """
+    with pytest.raises(WavFormatError):
+        parse_wav_header(b"not a wav file at all, definitely not one!!")
+
+    stereo = bytearray(make_wav(np.zeros(10, dtype=np.int16)))
+    stereo[22:24] = struct.pack("<H", 2)
+    with pytest.raises(WavFormatError):
+        parse_wav_header(bytes(stereo))
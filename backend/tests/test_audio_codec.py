@@ -0,0 +1,74 @@
+"""
+test_audio_codec.py
+
+Tests the lossless compressed recording format.
+"""
+
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import audio_codec
+from audio_codec import DeltaEncoder, decode_pcm, decode_to_wav, CodecError
+from test_audio_analysis import make_wav
+
+
+def encode(samples: np.ndarray, sample_rate: int = 44100, chunks: int = 1) -> bytes:
+    """
+    Compresses samples, adding them in the given number of chunks.
+    """
+    encoder = DeltaEncoder(sample_rate)
+    for chunk in np.array_split(samples, chunks):
+        encoder.add(chunk)
+    return encoder.finish()
+
+
+def test_round_trip_is_byte_identical(monkeypatch):
+    """
+    Tests that decoding rebuilds the original WAV exactly, across block and
+    chunk boundaries and with full scale samples that wrap the deltas.
+    """
+    monkeypatch.setattr(audio_codec, "BLOCK_SAMPLES", 1000)
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-32768, 32767, 4321, dtype=np.int16)
+    samples[:2] = [-32768, 32767]
+
+    data = encode(samples, chunks=5)
+    assert decode_to_wav(data) == make_wav(samples)
+
+
+def test_smooth_audio_compresses():
+    """
+    Tests that low frequency audio compresses well below raw PCM size.
+    """
+    t = np.arange(44100) / 44100
+    samples = (8000 * np.sin(2 * np.pi * 60 * t)).astype(np.int16)
+    assert len(encode(samples)) < 0.5 * samples.nbytes
+
+
+def test_empty_recording():
+    """
+    Tests that a recording with no samples round trips.
+    """
+    assert decode_pcm(encode(np.empty(0, dtype=np.int16), 8000)) == (8000, b"")
+
+
+def test_corruption_is_detected():
+    """
+    Tests that bad magic, truncated data and checksum mismatches raise CodecError.
+    """
+    data = encode(np.arange(1000, dtype=np.int16))
+
+    with pytest.raises(CodecError):
+        decode_pcm(b"XXXX" + data[4:])
+    with pytest.raises(CodecError):
+        decode_pcm(data[:-5])
+
+    # Flip a bit of the stored checksum
+    corrupt = bytearray(data)
+    corrupt[20] ^= 1
+    with pytest.raises(CodecError):
+        decode_pcm(bytes(corrupt))
@@ -0,0 +1,124 @@
+"""
+test_audio_proxy.py
+
+Tests Range parsing and chunked streaming of recording audio.
+"""
+
+import sys
+import os
+import io
+from unittest.mock import Mock, MagicMock
+import pytest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+import audio_proxy
+from audio_proxy import parse_range, iter_audio, get_audio_object, get_decoded_audio, \
+    RangeNotSatisfiable
+from audio_codec import DeltaEncoder
+from test_audio_analysis import make_wav
+
+
+@pytest.fixture(autouse=True)
+def clear_hot_objects():
+    """
+    Empties the hot object cache between tests.
+    """
+    audio_proxy.hot_objects.clear()
+    yield
+    audio_proxy.hot_objects.clear()
+
+
+def make_blob(data: bytes):
+    """
+    Builds a fake storage blob whose open() returns a seekable reader.
+    """
+    blob = MagicMock(size=len(data), content_type="audio/wav")
+    blob.open.side_effect = lambda *args, **kwargs: io.BytesIO(data)
+    return blob
+
+
+def test_parse_range_forms():
+    """
+    Tests explicit, open ended and suffix ranges.
+    """
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+
+
+def test_parse_range_unsatisfiable():
+    """
+    Tests that ranges outside the object raise RangeNotSatisfiable.
+    """
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=-0", 100)
+
+
+def test_iter_audio_streams_range_in_chunks(monkeypatch):
+    """
+    Tests that a range is read from storage in bounded chunks and that
+    partial reads are not cached.
+    """
+    monkeypatch.setattr(audio_proxy, "STREAM_CHUNK_BYTES", 4)
+    data = bytes(range(20))
+    audio = {"size": len(data), "content_type": "audio/wav", "blob": make_blob(data)}
+
+    chunks = list(iter_audio(audio, "dev/a.wav", 3, 12))
+    assert b"".join(chunks) == data[3:13]
+    assert max(len(chunk) for chunk in chunks) == 4
+    assert audio_proxy.hot_objects.get("dev/a.wav") is None
+
+
+def test_full_read_is_cached_and_served_from_memory():
+    """
+    Tests that a small object sent whole is cached and later lookups skip storage.
+    """
+    data = b"RIFF" + bytes(100)
+    audio_proxy.bucket.get_blob = Mock(return_value=make_blob(data))
+
+    audio = get_audio_object("dev/a.wav")
+    assert b"".join(iter_audio(audio, "dev/a.wav", 0, len(data) - 1)) == data
+
+    audio_proxy.bucket.get_blob.reset_mock()
+    cached = get_audio_object("dev/a.wav")
+    audio_proxy.bucket.get_blob.assert_not_called()
+    assert b"".join(iter_audio(cached, "dev/a.wav", 4, 7)) == data[4:8]
+
+
+def test_get_audio_object_missing():
+    """
+    Tests that a missing object returns None.
+    """
+    audio_proxy.bucket.get_blob = Mock(return_value=None)
+    assert get_audio_object("dev/missing.wav") is None
+
+
+def test_compressed_copy_is_decoded_and_cached():
+    """
+    Tests that a compressed copy is decoded to the original WAV and cached
+    under the WAV's path.
+    """
+    samples = np.arange(-500, 500, dtype=np.int16)
+    encoder = DeltaEncoder(44100)
+    encoder.add(samples)
+    blob = MagicMock()
+    blob.download_as_bytes.return_value = encoder.finish()
+    audio_proxy.bucket.get_blob = Mock(return_value=blob)
+
+    audio = get_decoded_audio("dev/a.wav", "compressed/rec1.wdz")
+    assert audio["data"] == make_wav(samples)
+
+    audio_proxy.bucket.get_blob = Mock(return_value=None)
+    assert get_audio_object("dev/a.wav")["data"] == make_wav(samples)
+    assert get_decoded_audio("dev/b.wav", "compressed/rec2.wdz") is None
@@ -0,0 +1,94 @@
+"""
+test_auth_utils.py
+
+Tests token verification and the verified token cache.
+"""
+
+import sys
+import os
+import time
+from unittest.mock import patch, Mock
+import pytest
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+sys.modules["firestore"] = Mock(db=Mock())
+
+import auth_utils
+
+
+def make_request(token: str):
+    """
+    Creates a mocked request carrying a bearer token.
+
+    Input:
+        token (str): The token to send
+
+    Output:
+        Mocked request
+    """
+    request = Mock()
+    request.headers = {"Authorization": f"Bearer {token}"}
+    return request
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    """
+    Gives every test an empty token cache.
+    """
+    auth_utils.token_cache.clear()
+    yield
+    auth_utils.token_cache.clear()
+
+
+@patch("auth_utils.auth.verify_id_token")
+def test_repeat_token_is_verified_once(mock_verify):
+    """
+    Tests that a token is only verified with Firebase the first time it is seen.
+    """
+    mock_verify.return_value = {"uid": "user1", "exp": time.time() + 3600}
+
+    assert auth_utils.verify_token(make_request("tokenA")) == "user1"
+    assert auth_utils.verify_token(make_request("tokenA")) == "user1"
+
+    mock_verify.assert_called_once_with("tokenA")
+    assert auth_utils.token_cache.stats()["hits"] == 1
+    assert auth_utils.token_cache.stats()["misses"] == 1
+
+
+@patch("auth_utils.auth.verify_id_token")
+def test_expired_token_is_verified_again(mock_verify):
+    """
+    Tests that cached tokens are not used past their exp claim.
+    """
+    mock_verify.return_value = {"uid": "user1", "exp": time.time() - 1}
+
+    auth_utils.verify_token(make_request("tokenA"))
+    auth_utils.verify_token(make_request("tokenA"))
+
+    assert mock_verify.call_count == 2
+
+
+@patch("auth_utils.auth.verify_id_token", side_effect=ValueError("bad signature"))
+def test_invalid_token_is_rejected(mock_verify):
+    """
+    Tests that invalid tokens raise a 401 and are not cached.
+    """
+    with pytest.raises(HTTPException) as exc_info:
+        auth_utils.verify_token(make_request("bad"))
+
+    assert exc_info.value.status_code == 401
+    assert auth_utils.token_cache.stats()["size"] == 0
+
+
+def test_missing_header_is_rejected():
+    """
+    Tests that requests without a bearer token raise a 401.
+    """
+    request = Mock()
+    request.headers = {}
+    with pytest.raises(HTTPException) as exc_info:
+        auth_utils.verify_token(request)
+    assert exc_info.value.status_code == 401
@@ -0,0 +1,72 @@
+"""
+test_benchmarks.py
+
+Runs the offline benchmark suite at a small size and checks the call counts
+that should not grow with data size, so regressions fail the test run.
+"""
+
+import sys
+import os
+import json
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_benchmark_call_counts(tmp_path):
+    """
+    Tests that the benchmark suite runs offline and that the endpoints make
+    the expected number of Firestore and Storage calls.
+    """
+    output = tmp_path / "results.json"
+    subprocess.run([sys.executable, "-m", "benchmarks.run", "--sizes", "2000", "--devices", "20",
+                    "--repeat", "2", "--json", str(output)],
+                   cwd=BACKEND_DIR, check=True, capture_output=True, timeout=120)
+    results = {result["name"]: result["rpcs"] for result in json.loads(output.read_text())}
+
+    assert results["GET /recordings/compile (304)"] == {
+        "firestore.aggregate": 1, "firestore.documents_read": 1, "firestore.query": 1}
+    assert results["GET /recordings/compile?limit=50"]["firestore.documents_read"] == 51
+    assert results["PUT /recordings/update-view"] == {"firestore.write": 1}
+    assert results["GET /recordings/{id}/waveform"] == {}
+    assert results["sync_new_files(device) idle"]["storage.list"] <= 4
+    # One batch, plus taking and releasing the sync lease, and one write to
+    # advance the watermark. Objects already synced at the watermark are not
+    # written again, so no batch conflicts and falls back to reading.
+    new_files = results["sync_new_files() 100 new"]
+    assert new_files["firestore.commit"] == 3
+    assert new_files["firestore.write"] == 1
+    assert "firestore.get_all" not in new_files
+    # An idle sync only takes and releases the lease
+    assert results["sync_new_files() idle"]["firestore.commit"] == 2
+    assert "firestore.write" not in results["sync_new_files() idle"]
+    notification = results["POST /notifications/storage"]
+    assert "storage.list" not in notification
+    assert notification["storage.metadata"] == 1
+    assert notification["firestore.write"] == 2
+    # The recording is claimed before it is processed
+    assert notification["firestore.commit"] == 1
+    # Each new recording is listed once, claimed once and downloaded once,
+    # and the copies processing stores are not synced as recordings
+    ingest = results["ingest_new_recordings() 10 new"]
+    assert ingest["firestore.query"] == 1
+    assert ingest["firestore.documents_read"] == 10
+    assert ingest["storage.download"] == 10
+
+
+def test_startup_creates_no_clients(tmp_path):
+    """
+    Tests that importing the app makes no Firebase calls and stays under the
+    startup target, and that initialize() creates each client once.
+    """
+    output = tmp_path / "results.json"
+    subprocess.run([sys.executable, "-m", "benchmarks.run", "--sizes", "10", "--devices", "1",
+                    "--repeat", "1", "--json", str(output)],
+                   cwd=BACKEND_DIR, check=True, capture_output=True, timeout=120)
+    results = {result["name"]: result for result in json.loads(output.read_text())}
+
+    startup = results["startup: import main"]
+    assert startup["rpcs"] == {}
+    assert startup["p50_ms"] < startup["target_ms"]
+    assert results["startup: firestore.initialize()"]["rpcs"] == {
+        "firebase.initialize_app": 1, "firestore.client": 1, "storage.client": 1}
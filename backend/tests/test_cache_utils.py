@@ -0,0 +1,118 @@
+"""
+test_cache_utils.py
+
+Tests the TTL/LRU cache and single-flight call coalescing.
+"""
+
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cache_utils import TTLCache, SingleFlight
+
+
+class FakeClock:
+    """
+    Manually advanced clock for expiry tests.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire():
+    """
+    Tests that entries expire at their explicit time or after the default ttl.
+    """
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("default", 1)
+    cache.set("explicit", 2, expires_at=1002)
+
+    clock.now = 1003
+    assert cache.get("default") == 1
+    assert cache.get("explicit") is None
+
+    clock.now = 1006
+    assert cache.get("default") is None
+
+
+def test_least_recently_used_is_evicted():
+    """
+    Tests that the least recently used entry is evicted when the cache is full.
+    """
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_invalidate_and_stats():
+    """
+    Tests invalidation and the hit/miss counters.
+    """
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    cache.invalidate("a")
+    assert cache.get("a") is None
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 0, "maxsize": 2}
+
+
+def test_single_flight_shares_concurrent_calls():
+    """
+    Tests that callers arriving while a call runs share its result, and
+    that later calls run again.
+    """
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_sync():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return len(calls)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flights.do, "all", slow_sync)
+        started.wait(5)
+        followers = [pool.submit(flights.do, "all", slow_sync) for _ in range(3)]
+        # Give the followers time to join the running call
+        time.sleep(0.2)
+        assert flights.in_flight("all")
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert results == [1, 1, 1, 1]
+    assert flights.do("all", slow_sync) == 2
+
+
+def test_single_flight_shares_exceptions():
+    """
+    Tests that a failed call raises for its caller and is not remembered.
+    """
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError("listing failed")
+
+    with pytest.raises(RuntimeError):
+        flights.do("all", fail)
+    assert not flights.in_flight("all")
+    assert flights.do("all", lambda: "ok") == "ok"
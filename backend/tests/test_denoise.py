@@ -0,0 +1,66 @@
+"""
+test_denoise.py
+
+Tests the band-pass and spectral gate denoise stage.
+"""
+
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from denoise import bandpass_denoise, clean_recording
+from audio_analysis import parse_wav_header
+
+SAMPLE_RATE = 44100
+
+
+def make_heartbeat(seconds: int = 5):
+    """
+    Builds 100 Hz beats once a second over a 2 kHz tone and white noise.
+
+    Output:
+        (np.ndarray, np.ndarray, np.ndarray): Time, the clean beats and the
+        noisy int16 recording
+    """
+    t = np.arange(SAMPLE_RATE * seconds) / SAMPLE_RATE
+    beats = ((t % 1) < 0.1) * np.sin(2 * np.pi * 100 * t) * 8000
+    noise = 2000 * np.sin(2 * np.pi * 2000 * t) + np.random.default_rng(0).normal(0, 300, t.size)
+    return t, beats, np.clip(beats + noise, -32768, 32767).astype(np.int16)
+
+
+def test_out_of_band_tone_is_removed():
+    """
+    Tests that energy above the band is removed.
+    """
+    _, _, samples = make_heartbeat()
+    cleaned = bandpass_denoise(samples, SAMPLE_RATE)
+
+    freqs = np.fft.rfftfreq(samples.size, 1 / SAMPLE_RATE)
+    tone = np.argmin(np.abs(freqs - 2000))
+    assert np.abs(np.fft.rfft(cleaned))[tone] < 1e-3 * np.abs(np.fft.rfft(samples))[tone]
+
+
+def test_beats_kept_and_gaps_quieted():
+    """
+    Tests that the beats survive while noise between them is attenuated.
+    """
+    t, beats, samples = make_heartbeat()
+    cleaned = bandpass_denoise(samples, SAMPLE_RATE)
+
+    loud = (t % 1) < 0.1
+    quiet = (t % 1) > 0.3
+    assert np.corrcoef(cleaned[loud], beats[loud])[0, 1] > 0.99
+    assert cleaned[quiet].std() < 0.1 * samples[quiet].std()
+
+
+def test_clean_recording_is_valid_wav():
+    """
+    Tests that the cleaned output is a WAV of the same length, including
+    recordings shorter than one frame and empty ones.
+    """
+    for count in (0, 100, 10000):
+        data = clean_recording(np.ones(count, dtype=np.int16), SAMPLE_RATE)
+        header = parse_wav_header(data[:44], len(data))
+        assert header["data_bytes"] == 2 * count
@@ -0,0 +1,579 @@
+"""
+test_firestore.py
+
+Tests the storage to Firestore sync functions.
+"""
+
+import sys
+import os
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, Mock
+import pytest
+from google.api_core.exceptions import AlreadyExists
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(BACKEND_DIR)
+
+from denoise import CLEANED_PREFIX, cleaned_path
+from audio_codec import COMPRESSED_PREFIX, compressed_path
+from waveform import WAVEFORM_PREFIX, waveform_path
+
+
+def load_firestore_module():
+    """
+    Loads the real firestore.py with firebase_admin mocked so no connection
+    to the Firebase project is made.
+
+    Output:
+        The loaded firestore module.
+    """
+    mock_firebase = Mock()
+    spec = importlib.util.spec_from_file_location(
+        "firestore_under_test", os.path.join(BACKEND_DIR, "firestore.py"))
+    module = importlib.util.module_from_spec(spec)
+    with patch.dict(sys.modules, {"firebase_admin": mock_firebase}), \
+         patch.dict(os.environ):
+        spec.loader.exec_module(module)
+    return module
+
+
+def make_blob(name: str, minute: int):
+    """
+    Creates a mocked storage blob.
+
+    Input:
+        name (str): Object name
+        minute (int): Minute of the object's update time
+
+    Output:
+        Mocked blob
+    """
+    blob = Mock()
+    blob.name = name
+    blob.updated = datetime(2025, 5, 1, 12, minute, tzinfo=timezone.utc)
+    return blob
+
+
+@pytest.fixture
+def firestore_module():
+    """
+    Provides the firestore module with mocked db and bucket clients.
+
+    Output:
+        The firestore module
+    """
+    module = load_firestore_module()
+    module.db = Mock()
+    module.bucket = Mock()
+    module.bucket.name = "test-bucket"
+    return module
+
+
+def set_blobs(module, pages):
+    """
+    Makes the mocked bucket list the given pages of blobs.
+
+    Input:
+        module: firestore module under test
+        pages (list): List of pages, each a list of blobs
+    """
+    module.bucket.list_blobs.return_value.pages = iter(pages)
+
+
+def test_sync_skips_blobs_older_than_watermark(firestore_module):
+    """
+    Tests that the incremental sync only checks and adds objects newer than
+    the watermark, and advances the watermark afterwards.
+    """
+    old = make_blob("/dev_1.wav", 1)
+    new = make_blob("/dev_2.wav", 5)
+    other = make_blob("/notes.txt", 6)
+    set_blobs(firestore_module, [[old], [new, other]])
+
+    watermark = datetime(2025, 5, 1, 12, 3, tzinfo=timezone.utc)
+
+    with patch.object(firestore_module, "get_sync_watermark", return_value=(watermark, set())), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        stats = firestore_module.sync_new_files()
+
+    assert stats["added"] == 1
+    mock_add.assert_called_once_with(["/dev_2.wav"])
+    mock_set.assert_called_once_with(new.updated, {"/dev_2.wav"}, None)
+
+
+def test_sync_leaves_watermark_when_nothing_newer(firestore_module):
+    """
+    Tests that objects already synced at the watermark are not written
+    again, and that the watermark is left alone when nothing newer was seen.
+    """
+    blob = make_blob("/dev_1.wav", 1)
+    set_blobs(firestore_module, [[blob]])
+
+    with patch.object(firestore_module, "get_sync_watermark",
+                      return_value=(blob.updated, {"/dev_1.wav"})), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 0, "existing": 0, "failed": 0}) as mock_add:
+        firestore_module.sync_new_files()
+
+    mock_add.assert_called_once_with([])
+    mock_set.assert_not_called()
+    firestore_module.db.collection.return_value.stream.assert_not_called()
+
+
+def test_sync_writes_while_listing(firestore_module):
+    """
+    Tests that new recordings are written in groups of SYNC_FLUSH_FILES as
+    storage is listed, and that the statistics and watermark cover them all.
+    """
+    blobs = [make_blob(f"/dev_{minute}.wav", minute) for minute in range(1, 6)]
+    set_blobs(firestore_module, [blobs[:3], blobs[3:]])
+    written = []
+
+    def add_recordings(file_paths):
+        written.append(list(file_paths))
+        return {"added": len(file_paths), "existing": 0, "failed": 0, "seconds": 1.0}
+
+    with patch.object(firestore_module, "SYNC_FLUSH_FILES", 2), \
+         patch.object(firestore_module, "get_sync_watermark",
+                      return_value=(datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc), set())), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings", side_effect=add_recordings):
+        stats = firestore_module.sync_new_files()
+
+    assert written == [["/dev_1.wav", "/dev_2.wav"], ["/dev_3.wav", "/dev_4.wav"], ["/dev_5.wav"]]
+    assert stats["added"] == 5
+    assert stats["seconds"] == 3.0
+    mock_set.assert_called_once_with(blobs[-1].updated, {"/dev_5.wav"}, None)
+
+
+def test_sync_retries_new_objects_at_watermark(firestore_module):
+    """
+    Tests that an object finalized in the same instant as the watermark, but
+    not synced with it, is added and remembered with the watermark.
+    """
+    synced = make_blob("/dev_1.wav", 1)
+    same_instant = make_blob("/dev_2.wav", 1)
+    set_blobs(firestore_module, [[synced, same_instant]])
+
+    with patch.object(firestore_module, "get_sync_watermark",
+                      return_value=(synced.updated, {"/dev_1.wav"})), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        firestore_module.sync_new_files()
+
+    mock_add.assert_called_once_with(["/dev_2.wav"])
+    mock_set.assert_called_once_with(synced.updated, {"/dev_1.wav", "/dev_2.wav"}, None)
+
+
+def test_sync_lists_uploads_missed_by_previous_listing_again(firestore_module):
+    """
+    Tests that the watermark does not move past the time the listing started,
+    so an upload that finalized mid-listing under a name sorting before the
+    listing's position, and was missed, is added by the next sync.
+    """
+    now = datetime.now(timezone.utc)
+    missed = make_blob("/a_0.wav", 0)
+    missed.updated = now - timedelta(seconds=2)
+    listed = make_blob("/z_1.wav", 0)
+    listed.updated = now - timedelta(seconds=1)
+    watermark = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    state = {None: (watermark, set())}
+
+    def set_sync_watermark(last_updated, names, device_id=None):
+        state[device_id] = (last_updated, set(names))
+
+    with patch.object(firestore_module, "get_sync_watermark", side_effect=state.get), \
+         patch.object(firestore_module, "set_sync_watermark", side_effect=set_sync_watermark), \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        set_blobs(firestore_module, [[listed]])
+        firestore_module.sync_new_files()
+        assert state[None][0] < missed.updated
+        assert state[None][1] == {"/z_1.wav"}
+
+        set_blobs(firestore_module, [[missed, listed]])
+        firestore_module.sync_new_files()
+
+    assert mock_add.call_args_list[1].args == (["/a_0.wav"],)
+    assert state[None][1] == {"/a_0.wav", "/z_1.wav"}
+
+
+def test_sync_keeps_watermark_when_writes_fail(firestore_module):
+    """
+    Tests that the watermark does not advance past recordings that could not
+    be written, so the next sync retries them.
+    """
+    blob = make_blob("/dev_1.wav", 1)
+    set_blobs(firestore_module, [[blob]])
+    watermark = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+    with patch.object(firestore_module, "get_sync_watermark", return_value=(watermark, set())), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 0, "failed": 1}):
+        firestore_module.sync_new_files()
+
+    mock_set.assert_not_called()
+
+
+def test_first_sync_compares_by_path(firestore_module):
+    """
+    Tests that a sync with no watermark is seeded by a reconcile, so a
+    recording created before ids were derived from paths is not duplicated.
+    """
+    legacy = make_blob("/dev_1.wav", 1)
+    new = make_blob("/dev_2.wav", 2)
+    set_blobs(firestore_module, [[legacy, new]])
+
+    existing = Mock()
+    existing.to_dict.return_value = {"file_path": "/dev_1.wav"}
+    firestore_module.db.collection.return_value.select.return_value.stream.return_value = [existing]
+
+    with patch.object(firestore_module, "get_sync_watermark", return_value=(None, set())), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        firestore_module.sync_new_files()
+
+    mock_add.assert_called_once_with(["/dev_2.wav"])
+    mock_set.assert_called_once_with(new.updated, {"/dev_2.wav"}, None)
+
+
+def test_reconcile_adds_missing_files(firestore_module):
+    """
+    Tests that a full reconcile adds every object missing from Firestore and
+    resets the watermark to the newest object.
+    """
+    first = make_blob("/dev_1.wav", 1)
+    second = make_blob("/dev_2.wav", 2)
+    set_blobs(firestore_module, [[first, second]])
+
+    existing = Mock()
+    existing.to_dict.return_value = {"file_path": "/dev_1.wav"}
+    firestore_module.db.collection.return_value.select.return_value.stream.return_value = [existing]
+
+    with patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        firestore_module.reconcile_all_files()
+
+    mock_add.assert_called_once_with(["/dev_2.wav"])
+    mock_set.assert_called_once_with(second.updated, {"/dev_2.wav"}, None)
+
+
+def test_sync_after_processing_adds_nothing(firestore_module):
+    """
+    Tests that the copies processing stores next to a recording, including
+    cleaned copies stored as .wav before they were renamed, are never
+    synced as recordings of their own.
+    """
+    recording = make_blob("/dev_1.wav", 1)
+    recording_id = firestore_module.recording_id_for_path(recording.name)
+    derived = [make_blob(name, 2) for name in (
+        cleaned_path(recording_id), f"{CLEANED_PREFIX}{recording_id}.wav",
+        compressed_path(recording_id), waveform_path(recording_id))]
+    set_blobs(firestore_module, [[recording, *derived]])
+
+    with patch.object(firestore_module, "get_sync_watermark",
+                      return_value=(recording.updated, {"/dev_1.wav"})), \
+         patch.object(firestore_module, "set_sync_watermark"), \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 0, "existing": 0, "failed": 0}) as mock_add:
+        firestore_module.sync_new_files()
+
+    mock_add.assert_called_once_with([])
+    assert set(firestore_module.DERIVED_PREFIXES) == {
+        CLEANED_PREFIX, COMPRESSED_PREFIX, WAVEFORM_PREFIX}
+
+
+def test_build_recording_doc(firestore_module):
+    """
+    Tests that new recording documents point at the public storage URL.
+    """
+    doc = firestore_module._build_recording_doc("/dev_1.wav")
+    assert doc["file_path"] == "/dev_1.wav"
+    assert doc["viewed"] is False
+    assert doc["processingAttempts"] == 0
+    assert doc["wavFileURL"].endswith("/b/test-bucket/o/%2Fdev_1.wav?alt=media")
+
+
+def test_add_recordings_batches_writes(firestore_module):
+    """
+    Tests that new recordings are written in batches no larger than the
+    Firestore limit and that throughput is reported.
+    """
+    firestore_module.WRITE_BATCH_SIZE = 2
+    files = [f"/dev_{i}.wav" for i in range(5)]
+
+    stats = firestore_module.add_recordings(files)
+
+    assert stats["added"] == 5
+    assert stats["failed"] == 0
+    assert firestore_module.db.batch.return_value.commit.call_count == 3
+    assert stats["docs_per_second"] > 0
+
+
+def test_add_recordings_retries_then_reports_failures(firestore_module):
+    """
+    Tests that a failing batch is retried and its recordings are counted as
+    failed once the attempts run out.
+    """
+    firestore_module.RETRY_BACKOFF_SECONDS = 0
+    firestore_module.db.batch.return_value.commit.side_effect = RuntimeError("unavailable")
+
+    stats = firestore_module.add_recordings(["/dev_1.wav", "/dev_2.wav"])
+
+    assert stats["added"] == 0
+    assert stats["failed"] == 2
+    assert stats["existing"] == 0
+    assert firestore_module.db.batch.return_value.commit.call_count == firestore_module.WRITE_ATTEMPTS
+
+
+def test_recording_ids_are_deterministic(firestore_module):
+    """
+    Tests that the same storage path always maps to the same document id.
+    """
+    first = firestore_module.recording_id_for_path("/dev_1.wav")
+    assert first == firestore_module.recording_id_for_path("/dev_1.wav")
+    assert first != firestore_module.recording_id_for_path("/dev_2.wav")
+    assert "/" not in first
+
+
+def test_add_recordings_skips_existing(firestore_module):
+    """
+    Tests that when a batch conflicts with existing documents, the batch's
+    documents are read in one call and only the missing ones are created, in
+    a single batch.
+    """
+    firestore_module.db.batch.return_value.commit.side_effect = [AlreadyExists("exists"), None]
+    firestore_module.db.collection.return_value.document.side_effect = \
+        lambda doc_id: Mock(id=doc_id)
+    existing_id = firestore_module.recording_id_for_path("/dev_2.wav")
+    firestore_module.db.get_all.side_effect = lambda references, **kwargs: [
+        Mock(id=reference.id, exists=reference.id == existing_id) for reference in references]
+
+    stats = firestore_module.add_recordings(["/dev_1.wav", "/dev_2.wav"])
+
+    assert stats["added"] == 1
+    assert stats["existing"] == 1
+    assert stats["failed"] == 0
+    firestore_module.db.get_all.assert_called_once()
+    batch = firestore_module.db.batch.return_value
+    created = [call.args[0].id for call in batch.create.call_args_list]
+    assert created[2:] == [firestore_module.recording_id_for_path("/dev_1.wav")]
+    firestore_module.db.collection.return_value.document.return_value.create.assert_not_called()
+
+
+def test_device_id_for_path(firestore_module):
+    """
+    Tests device ID extraction for both upload layouts.
+    """
+    assert firestore_module.device_id_for_path("/s3asf017_4821.wav") == "s3asf017"
+    assert firestore_module.device_id_for_path("s3asf017_4821.wav") == "s3asf017"
+    assert firestore_module.device_id_for_path("dev_a_1.wav") == "dev_a"
+    assert firestore_module.device_id_for_path("s3asf017/2025-05-01.wav") == "s3asf017"
+    assert firestore_module.device_id_for_path("/recording.wav") == \
+        firestore_module.DEFAULT_DEVICE_ID
+
+
+def test_device_sync_lists_only_device_prefixes(firestore_module):
+    """
+    Tests that a device scoped sync lists only that device's prefixes, skips
+    other devices sharing a prefix and keeps its own watermark.
+    """
+    mine = make_blob("/dev_1.wav", 1)
+    other = make_blob("/dev_extra_2.wav", 2)
+    firestore_module.bucket.list_blobs.side_effect = lambda prefix, **kwargs: Mock(
+        pages=iter([[mine, other]] if prefix == "/dev_" else []))
+
+    watermarks = {"dev": (datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc), set())}
+
+    with patch.object(firestore_module, "get_sync_watermark", side_effect=watermarks.get), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        firestore_module.sync_new_files("dev")
+
+    prefixes = [call.kwargs["prefix"] for call in firestore_module.bucket.list_blobs.call_args_list]
+    assert prefixes == ["dev/", "/dev_", "dev_"]
+    mock_add.assert_called_once_with(["/dev_1.wav"])
+    mock_set.assert_called_once_with(mine.updated, {"/dev_1.wav"}, "dev")
+
+
+def test_device_first_sync_starts_from_bucket_watermark(firestore_module):
+    """
+    Tests that a device with no watermark of its own starts from the
+    whole-bucket watermark instead of re-adding the device's older objects.
+    """
+    old = make_blob("/dev_1.wav", 1)
+    new = make_blob("/dev_2.wav", 5)
+    firestore_module.bucket.list_blobs.side_effect = lambda prefix, **kwargs: Mock(
+        pages=iter([[old, new]] if prefix == "/dev_" else []))
+    watermarks = {None: (datetime(2025, 5, 1, 12, 3, tzinfo=timezone.utc), set()),
+                  "dev": (None, set())}
+
+    with patch.object(firestore_module, "get_sync_watermark",
+                      side_effect=lambda device_id=None: watermarks[device_id]), \
+         patch.object(firestore_module, "set_sync_watermark") as mock_set, \
+         patch.object(firestore_module, "add_recordings",
+                      return_value={"added": 1, "failed": 0}) as mock_add:
+        firestore_module.sync_new_files("dev")
+
+    mock_add.assert_called_once_with(["/dev_2.wav"])
+    mock_set.assert_called_once_with(new.updated, {"/dev_2.wav"}, "dev")
+    firestore_module.db.collection.return_value.select.assert_not_called()
+
+
+def test_build_recording_doc_sets_device(firestore_module):
+    """
+    Tests that new recording documents carry the device ID from the object name.
+    """
+    doc = firestore_module._build_recording_doc("/s3asf017_4821.wav")
+    assert doc["deviceID"] == "s3asf017"
+
+
+def test_add_recording_creates_single_document(firestore_module):
+    """
+    Tests that an uploaded recording gets its document, and that a repeat
+    upload of the same object is reported as existing.
+    """
+    doc_ref = firestore_module.db.collection.return_value.document.return_value
+    doc_ref.create.side_effect = [None, AlreadyExists("exists")]
+    recording_id = firestore_module.recording_id_for_path("/dev1_abc.wav")
+
+    assert firestore_module.add_recording("/dev1_abc.wav") == (recording_id, True)
+    assert firestore_module.add_recording("/dev1_abc.wav") == (recording_id, False)
+    assert doc_ref.create.call_args.args[0]["deviceID"] == "dev1"
+
+
+def make_lease_ref(lease):
+    """
+    Creates a mocked lease document reference.
+
+    Input:
+        lease (dict): The stored lease, None if there is none
+
+    Output:
+        Mocked document reference
+    """
+    snapshot = Mock(exists=lease is not None)
+    snapshot.to_dict.return_value = lease
+    return Mock(get=Mock(return_value=snapshot))
+
+
+def test_lease_taken_unless_held_by_another_worker(firestore_module):
+    """
+    Tests that a lease is taken when absent, expired or already ours, and
+    refused while another worker's lease is unexpired.
+    """
+    now = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    later = datetime(2025, 5, 1, 12, 5, tzinfo=timezone.utc)
+    holder = firestore_module.LEASE_HOLDER
+
+    for lease, expected in [(None, True),
+                            ({"holder": "other", "expiresAt": later}, False),
+                            ({"holder": "other", "expiresAt": now}, True),
+                            ({"holder": holder, "expiresAt": later}, True)]:
+        transaction = Mock()
+        lease_ref = make_lease_ref(lease)
+        assert firestore_module._take_lease(transaction, lease_ref, now) is expected  # pylint: disable=protected-access
+        assert transaction.set.called is expected
+
+    written = transaction.set.call_args[0][1]
+    assert written["holder"] == holder
+    assert written["expiresAt"] > now
+
+
+def test_lease_released_only_by_holder(firestore_module):
+    """
+    Tests that a worker only deletes its own lease.
+    """
+    transaction = Mock()
+    assert not firestore_module._give_up_lease(  # pylint: disable=protected-access
+        transaction, make_lease_ref({"holder": "other"}))
+    transaction.delete.assert_not_called()
+
+    lease_ref = make_lease_ref({"holder": firestore_module.LEASE_HOLDER})
+    assert firestore_module._give_up_lease(transaction, lease_ref)  # pylint: disable=protected-access
+    transaction.delete.assert_called_once_with(lease_ref)
+
+
+def test_sync_skipped_while_another_worker_holds_lease(firestore_module):
+    """
+    Tests that a sync does nothing while another worker holds its lease, and
+    releases the lease after running otherwise.
+    """
+    with patch.object(firestore_module, "acquire_sync_lease", return_value=False), \
+         patch.object(firestore_module, "_sync_new_files") as mock_sync:
+        stats = firestore_module.sync_new_files("dev")
+
+    assert stats["skipped"] is True
+    assert stats["added"] == 0
+    mock_sync.assert_not_called()
+
+    with patch.object(firestore_module, "acquire_sync_lease", return_value=True), \
+         patch.object(firestore_module, "release_sync_lease") as mock_release, \
+         patch.object(firestore_module, "_sync_new_files",
+                      side_effect=RuntimeError("listing failed")):
+        with pytest.raises(RuntimeError):
+            firestore_module.sync_new_files("dev")
+
+    mock_release.assert_called_once_with("dev")
+
+
+def test_recording_claimed_once(firestore_module):
+    """
+    Tests that a pending recording is claimed unless it is missing, already
+    processed or claimed by another worker whose claim has not expired.
+    """
+    now = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    later = datetime(2025, 5, 1, 12, 5, tzinfo=timezone.utc)
+    holder = firestore_module.LEASE_HOLDER
+
+    for recording, expected in [(None, False),
+                                ({"processed": False}, True),
+                                ({"processed": True}, False),
+                                ({"processed": False, "claimedBy": "other",
+                                  "claimExpiresAt": later}, False),
+                                ({"processed": False, "claimedBy": "other",
+                                  "claimExpiresAt": now}, True),
+                                ({"processed": False, "claimedBy": holder,
+                                  "claimExpiresAt": later}, True)]:
+        transaction = Mock()
+        recording_ref = make_lease_ref(recording)
+        assert firestore_module._take_claim(  # pylint: disable=protected-access
+            transaction, recording_ref, now) is expected
+        assert transaction.update.called is expected
+
+    written = transaction.update.call_args[0][1]
+    assert written["claimedBy"] == holder
+    assert written["claimExpiresAt"] > now
+
+
+def test_failed_recordings_retried_with_backoff(firestore_module):
+    """
+    Tests that every claim counts as an attempt, and that a recording is only
+    claimed again once the backoff after its last attempt has passed.
+    """
+    now = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    retry = firestore_module.PROCESS_RETRY_SECONDS
+    holder = firestore_module.LEASE_HOLDER
+
+    for attempts, seconds_ago, expected in [(1, retry - 1, False), (1, retry, True),
+                                            (3, 3 * retry, False), (3, 4 * retry, True)]:
+        transaction = Mock()
+        recording_ref = make_lease_ref({
+            "processed": False, "claimedBy": holder, "claimExpiresAt": now,
+            "processingAttempts": attempts,
+            "lastAttemptAt": now - timedelta(seconds=seconds_ago)})
+        assert firestore_module._take_claim(  # pylint: disable=protected-access
+            transaction, recording_ref, now) is expected
+
+    written = transaction.update.call_args[0][1]
+    assert written["processingAttempts"] == 4
+    assert written["lastAttemptAt"] == now
@@ -0,0 +1,72 @@
+"""
+test_heart_rate.py
+
+Tests heart rate estimation from the envelope autocorrelation.
+"""
+
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from heart_rate import HeartRateEstimator, estimate_bpm
+
+SAMPLE_RATE = 44100
+
+
+def make_heart_sounds(bpm: float, seconds: int = 20) -> np.ndarray:
+    """
+    Builds S1/S2 like bursts at the given rate over background noise.
+
+    Input:
+        bpm (float): Beats per minute
+        seconds (int): Length of the recording
+
+    Output:
+        np.ndarray: int16 samples
+    """
+    period = 60 / bpm
+    t = np.arange(SAMPLE_RATE * seconds) / SAMPLE_RATE
+    phase = t % period
+    s1 = (phase < 0.08) * np.sin(2 * np.pi * 60 * t) * 8000
+    s2 = ((phase > 0.3 * period) & (phase < 0.3 * period + 0.06)) \
+        * np.sin(2 * np.pi * 90 * t) * 5000
+    noise = np.random.default_rng(0).normal(0, 500, t.size)
+    return (s1 + s2 + noise).astype(np.int16)
+
+
+@pytest.mark.parametrize("bpm", [45, 72, 110, 180])
+def test_estimates_heart_rate(bpm):
+    """
+    Tests that the estimate is within 1 BPM with high confidence, including
+    across chunk boundaries.
+    """
+    estimator = HeartRateEstimator(SAMPLE_RATE)
+    for chunk in np.array_split(make_heart_sounds(bpm), 7):
+        estimator.add(chunk)
+    summary = estimator.summary()
+
+    assert summary["heartRateBpm"] == pytest.approx(bpm, abs=1)
+    assert summary["heartRateConfidence"] > 0.8
+
+
+def test_noise_has_low_confidence():
+    """
+    Tests that a recording without beats gets a low confidence.
+    """
+    estimator = HeartRateEstimator(SAMPLE_RATE)
+    estimator.add(np.random.default_rng(1).normal(0, 500, SAMPLE_RATE * 20).astype(np.int16))
+    assert estimator.summary()["heartRateConfidence"] < 0.3
+
+
+def test_short_or_silent_recordings_have_no_estimate():
+    """
+    Tests that too short or silent recordings are not estimated.
+    """
+    assert estimate_bpm(np.ones(100), 100) == (None, 0.0)
+
+    estimator = HeartRateEstimator(SAMPLE_RATE)
+    estimator.add(np.zeros(SAMPLE_RATE * 10, dtype=np.int16))
+    assert estimator.summary() == {"heartRateBpm": None, "heartRateConfidence": 0.0}
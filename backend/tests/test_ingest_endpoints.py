@@ -0,0 +1,252 @@
+"""
+test_ingest_endpoints.py
+
+Tests the device upload and storage notification endpoints.
+"""
+
+import sys
+import os
+from unittest.mock import patch, Mock
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from fastapi import FastAPI
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+from ingest_endpoints import router
+import storage_notifications
+import upload_ingest
+from audio_analysis import WavFormatError
+from test_audio_analysis import make_wav, make_firmware_wav
+
+# FastAPI test app
+app = FastAPI()
+app.include_router(router)
+
+WAV = make_wav(np.arange(1000, dtype=np.int16))
+
+finalize_upload = upload_ingest.finalize_upload
+
+
+@pytest.fixture
+def mocked_app():
+    """
+    Pytest fixture that returns a TestClient instance for the FastAPI app
+    with the ingest endpoints router included.
+    """
+    return TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def mock_upload_storage(tmp_path):
+    """
+    Simulates Firebase authentication, a user owning device dev1, and
+    storage, spooling to a temporary directory.
+
+    Output:
+        dict: The mocked finalize_upload and process_upload functions
+    """
+    with patch("ingest_endpoints.verify_token", return_value="123456789"), \
+         patch("ingest_endpoints.get_user_device_ids", return_value={"dev1"}), \
+         patch("upload_ingest.SPOOL_DIR", str(tmp_path)), \
+         patch("ingest_endpoints.upload_ingest.finalize_upload",
+               return_value=("rec1", True)) as mock_finalize, \
+         patch("ingest_endpoints.upload_ingest.process_upload") as mock_process:
+        yield {"finalize": mock_finalize, "process": mock_process}
+
+
+def test_single_upload(mocked_app, mock_upload_storage):
+    """
+    Ensures a whole recording in one body is stored and processed.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+        mock_upload_storage: mocked storage functions
+    """
+    response = mocked_app.post("/ingest", params={"deviceID": "dev1"}, content=WAV)
+
+    assert response.status_code == 201
+    assert response.json()["recordingID"] == "rec1"
+    path, file_path = mock_upload_storage["finalize"].call_args.args
+    assert file_path == f"/dev1_{response.headers['X-Upload-ID']}.wav"
+    with open(path, "rb") as spool:
+        assert spool.read() == WAV
+    mock_upload_storage["process"].assert_called_once_with("rec1", file_path, path)
+
+
+def test_resumable_upload(mocked_app, mock_upload_storage):
+    """
+    Ensures pieces are acknowledged with 308 until complete, that a status
+    query reports the bytes received, and that an out of order piece is
+    answered with where to resume.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+        mock_upload_storage: mocked storage functions
+    """
+    total = len(WAV)
+
+    def send(start, end):
+        return mocked_app.post("/ingest", params={"deviceID": "dev1"},
+                               content=WAV[start:end + 1],
+                               headers={"X-Upload-ID": "abc",
+                                        "Content-Range": f"bytes {start}-{end}/{total}"})
+
+    response = send(0, 999)
+    assert response.status_code == 308
+    assert response.headers["Range"] == "bytes=0-999"
+
+    response = mocked_app.post("/ingest", params={"deviceID": "dev1"},
+                               headers={"X-Upload-ID": "abc",
+                                        "Content-Range": f"bytes */{total}"})
+    assert response.status_code == 308
+    assert response.headers["Range"] == "bytes=0-999"
+
+    response = send(1500, total - 1)
+    assert response.status_code == 308
+    assert response.headers["Range"] == "bytes=0-999"
+    mock_upload_storage["finalize"].assert_not_called()
+
+    response = send(1000, total - 1)
+    assert response.status_code == 201
+    path, file_path = mock_upload_storage["finalize"].call_args.args
+    assert file_path == "/dev1_abc.wav"
+    with open(path, "rb") as spool:
+        assert spool.read() == WAV
+
+
+def test_upload_already_ingested(mocked_app, mock_upload_storage):
+    """
+    Ensures re-sending an ingested recording is not processed twice.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+        mock_upload_storage: mocked storage functions
+    """
+    mock_upload_storage["finalize"].return_value = ("rec1", False)
+    response = mocked_app.post("/ingest", params={"deviceID": "dev1"}, content=WAV,
+                               headers={"X-Upload-ID": "abc"})
+
+    assert response.status_code == 200
+    mock_upload_storage["process"].assert_not_called()
+
+
+def test_upload_rejects_bad_requests(mocked_app):
+    """
+    Ensures malformed headers, piecewise uploads without an id and oversized
+    bodies are rejected.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+    """
+    params = {"deviceID": "dev1"}
+    assert mocked_app.post("/ingest", params=params, content=WAV,
+                           headers={"Content-Range": "bytes 0-9/100"}).status_code == 400
+    assert mocked_app.post("/ingest", params=params, content=WAV,
+                           headers={"X-Upload-ID": "bad/id"}).status_code == 400
+    assert mocked_app.post("/ingest", params={"deviceID": "a/b"}, content=WAV).status_code == 400
+    assert mocked_app.post("/ingest", params=params, content=WAV[:20],
+                           headers={"X-Upload-ID": "abc",
+                                    "Content-Range": "bytes 0-9/100"}).status_code == 413
+    with patch("upload_ingest.MAX_UPLOAD_BYTES", 100):
+        assert mocked_app.post("/ingest", params=params, content=WAV).status_code == 413
+
+
+def test_upload_rejects_other_users_devices(mocked_app, mock_upload_storage, tmp_path):
+    """
+    Ensures a user cannot upload into the feed of a device that is not theirs,
+    and that nothing is spooled or stored for it.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+        mock_upload_storage: mocked storage functions
+        tmp_path: the spool directory
+    """
+    response = mocked_app.post("/ingest", params={"deviceID": "dev2"}, content=WAV)
+
+    assert response.status_code == 403
+    mock_upload_storage["finalize"].assert_not_called()
+    assert not list(tmp_path.iterdir())
+
+
+def test_upload_rejects_invalid_wav(mocked_app, mock_upload_storage):
+    """
+    Ensures a recording that is not a readable WAV is rejected.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+        mock_upload_storage: mocked storage functions
+    """
+    mock_upload_storage["finalize"].side_effect = WavFormatError("Not a WAV")
+    response = mocked_app.post("/ingest", params={"deviceID": "dev1"}, content=b"garbage")
+    assert response.status_code == 400
+
+
+def test_upload_accepts_firmware_recordings(mocked_app, mock_upload_storage):
+    """
+    Ensures a recording as the firmware uploads it, shorter than its header
+    declares, passes validation.
+
+    Input:
+        mocked_app: FastAPI test app for testing
+        mock_upload_storage: mocked storage functions
+    """
+    mock_upload_storage["finalize"].side_effect = finalize_upload
+    with patch("upload_ingest.bucket"), \
+         patch("upload_ingest.add_recording", return_value=("rec1", True)):
+        response = mocked_app.post("/ingest", params={"deviceID": "dev1"},
+                                   content=make_firmware_wav())
+
+    assert response.status_code == 201
+    mock_upload_storage["process"].assert_called_once()
+
+
+def test_storage_notification_ingests_object(mocked_app):
+    """
+    Ensures a finalize notification creates the recording and queues processing.
+    """
+    payload = storage_notifications.pubsub_push_payload("bucket1", "/dev1_abc.wav")
+    with patch("ingest_endpoints.storage_notifications.ingest_object",
+               return_value=("rec1", True)) as mock_ingest, \
+         patch("ingest_endpoints.process_claimed_recording") as mock_process:
+        response = mocked_app.post("/notifications/storage", json=payload)
+
+    assert response.status_code == 201
+    assert response.json() == {"recordingID": "rec1", "file_path": "/dev1_abc.wav"}
+    mock_ingest.assert_called_once_with("bucket1", "/dev1_abc.wav")
+    mock_process.assert_called_once_with("rec1", "/dev1_abc.wav")
+
+
+def test_storage_notification_redelivery(mocked_app):
+    """
+    Ensures a notification for an already ingested object is acknowledged
+    without processing it again.
+    """
+    payload = storage_notifications.pubsub_push_payload("bucket1", "/dev1_abc.wav")
+    with patch("ingest_endpoints.storage_notifications.ingest_object",
+               return_value=("rec1", False)), \
+         patch("ingest_endpoints.process_claimed_recording") as mock_process:
+        response = mocked_app.post("/notifications/storage", json=payload)
+
+    assert response.status_code == 200
+    mock_process.assert_not_called()
+
+
+def test_storage_notification_ignored_and_invalid(mocked_app):
+    """
+    Ensures other events are acknowledged and malformed or unauthorized
+    notifications are rejected.
+    """
+    payload = storage_notifications.pubsub_push_payload("bucket1", "/dev1_abc.wav")
+    payload["message"]["attributes"]["eventType"] = "OBJECT_DELETE"
+    assert mocked_app.post("/notifications/storage", json=payload).status_code == 204
+
+    assert mocked_app.post("/notifications/storage", content=b"not json").status_code == 400
+    assert mocked_app.post("/notifications/storage", json={"x": 1}).status_code == 400
+
+    with patch("ingest_endpoints.storage_notifications.verify_push_token", return_value=False):
+        assert mocked_app.post("/notifications/storage", json=payload).status_code == 401
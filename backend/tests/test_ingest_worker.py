@@ -0,0 +1,92 @@
+"""
+test_ingest_worker.py
+
+Tests the background recording ingest worker.
+"""
+
+import sys
+import os
+import asyncio
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+from ingest_worker import IngestWorker
+
+
+def test_worker_syncs_on_start():
+    """
+    Tests that the worker syncs once as soon as it is started.
+    """
+    sync = Mock(return_value=3)
+
+    async def run():
+        worker = IngestWorker(sync, interval=60)
+        worker.start()
+        await asyncio.sleep(0.05)
+        await worker.stop()
+        return worker
+
+    worker = asyncio.run(run())
+    sync.assert_called_once()
+    assert worker.last_result == 3
+
+
+def test_kick_triggers_another_sync():
+    """
+    Tests that kicking the worker runs a sync before the interval elapses.
+    """
+    sync = Mock(return_value=0)
+
+    async def run():
+        worker = IngestWorker(sync, interval=60)
+        worker.start()
+        await asyncio.sleep(0.05)
+        worker.kick()
+        await asyncio.sleep(0.05)
+        await worker.stop()
+
+    asyncio.run(run())
+    assert sync.call_count == 2
+
+
+def test_failed_sync_keeps_worker_running():
+    """
+    Tests that an exception raised by a sync does not stop the worker.
+    """
+    sync = Mock(side_effect=[RuntimeError("storage down"), 1])
+
+    async def run():
+        worker = IngestWorker(sync, interval=0.01)
+        worker.start()
+        await asyncio.sleep(0.1)
+        await worker.stop()
+        return worker
+
+    worker = asyncio.run(run())
+    assert sync.call_count >= 2
+    assert worker.last_result == 1
+
+
+def test_device_kick_syncs_only_that_device():
+    """
+    Tests that kicks naming devices run one device scoped sync per device
+    instead of a full sync.
+    """
+    sync = Mock(return_value=0)
+
+    async def run():
+        worker = IngestWorker(sync, interval=60)
+        worker.start()
+        await asyncio.sleep(0.05)
+        worker.kick("devA")
+        worker.kick("devB")
+        worker.kick("devA")
+        await asyncio.sleep(0.05)
+        await worker.stop()
+
+    asyncio.run(run())
+    assert [call.args for call in sync.call_args_list] == [(), ("devA",), ("devB",)]
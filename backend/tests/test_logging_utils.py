@@ -0,0 +1,47 @@
+"""
+test_logging_utils.py
+
+Tests the JSON log formatter.
+"""
+
+import sys
+import os
+import json
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from logging_utils import JsonFormatter
+
+
+def test_extra_fields_become_keys():
+    """
+    Tests that a record is one JSON object with its extra fields at the top level.
+    """
+    logger = logging.getLogger("test")
+    record = logger.makeRecord("test", logging.WARNING, __file__, 1, "Sync failed for %s",
+                               ("dev1",), None, extra={"device_id": "dev1", "failed": 3})
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["level"] == "WARNING"
+    assert entry["logger"] == "test"
+    assert entry["message"] == "Sync failed for dev1"
+    assert entry["device_id"] == "dev1"
+    assert entry["failed"] == 3
+    assert "args" not in entry
+
+
+def test_exception_is_included():
+    """
+    Tests that the traceback of a logged exception is included.
+    """
+    try:
+        raise ValueError("bad header")
+    except ValueError:
+        record = logging.getLogger("test").makeRecord(
+            "test", logging.ERROR, __file__, 1, "Failed", (), sys.exc_info())
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert "ValueError: bad header" in entry["exception"]
@@ -0,0 +1,124 @@
+"""
+test_metrics_utils.py
+
+Tests the metrics registry, RPC tracking and the /metrics endpoint.
+"""
+
+import sys
+import os
+from unittest.mock import Mock
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+sys.modules["firestore"] = Mock(db=Mock())
+
+from metrics_utils import (Counter, Histogram, Registry, track_rpc, track_pages,
+                           RPC_LATENCY, RPC_ERRORS, DOCUMENTS_READ, DOCUMENTS_WRITTEN)
+
+
+def _sample(metric, name, **labels):
+    """
+    Gets the value of one sample of a metric, 0 if it has not been recorded.
+    """
+    for sample_name, sample_labels, value in metric.samples():
+        if sample_name == name and sample_labels == labels:
+            return value
+    return 0
+
+
+def test_render_prometheus_text():
+    """
+    Tests that counters and histograms render with HELP, TYPE, escaped
+    labels and cumulative buckets.
+    """
+    registry = Registry()
+    calls = registry.register(Counter("calls_total", "Calls made.", ("kind",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ("route",),
+                                          buckets=(0.1, 1.0)))
+    calls.inc(kind='say "hi"')
+    calls.inc(2, kind='say "hi"')
+    latency.observe(0.05, route="/a")
+    latency.observe(0.5, route="/a")
+
+    lines = registry.render().splitlines()
+
+    assert lines[:3] == ["# HELP calls_total Calls made.",
+                         "# TYPE calls_total counter",
+                         'calls_total{kind="say \\"hi\\""} 3']
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 2' in lines
+    assert 'latency_seconds_sum{route="/a"} 0.55' in lines
+    assert 'latency_seconds_count{route="/a"} 2' in lines
+
+
+def test_track_rpc_counts_documents():
+    """
+    Tests that a tracked call is timed and its document counts recorded.
+    """
+    before = _sample(RPC_LATENCY, "backend_rpc_duration_seconds_count",
+                     service="firestore", operation="test_query")
+    read_before = _sample(DOCUMENTS_READ, "firestore_documents_read_total", collection="test")
+    written_before = _sample(DOCUMENTS_WRITTEN, "firestore_documents_written_total",
+                             collection="test")
+
+    with track_rpc("firestore", "test_query", "test") as rpc:
+        rpc.documents_read = 7
+        rpc.documents_written = 2
+
+    assert _sample(RPC_LATENCY, "backend_rpc_duration_seconds_count",
+                   service="firestore", operation="test_query") == before + 1
+    assert _sample(DOCUMENTS_READ, "firestore_documents_read_total",
+                   collection="test") == read_before + 7
+    assert _sample(DOCUMENTS_WRITTEN, "firestore_documents_written_total",
+                   collection="test") == written_before + 2
+
+
+def test_track_rpc_counts_errors():
+    """
+    Tests that a call that raises is counted as an error and re-raised.
+    """
+    before = _sample(RPC_ERRORS, "backend_rpc_errors_total",
+                     service="storage", operation="test_download")
+
+    with pytest.raises(RuntimeError):
+        with track_rpc("storage", "test_download"):
+            raise RuntimeError("unavailable")
+
+    assert _sample(RPC_ERRORS, "backend_rpc_errors_total",
+                   service="storage", operation="test_download") == before + 1
+
+
+def test_track_pages_times_each_page():
+    """
+    Tests that every page fetched counts as one call and running out of
+    pages does not.
+    """
+    before = _sample(RPC_LATENCY, "backend_rpc_duration_seconds_count",
+                     service="storage", operation="test_list")
+
+    pages = list(track_pages(iter([[1, 2], [3]]), "storage", "test_list"))
+
+    assert pages == [[1, 2], [3]]
+    assert _sample(RPC_LATENCY, "backend_rpc_duration_seconds_count",
+                   service="storage", operation="test_list") == before + 2
+
+
+def test_metrics_endpoint_reports_route_latency():
+    """
+    Tests that requests are recorded under their route template and exposed
+    at /metrics.
+    """
+    from main import app  # pylint: disable=import-outside-toplevel
+
+    client = TestClient(app)
+    client.get("/recordings/abc/waveform")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/recordings/{recording_id}/waveform",status="401"} 1') in response.text
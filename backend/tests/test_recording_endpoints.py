@@ -7,8 +7,10 @@ Tests all recording endpoints to ensure they exhibit expected behavior.
 
 import sys
 import os
-from unittest.mock import patch, Mock
+import asyncio
+from unittest.mock import patch, Mock, AsyncMock
 import pytest
+import numpy as np
 from fastapi.testclient import TestClient
 from fastapi import FastAPI
 
@@ -19,7 +21,9 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 mock_firestore = Mock()
 sys.modules["firestore"] = Mock(db=mock_firestore)
 
+import recording_endpoints
 from recording_endpoints import router
+from waveform import PeakPyramid, encode_pyramid
 
 # FastAPI test app
 app = FastAPI()
@@ -49,6 +53,35 @@ def mock_verify_token():
         yield
 
 
+# Automatically make every recording belong to one of the user's devices
+@pytest.fixture(autouse=True)
+def mock_recording_owner():
+    """
+    Simulates a recording on the user's device "dev"
+
+    Output:
+        Mocked recording lookup
+    """
+    with patch("recording_endpoints.recording_routes.get_recording_source",
+               return_value=("dev/a.wav", "dev")) as mock_source, \
+         patch("recording_endpoints.get_user_device_ids", return_value={"dev"}):
+        yield mock_source
+
+
+# Automatically mock the recordings version lookup used for ETags
+@pytest.fixture(autouse=True)
+def mock_recordings_version():
+    """
+    Simulates the device's recordings version marker
+
+    Output:
+        Mocked version lookup
+    """
+    with patch("recording_endpoints.recording_routes.get_recordings_version",
+               return_value="1:2025-05-01T12:00:00+00:00") as mock_version:
+        yield mock_version
+
+
 @patch("recording_endpoints.get_current_user_device", return_value="device9876")
 @patch("recording_endpoints.recording_routes.get_unviewed_recordings",
        return_value=[{"id": "9876"}])
@@ -70,6 +103,100 @@ def test_get_user_recordings_success(mock_get_recordings, mock_get_device, mocke
     mock_get_recordings.assert_called_once_with("device9876")
 
 
+@patch("recording_endpoints.get_current_user_device", return_value="device9876")
+@patch("recording_endpoints.recording_routes.get_unviewed_recordings",
+       return_value=[{"id": "9876"}])
+def test_get_user_recordings_not_modified(mock_get_recordings, mock_get_device,
+                                          mock_recordings_version, mocked_app):
+    """
+    Ensures an unchanged recording list returns 304 without reading recordings.
+
+    Input:
+        mock_get_recordings: mocked function to simulate getting recordings from the db
+        mock_get_device: mocked function to simulate getting device id from db
+        mock_recordings_version: mocked version lookup
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    first = mocked_app.get("/recordings/compile")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    second = mocked_app.get("/recordings/compile", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    mock_get_recordings.assert_called_once()
+
+    mock_recordings_version.return_value = "2:2025-05-01T12:05:00+00:00"
+    third = mocked_app.get("/recordings/compile", headers={"If-None-Match": etag})
+    assert third.status_code == 200
+    assert third.headers["ETag"] != etag
+
+
+@patch("recording_endpoints.get_current_user_device", return_value="device9876")
+@patch("recording_endpoints.recording_routes.get_recordings_page",
+       return_value=([{"id": "1"}, {"id": "2"}], "nextCursor"))
+def test_get_user_recordings_paged(mock_get_page, mock_get_device, mocked_app):
+    """
+    Ensures limit and cursor are passed through and the next cursor is returned.
+
+    Input:
+        mock_get_page: mocked function to simulate getting a page of recordings
+        mock_get_device: mocked function to simulate getting device id from db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.get("/recordings/compile", params={"limit": 2, "cursor": "abc"})
+    assert response.status_code == 200
+    assert response.json() == [{"id": "1"}, {"id": "2"}]
+    assert response.headers["X-Next-Cursor"] == "nextCursor"
+    mock_get_page.assert_called_once_with("device9876", 2, "abc")
+
+
+@patch("recording_endpoints.get_current_user_device", return_value="device9876")
+@patch("recording_endpoints.recording_routes.get_unviewed_recordings",
+       return_value=[{"id": str(index), "deviceID": "device9876"} for index in range(200)])
+def test_get_user_recordings_compressed(mock_get_recordings, mock_get_device, mocked_app):
+    """
+    Ensures large recording lists are gzipped for clients that accept it.
+
+    Input:
+        mock_get_recordings: mocked function to simulate getting recordings from the db
+        mock_get_device: mocked function to simulate getting device id from db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.get("/recordings/compile", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "ETag" in response.headers
+    assert response.json() == mock_get_recordings.return_value
+
+
+@patch("recording_endpoints.get_current_user_device", return_value="device9876")
+@patch("recording_endpoints.recording_routes.get_recordings_page",
+       side_effect=ValueError("Invalid cursor"))
+def test_get_user_recordings_bad_cursor(mock_get_page, mock_get_device, mocked_app):
+    """
+    Ensures a malformed cursor is rejected.
+
+    Input:
+        mock_get_page: mocked function to simulate getting a page of recordings
+        mock_get_device: mocked function to simulate getting device id from db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.get("/recordings/compile", params={"limit": 2, "cursor": "bad"})
+    assert response.status_code == 400
+
+
 @patch("recording_endpoints.recording_routes.update_recording_view")
 def test_update_recording_view_success(mock_update_view, mocked_app):
     """
@@ -148,3 +275,370 @@ def test_update_recording_notes_success(mock_update_notes, mocked_app):
     assert response.status_code == 200
     assert response.json() == {"message": "Current recording note updated successfully"}
     mock_update_notes.assert_called_once_with("testRecording", "Updated notes")
+
+
+@patch("recording_endpoints.recording_routes.update_recording_title", return_value=False)
+def test_update_recording_title_missing(mock_update_title, mocked_app):
+    """
+    Ensures updating a recording that does not exist returns 404.
+
+    Input:
+        mock_update_title: mocked function to simulate updating title in db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.put("/recordings/update-title", json={
+        "recordingID": "missing",
+        "title": "New Title"
+    })
+    assert response.status_code == 404
+
+
+@patch("recording_endpoints.recording_routes.update_recording", return_value=True)
+def test_patch_recording_success(mock_update, mocked_app):
+    """
+    Ensures several fields can be updated in one request and one write.
+
+    Input:
+        mock_update: mocked function to simulate updating the recording in db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.patch("/recordings/testRecording", json={
+        "sessionTitle": "New Title",
+        "notes": "Updated notes",
+        "viewed": True
+    })
+    assert response.status_code == 200
+    mock_update.assert_called_once_with("testRecording", {
+        "sessionTitle": "New Title",
+        "notes": "Updated notes",
+        "viewed": True
+    })
+
+
+@patch("recording_endpoints.recording_routes.update_recording")
+def test_patch_recording_invalid_field(mock_update, mocked_app):
+    """
+    Ensures fields that are not editable, or have the wrong type, are rejected.
+
+    Input:
+        mock_update: mocked function to simulate updating the recording in db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.patch("/recordings/testRecording", json={"deviceID": "other"})
+    assert response.status_code == 400
+
+    response = mocked_app.patch("/recordings/testRecording", json={"viewed": "yes"})
+    assert response.status_code == 400
+    mock_update.assert_not_called()
+
+
+@patch("recording_endpoints.recording_routes.update_recording", return_value=False)
+def test_patch_recording_missing(mock_update, mocked_app):
+    """
+    Ensures patching a recording that does not exist returns 404.
+
+    Input:
+        mock_update: mocked function to simulate updating the recording in db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.patch("/recordings/missing", json={"viewed": True})
+    assert response.status_code == 404
+
+
+@patch("recording_endpoints.recording_routes.update_recording")
+@patch("recording_endpoints.recording_routes.get_recording_source",
+       return_value=("other/a.wav", "other"))
+def test_patch_other_users_recording(mock_source, mock_update, mocked_app):
+    """
+    Ensures a recording on a device that is not the user's is not updated.
+
+    Input:
+        mock_source: mocked function to simulate the recording lookup
+        mock_update: mocked function to simulate updating the recording in db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.patch("/recordings/rec1", json={"notes": "mine now"})
+    assert response.status_code == 404
+    mock_update.assert_not_called()
+
+
+@patch("recording_endpoints.recording_routes.get_recording_devices",
+       return_value={"rec1": "dev", "rec2": "dev"})
+@patch("recording_endpoints.recording_routes.update_recordings_bulk",
+       return_value={"rec1": True, "rec2": False})
+def test_bulk_update_recordings(mock_bulk_update, mock_devices, mocked_app):
+    """
+    Ensures many recordings can be marked viewed in one request with a
+    result per recording.
+
+    Input:
+        mock_bulk_update: mocked function to simulate the batched update in db
+        mock_devices: mocked function to simulate the recordings' device lookup
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.put("/recordings/bulk-update", json={
+        "recordingIDs": ["rec1", "rec2"],
+        "fields": {"viewed": True}
+    })
+    assert response.status_code == 200
+    assert response.json() == {
+        "results": [{"recordingID": "rec1", "updated": True},
+                    {"recordingID": "rec2", "updated": False}],
+        "updated": 1,
+        "missing": 1
+    }
+    mock_bulk_update.assert_called_once_with(["rec1", "rec2"], {"viewed": True})
+
+
+@patch("recording_endpoints.recording_routes.get_recording_devices",
+       return_value={"rec1": "dev", "rec2": "other"})
+@patch("recording_endpoints.recording_routes.update_recordings_bulk",
+       return_value={"rec1": True})
+def test_bulk_update_skips_other_users_recordings(mock_bulk_update, mock_devices, mocked_app):
+    """
+    Ensures recordings on devices that are not the user's, or that do not
+    exist, are reported as not updated and never written.
+
+    Input:
+        mock_bulk_update: mocked function to simulate the batched update in db
+        mock_devices: mocked function to simulate the recordings' device lookup
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.put("/recordings/bulk-update", json={
+        "recordingIDs": ["rec1", "rec2", "rec3"],
+        "fields": {"notes": "mine now"}
+    })
+    assert response.status_code == 200
+    assert response.json()["results"] == [{"recordingID": "rec1", "updated": True},
+                                          {"recordingID": "rec2", "updated": False},
+                                          {"recordingID": "rec3", "updated": False}]
+    mock_bulk_update.assert_called_once_with(["rec1"], {"notes": "mine now"})
+
+
+@patch("recording_endpoints.recording_routes.update_recordings_bulk")
+def test_bulk_update_recordings_invalid(mock_bulk_update, mocked_app):
+    """
+    Ensures bulk updates without ids or with invalid fields are rejected.
+
+    Input:
+        mock_bulk_update: mocked function to simulate the batched update in db
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.put("/recordings/bulk-update", json={"fields": {"viewed": True}})
+    assert response.status_code == 400
+
+    response = mocked_app.put("/recordings/bulk-update", json={
+        "recordingIDs": ["rec1"],
+        "fields": {"deviceID": "other"}
+    })
+    assert response.status_code == 400
+    mock_bulk_update.assert_not_called()
+
+
+@patch("recording_endpoints.recording_routes.get_waveform")
+def test_get_recording_waveform(mock_get_waveform, mocked_app):
+    """
+    Ensures a single waveform level is returned with headers describing it.
+
+    Input:
+        mock_get_waveform: mocked function to simulate reading the stored pyramid
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    pyramid = PeakPyramid(44100)
+    pyramid.add(np.zeros(44100, dtype=np.int16))
+    mock_get_waveform.return_value = encode_pyramid(pyramid)
+
+    response = mocked_app.get("/recordings/testRecording/waveform", params={"level": 1})
+    assert response.status_code == 200
+    assert response.headers["X-Samples-Per-Peak"] == "1024"
+    assert len(response.content) == 2 * int(response.headers["X-Peak-Count"])
+
+    response = mocked_app.get("/recordings/testRecording/waveform", params={"level": 99})
+    assert response.status_code == 400
+
+    mock_get_waveform.return_value = b"WV"
+    response = mocked_app.get("/recordings/testRecording/waveform")
+    assert response.status_code == 400
+
+
+@patch("recording_endpoints.recording_routes.get_waveform", return_value=None)
+def test_get_recording_waveform_missing(mock_get_waveform, mocked_app):
+    """
+    Ensures recordings without a stored pyramid return 404.
+
+    Input:
+        mock_get_waveform: mocked function to simulate reading the stored pyramid
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.get("/recordings/testRecording/waveform")
+    assert response.status_code == 404
+
+
+@patch("recording_endpoints.audio_proxy.get_audio_object")
+def test_stream_recording_audio_range(mock_get_audio, mocked_app):
+    """
+    Ensures audio is streamed whole without a Range header, partially with
+    one, and that ranges past the end are rejected.
+
+    Input:
+        mock_get_audio: mocked function to simulate the storage object lookup
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    data = bytes(range(100))
+    mock_get_audio.return_value = {"size": len(data), "content_type": "audio/wav", "data": data}
+
+    response = mocked_app.get("/recordings/testRecording/audio")
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    response = mocked_app.get("/recordings/testRecording/audio", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == data[10:20]
+    assert response.headers["Content-Range"] == "bytes 10-19/100"
+
+    response = mocked_app.get("/recordings/testRecording/audio", headers={"Range": "bytes=200-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */100"
+
+
+@patch("recording_endpoints.audio_proxy.get_decoded_audio")
+@patch("recording_endpoints.audio_proxy.get_audio_object")
+def test_stream_recording_audio_compressed(mock_get_audio, mock_decoded, mocked_app):
+    """
+    Ensures the compressed copy can be requested directly and that a WAV
+    missing from storage is decoded from it.
+
+    Input:
+        mock_get_audio: mocked function to simulate the storage object lookup
+        mock_decoded: mocked function to simulate decoding the compressed copy
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    mock_get_audio.return_value = {"size": 4, "content_type": "application/octet-stream",
+                                   "data": b"WVDZ"}
+    response = mocked_app.get("/recordings/rec1/audio", params={"format": "compressed"})
+    assert response.status_code == 200
+    assert response.content == b"WVDZ"
+    mock_get_audio.assert_called_once_with("compressed/rec1.wdz")
+
+    mock_get_audio.return_value = None
+    mock_decoded.return_value = {"size": 4, "content_type": "audio/wav", "data": b"RIFF"}
+    response = mocked_app.get("/recordings/rec1/audio")
+    assert response.content == b"RIFF"
+    mock_decoded.assert_called_once_with("dev/a.wav", "compressed/rec1.wdz")
+
+    response = mocked_app.get("/recordings/rec1/audio", params={"format": "mp3"})
+    assert response.status_code == 400
+
+
+@patch("recording_endpoints.recording_routes.get_recording_source", return_value=None)
+def test_stream_recording_audio_missing(mock_source, mocked_app):
+    """
+    Ensures a 404 is returned for an unknown recording.
+
+    Input:
+        mock_source: mocked function to simulate the recording lookup
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    response = mocked_app.get("/recordings/unknown/audio")
+    assert response.status_code == 404
+
+
+@patch("recording_endpoints.recording_routes.get_waveform")
+@patch("recording_endpoints.audio_proxy.get_audio_object")
+@patch("recording_endpoints.recording_routes.get_recording_source",
+       return_value=("other/a.wav", "other"))
+def test_other_users_recordings_not_served(mock_source, mock_get_audio, mock_get_waveform,
+                                           mocked_app):
+    """
+    Ensures audio and waveforms of a recording on a device that is not the
+    user's are not served, and that storage is not read for them.
+
+    Input:
+        mock_source: mocked function to simulate the recording lookup
+        mock_get_audio: mocked function to simulate the storage object lookup
+        mock_get_waveform: mocked function to simulate reading the stored pyramid
+        mocked_app: FastAPI test app for testing
+
+    Output:
+        Success/Failure
+    """
+    assert mocked_app.get("/recordings/rec1/audio").status_code == 404
+    assert mocked_app.get("/recordings/rec1/waveform").status_code == 404
+    mock_get_audio.assert_not_called()
+    mock_get_waveform.assert_not_called()
+
+
+def test_format_event():
+    """
+    Ensures recordings are sent as Server-Sent Events in the compile format.
+    """
+    message = recording_endpoints.format_event("recording", {"id": "r1", "viewed": True,
+                                                             "internal": 1})
+    assert message == 'event: recording\ndata: {"id":"r1","viewed":true}\n\n'
+    assert recording_endpoints.format_event("resync", {}) == "event: resync\ndata: {}\n\n"
+
+
+def test_event_stream_unsubscribes():
+    """
+    Ensures the event stream sends queued events and unsubscribes when closed.
+    """
+    async def run():
+        subscription = Mock(get=AsyncMock(return_value=("removed", {"id": "r1"})))
+        with patch("recording_endpoints.recording_events.hub") as mock_hub:
+            stream = recording_endpoints._event_stream(subscription)  # pylint: disable=protected-access
+            messages = [await stream.__anext__(), await stream.__anext__()]
+            await stream.aclose()
+        return messages, mock_hub, subscription
+
+    messages, mock_hub, subscription = asyncio.run(run())
+    assert messages == ["retry: 5000\n\n", 'event: removed\ndata: {"id": "r1"}\n\n']
+    mock_hub.unsubscribe.assert_called_once_with(subscription)
+
+
+@patch("recording_endpoints.get_current_user_device", return_value=None)
+def test_stream_recordings_no_device(mock_get_device, mocked_app):
+    """
+    Ensures a user without a device cannot open an event stream.
+    """
+    response = mocked_app.get("/recordings/stream")
+    assert response.status_code == 404
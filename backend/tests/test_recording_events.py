@@ -0,0 +1,101 @@
+"""
+test_recording_events.py
+
+Tests fanning recording changes out to event stream subscribers.
+"""
+
+import sys
+import os
+import asyncio
+import threading
+from unittest.mock import Mock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+import recording_events
+from recording_events import DeviceEventHub
+
+
+def make_hub():
+    """
+    Creates a hub whose listeners are mocks that record their callbacks.
+
+    Output:
+        (DeviceEventHub, Mock): The hub and its watch function
+    """
+    watch_func = Mock(side_effect=lambda device_id, since, callback: Mock(callback=callback))
+    return DeviceEventHub(watch_func), watch_func
+
+
+def test_events_fan_out_from_one_listener():
+    """
+    Tests that every subscriber of a device gets its events from a single
+    listener, which stops with the last subscriber.
+    """
+    hub, watch_func = make_hub()
+
+    async def run():
+        first = hub.subscribe("dev1")
+        second = hub.subscribe("dev1")
+        other = hub.subscribe("dev2")
+        watch = hub._watches["dev1"]  # pylint: disable=protected-access
+
+        # Listener callbacks arrive on a Firestore thread
+        thread = threading.Thread(target=watch.callback, args=("recording", {"id": "r1"}))
+        thread.start()
+        thread.join()
+
+        events = await asyncio.gather(first.get(), second.get())
+        hub.unsubscribe(first)
+        hub.unsubscribe(second)
+        return events, watch, other
+
+    events, watch, other = asyncio.run(run())
+
+    assert events == [("recording", {"id": "r1"}), ("recording", {"id": "r1"})]
+    assert watch_func.call_count == 2
+    watch.unsubscribe.assert_called_once()
+    assert other.queue.empty()
+    assert hub.subscriber_count("dev1") == 0
+    assert hub.subscriber_count("dev2") == 1
+
+
+def test_slow_subscriber_is_told_to_resync():
+    """
+    Tests that a subscriber whose queue overflows gets a resync event
+    instead of unbounded buffering.
+    """
+    hub, _ = make_hub()
+
+    async def run():
+        with patch("recording_events.QUEUE_SIZE", 2):
+            subscription = hub.subscribe("dev1")
+        for index in range(5):
+            hub.publish("dev1", "recording", {"id": str(index)})
+        await asyncio.sleep(0)
+        return [await subscription.get() for _ in range(3)]
+
+    assert asyncio.run(run()) == [("recording", {"id": "0"}), ("recording", {"id": "1"}),
+                                  recording_events.RESYNC_EVENT]
+
+
+def test_close_stops_listeners():
+    """
+    Tests that closing the hub stops every listener.
+    """
+    hub, _ = make_hub()
+
+    async def run():
+        hub.subscribe("dev1")
+        hub.subscribe("dev2")
+        return list(hub._watches.values())  # pylint: disable=protected-access
+
+    watches = asyncio.run(run())
+    hub.close()
+
+    for watch in watches:
+        watch.unsubscribe.assert_called_once()
+    assert hub.subscriber_count("dev1") == 0
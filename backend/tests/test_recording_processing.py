@@ -0,0 +1,261 @@
+"""
+test_recording_processing.py
+
+Tests the recording processing stage of the ingest pipeline.
+"""
+
+import sys
+import os
+import io
+from unittest.mock import patch, Mock
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+import recording_processing
+from test_audio_analysis import make_wav, make_firmware_wav
+
+
+# The denoise stage is covered by its own test, which starts the process pool
+@pytest.fixture(autouse=True)
+def disable_denoise():
+    """
+    Turns the denoise stage off unless a test turns it back on.
+    """
+    with patch("recording_processing.DENOISE_RECORDINGS", False):
+        yield
+
+
+def make_doc(recording_id: str, file_path: str):
+    """
+    Creates a mocked recording snapshot.
+
+    Input:
+        recording_id (str): Document id
+        file_path (str): Storage object name
+
+    Output:
+        Mocked snapshot
+    """
+    doc = Mock()
+    doc.id = recording_id
+    doc.get.return_value = file_path
+    doc.to_dict.return_value = {"file_path": file_path}
+    return doc
+
+
+def test_process_recording_stores_summary():
+    """
+    Tests that a valid recording gets its summary stored and is marked processed.
+    """
+    wav = make_wav(np.zeros(4410, dtype=np.int16))
+    with patch("recording_processing.bucket") as mock_bucket, \
+         patch("recording_processing.db") as mock_db:
+        mock_bucket.blob.return_value.open.return_value = io.BytesIO(wav)
+        assert recording_processing.process_recording("rec1", "/dev_1.wav")
+
+    fields = mock_db.collection.return_value.document.return_value.update.call_args.args[0]
+    assert fields["processed"] is True
+    assert fields["valid"] is True
+    assert fields["durationSeconds"] == 0.1
+    assert fields["waveformPath"] == "waveforms/rec1.bin"
+    assert fields["heartRateBpm"] is None
+    mock_db.collection.return_value.document.assert_called_once_with("rec1")
+    mock_bucket.blob.assert_any_call("waveforms/rec1.bin")
+    mock_bucket.blob.return_value.upload_from_string.assert_called_once()
+
+
+def test_process_recording_accepts_firmware_recordings():
+    """
+    Tests that a recording as uploaded by the firmware, shorter than its
+    header declares, is processed as valid and flagged truncated.
+    """
+    with patch("recording_processing.bucket") as mock_bucket, \
+         patch("recording_processing.db") as mock_db:
+        mock_bucket.blob.return_value.open.return_value = io.BytesIO(make_firmware_wav())
+        assert recording_processing.process_recording("rec1", "/dev_1.wav")
+
+    fields = mock_db.collection.return_value.document.return_value.update.call_args.args[0]
+    assert fields["valid"] is True
+    assert fields["truncated"] is True
+    assert fields["declaredDataBytes"] - fields["dataBytes"] == 1008
+    assert fields["waveformPath"] == "waveforms/rec1.bin"
+
+
+def test_process_recording_stores_compressed_copy():
+    """
+    Tests that a verified compressed copy is uploaded when compression is enabled.
+    """
+    wav = make_wav(np.arange(4410, dtype=np.int16))
+    with patch("recording_processing.bucket") as mock_bucket, \
+         patch("recording_processing.db") as mock_db, \
+         patch("recording_processing.audio_codec.COMPRESS_RECORDINGS", True):
+        mock_bucket.blob.return_value.open.return_value = io.BytesIO(wav)
+        assert recording_processing.process_recording("rec1", "/dev_1.wav")
+
+    fields = mock_db.collection.return_value.document.return_value.update.call_args.args[0]
+    assert fields["compressedPath"] == "compressed/rec1.wdz"
+    mock_bucket.blob.assert_any_call("compressed/rec1.wdz")
+    uploaded = mock_bucket.blob.return_value.upload_from_string.call_args.args[0]
+    assert len(uploaded) == fields["compressedBytes"]
+    assert recording_processing.audio_codec.decode_to_wav(uploaded) == wav
+
+
+def test_process_recording_stores_cleaned_copy():
+    """
+    Tests that the cleaned copy is produced on the process pool and uploaded
+    as a WAV of the same length.
+    """
+    samples = (np.sin(np.arange(44100) * 2 * np.pi * 100 / 44100) * 8000).astype(np.int16)
+    wav = make_wav(samples)
+    try:
+        with patch("recording_processing.bucket") as mock_bucket, \
+             patch("recording_processing.db") as mock_db, \
+             patch("recording_processing.DENOISE_RECORDINGS", True), \
+             patch("recording_processing.DENOISE_WORKERS", 1):
+            mock_bucket.blob.return_value.open.return_value = io.BytesIO(wav)
+            assert recording_processing.process_recording("rec1", "/dev_1.wav")
+    finally:
+        recording_processing.shutdown_denoise_pool()
+
+    fields = mock_db.collection.return_value.document.return_value.update.call_args.args[0]
+    assert fields["cleanedPath"] == "cleaned/rec1.wave"
+    mock_bucket.blob.assert_any_call("cleaned/rec1.wave")
+    cleaned = mock_bucket.blob.return_value.upload_from_string.call_args.args[0]
+    assert cleaned[:4] == b"RIFF" and len(cleaned) == len(wav)
+
+
+def test_process_recording_marks_invalid_files():
+    """
+    Tests that malformed recordings are marked processed but invalid.
+    """
+    with patch("recording_processing.bucket") as mock_bucket, \
+         patch("recording_processing.db") as mock_db:
+        mock_bucket.blob.return_value.open.return_value = io.BytesIO(b"garbage")
+        assert recording_processing.process_recording("rec1", "/dev_1.wav")
+
+    fields = mock_db.collection.return_value.document.return_value.update.call_args.args[0]
+    assert fields["processed"] is True
+    assert fields["valid"] is False
+
+
+def test_process_recording_download_failure_is_retried():
+    """
+    Tests that download errors leave the recording unprocessed.
+    """
+    with patch("recording_processing.bucket") as mock_bucket, \
+         patch("recording_processing.db") as mock_db:
+        mock_bucket.blob.return_value.open.side_effect = ConnectionError("reset")
+        assert not recording_processing.process_recording("rec1", "/dev_1.wav")
+
+    mock_db.collection.return_value.document.return_value.update.assert_not_called()
+
+
+def test_process_pending_recordings():
+    """
+    Tests that pending recordings are queried and processed in parallel.
+    """
+    docs = [make_doc("rec1", "/dev_1.wav"), make_doc("rec2", "/dev_2.wav")]
+    with patch("recording_processing.db") as mock_db, \
+         patch("recording_processing.process_recording", side_effect=[True, False]) as mock_process:
+        query = mock_db.collection.return_value.where.return_value.where.return_value.order_by
+        query.return_value.select.return_value.limit.return_value.stream.return_value = docs
+        result = recording_processing.process_pending_recordings()
+
+    assert result == {"processed": 1, "failed": 1}
+    assert mock_process.call_count == 2
+    mock_db.collection.return_value.where.return_value.where.assert_called_once_with(
+        "processingAttempts", "<", recording_processing.PROCESS_MAX_ATTEMPTS)
+    query.assert_called_once_with("processingAttempts")
+
+
+def test_process_pending_recordings_skips_claimed():
+    """
+    Tests that recordings another worker has claimed are neither processed
+    nor counted as failed.
+    """
+    docs = [make_doc("rec1", "/dev_1.wav"), make_doc("rec2", "/dev_2.wav")]
+    with patch("recording_processing.db") as mock_db, \
+         patch("recording_processing.claim_recording",
+               side_effect=lambda recording_id: recording_id == "rec1"), \
+         patch("recording_processing.process_recording", return_value=True) as mock_process:
+        query = mock_db.collection.return_value.where.return_value.where.return_value.order_by
+        query.return_value.select.return_value.limit.return_value.stream.return_value = docs
+        result = recording_processing.process_pending_recordings()
+
+    assert result == {"processed": 1, "failed": 0}
+    mock_process.assert_called_once_with("rec1", "/dev_1.wav", None)
+
+
+def test_process_claimed_recording_reads_local_copy():
+    """
+    Tests that a local copy is only processed once the recording is claimed,
+    and that it is read instead of downloading the recording.
+    """
+    stream = io.BytesIO(b"RIFF")
+    with patch("recording_processing.claim_recording", side_effect=[False, True]), \
+         patch("recording_processing.process_recording", return_value=True) as mock_process:
+        assert recording_processing.process_claimed_recording("rec1", "/dev_1.wav", stream) is None
+        mock_process.assert_not_called()
+        assert recording_processing.process_claimed_recording("rec1", "/dev_1.wav", stream)
+
+    mock_process.assert_called_once_with("rec1", "/dev_1.wav", stream)
+
+
+def test_process_backlog_skips_processed():
+    """
+    Tests that the backlog only processes recordings not yet processed.
+    """
+    done = make_doc("rec1", "/dev_1.wav")
+    done.to_dict.return_value = {"file_path": "/dev_1.wav", "processed": True}
+    legacy = make_doc("rec2", "/dev_2.wav")
+
+    with patch("recording_processing.db") as mock_db, \
+         patch("recording_processing.process_recording", return_value=True) as mock_process:
+        mock_db.collection.return_value.select.return_value.stream.return_value = [done, legacy]
+        result = recording_processing.process_backlog()
+
+    assert result == {"processed": 1, "failed": 0}
+    mock_process.assert_called_once_with("rec2", "/dev_2.wav", None)
+
+
+def test_heart_rate_backlog_skips_estimated_and_invalid():
+    """
+    Tests that the heart rate backlog only updates valid processed recordings
+    that have no estimate yet.
+    """
+    estimated = make_doc("rec1", "/dev_1.wav")
+    estimated.to_dict.return_value = {"processed": True, "heartRateConfidence": 0.9}
+    invalid = make_doc("rec2", "/dev_2.wav")
+    invalid.to_dict.return_value = {"processed": True, "valid": False}
+    pending = make_doc("rec3", "/dev_3.wav")
+    pending.to_dict.return_value = {"processed": False}
+    legacy = make_doc("rec4", "/dev_4.wav")
+    legacy.to_dict.return_value = {"processed": True, "valid": True}
+
+    with patch("recording_processing.db") as mock_db, \
+         patch("recording_processing.estimate_heart_rate", return_value=True) as mock_estimate:
+        mock_db.collection.return_value.select.return_value.stream.return_value = [
+            estimated, invalid, pending, legacy]
+        result = recording_processing.heart_rate_backlog()
+
+    assert result == {"processed": 1, "failed": 0}
+    mock_estimate.assert_called_once_with("rec4", "/dev_4.wav")
+
+
+def test_estimate_heart_rate_updates_document():
+    """
+    Tests that a heart rate estimate is stored without touching other fields.
+    """
+    wav = make_wav(np.zeros(44100, dtype=np.int16))
+    with patch("recording_processing.bucket") as mock_bucket, \
+         patch("recording_processing.db") as mock_db:
+        mock_bucket.blob.return_value.open.return_value = io.BytesIO(wav)
+        assert recording_processing.estimate_heart_rate("rec1", "/dev_1.wav")
+
+    fields = mock_db.collection.return_value.document.return_value.update.call_args.args[0]
+    assert set(fields) == {"heartRateBpm", "heartRateConfidence", "updatedAt"}
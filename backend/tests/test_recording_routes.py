@@ -4,6 +4,8 @@ test_recording_routes.py
 Tests all recording routes to ensure they exhibit expected behavior.
 """
 from unittest.mock import patch, Mock
+from datetime import datetime, timezone
+from types import SimpleNamespace
 import sys
 import os
 import pytest
@@ -16,6 +18,7 @@ sys.modules["firestore"] = Mock(db=mock_firestore)
 
 
 import recording_routes
+from google.api_core.exceptions import NotFound
 
 
 # mock firebase before each test
@@ -81,7 +84,8 @@ def test_update_recording_title(mock_firestore_actions):
     mock_firestore_actions["recordings"].document.return_value = mock_doc
 
     recording_routes.update_recording_title("abc123", "New Title")
-    mock_doc.update.assert_called_once_with({"sessionTitle": "New Title"})
+    mock_doc.update.assert_called_once_with(
+        {"sessionTitle": "New Title", "updatedAt": recording_routes.SERVER_TIMESTAMP})
 
 def test_update_recording_view(mock_firestore_actions):
     """
@@ -103,7 +107,8 @@ def test_update_recording_view(mock_firestore_actions):
     mock_firestore_actions["recordings"].document.return_value = mock_doc
 
     recording_routes.update_recording_view("abc123", True)
-    mock_doc.update.assert_called_once_with({"viewed": True})
+    mock_doc.update.assert_called_once_with(
+        {"viewed": True, "updatedAt": recording_routes.SERVER_TIMESTAMP})
 
 def test_update_recording_notes(mock_firestore_actions):
     """
@@ -125,4 +130,165 @@ def test_update_recording_notes(mock_firestore_actions):
     mock_firestore_actions["recordings"].document.return_value = mock_doc
 
     recording_routes.update_recording_notes("abc123", "Updated notes")
-    mock_doc.update.assert_called_once_with({"notes": "Updated notes"})
+    mock_doc.update.assert_called_once_with(
+        {"notes": "Updated notes", "updatedAt": recording_routes.SERVER_TIMESTAMP})
+
+
+def test_cursor_round_trip():
+    """
+    Tests that cursors decode back to the position they were created from
+    and that malformed cursors are rejected.
+    """
+    session_time = datetime(2025, 5, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = recording_routes.encode_cursor(session_time, "abc123")
+
+    assert recording_routes.decode_cursor(cursor) == (session_time, "abc123")
+    with pytest.raises(ValueError):
+        recording_routes.decode_cursor("not-a-cursor")
+
+def test_get_recordings_page(mock_firestore_actions):
+    """
+    Tests that a full page returns a cursor pointing after its last recording.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    session_time = datetime(2025, 5, 1, 12, 30, tzinfo=timezone.utc)
+    mock_doc = Mock()
+    mock_doc.id = "abc123"
+    mock_doc.to_dict.return_value = {"deviceID": "deviceXYZ"}
+    mock_doc.get.return_value = session_time
+
+    query = mock_firestore_actions["recordings"].where.return_value.order_by.return_value.order_by.return_value
+    query.limit.return_value.stream.return_value = [mock_doc]
+
+    page, next_cursor = recording_routes.get_recordings_page("deviceXYZ", 1)
+
+    assert page == [{"deviceID": "deviceXYZ", "id": "abc123"}]
+    assert recording_routes.decode_cursor(next_cursor) == (session_time, "abc123")
+    query.limit.assert_called_once_with(1)
+
+def test_update_recording_single_write(mock_firestore_actions):
+    """
+    Tests that `update_recording` writes every field at once without reading
+    the recording first.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    mock_doc = mock_firestore_actions["doc"]
+    mock_firestore_actions["recordings"].document.return_value = mock_doc
+
+    assert recording_routes.update_recording("abc123", {"notes": "n", "viewed": True})
+    mock_doc.get.assert_not_called()
+    mock_doc.update.assert_called_once_with(
+        {"notes": "n", "viewed": True, "updatedAt": recording_routes.SERVER_TIMESTAMP})
+
+def test_update_recording_missing(mock_firestore_actions):
+    """
+    Tests that updating a missing recording reports it instead of raising.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    mock_doc = mock_firestore_actions["doc"]
+    mock_doc.update.side_effect = NotFound("missing")
+    mock_firestore_actions["recordings"].document.return_value = mock_doc
+
+    assert recording_routes.update_recording_title("missing", "Title") is False
+
+def test_update_recordings_bulk(mock_firestore_actions):
+    """
+    Tests that bulk updates are chunked into batches and report every recording.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    with patch("recording_routes.db") as mock_db, \
+         patch("recording_routes.BULK_BATCH_SIZE", 2):
+        results = recording_routes.update_recordings_bulk(["a", "b", "c", "a"], {"viewed": True})
+
+    assert results == {"a": True, "b": True, "c": True}
+    assert mock_db.batch.return_value.commit.call_count == 2
+    assert mock_db.batch.return_value.update.call_count == 3
+
+def test_update_recordings_bulk_missing(mock_firestore_actions):
+    """
+    Tests that a batch containing a missing recording falls back to single
+    updates so each recording gets its own result.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    with patch("recording_routes.db") as mock_db, \
+         patch("recording_routes.update_recording", side_effect=[True, False]) as mock_single:
+        mock_db.batch.return_value.commit.side_effect = NotFound("missing")
+        results = recording_routes.update_recordings_bulk(["a", "b"], {"viewed": True})
+
+    assert results == {"a": True, "b": False}
+    assert mock_single.call_count == 2
+
+def test_get_recording_devices(mock_firestore_actions):
+    """
+    Tests that the devices of several recordings are read in one call and
+    that missing recordings are left out.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    found = SimpleNamespace(id="a", exists=True, get={"deviceID": "dev"}.get)
+    missing = SimpleNamespace(id="b", exists=False)
+    with patch("recording_routes.db") as mock_db:
+        mock_db.get_all.return_value = iter([found, missing])
+        assert recording_routes.get_recording_devices(["a", "b", "a"]) == {"a": "dev"}
+
+    assert len(mock_db.get_all.call_args.args[0]) == 2
+    assert mock_db.get_all.call_args.kwargs == {"field_paths": ["deviceID"]}
+
+def test_get_recording_source_cached(mock_firestore_actions):
+    """
+    Tests that a recording's storage path and device are read once and then
+    served from cache.
+
+    Input:
+        mock_firestore_actions (dict): A fixture providing mocked Firestore objects.
+    """
+    mock_snapshot = mock_firestore_actions["snapshot"]
+    mock_snapshot.exists = True
+    mock_snapshot.get.side_effect = {"file_path": "dev/a.wav", "deviceID": "dev"}.get
+    mock_doc = mock_firestore_actions["doc"]
+    mock_doc.get.return_value = mock_snapshot
+    mock_firestore_actions["recordings"].document.return_value = mock_doc
+    recording_routes.source_cache.clear()
+
+    assert recording_routes.get_recording_source("rec1") == ("dev/a.wav", "dev")
+    assert recording_routes.get_recording_source("rec1") == ("dev/a.wav", "dev")
+    mock_doc.get.assert_called_once_with(["file_path", "deviceID"])
+
+    mock_snapshot.exists = False
+    assert recording_routes.get_recording_source("rec2") is None
+
+
+def test_watch_device_recordings(mock_firestore_actions):
+    """
+    Ensures listener changes are passed on as recording and removed events.
+    """
+    recordings = mock_firestore_actions["recordings"]
+    query = recordings.where.return_value.where.return_value
+    callback = Mock()
+    since = datetime(2025, 5, 1, tzinfo=timezone.utc)
+
+    recording_routes.watch_device_recordings("device1", since, callback)
+
+    recordings.where.assert_called_once_with("deviceID", "==", "device1")
+    recordings.where.return_value.where.assert_called_once_with("updatedAt", ">", since)
+    on_snapshot = query.on_snapshot.call_args[0][0]
+
+    changed = Mock(id="rec1", to_dict=Mock(return_value={"viewed": True}))
+    removed = Mock(id="rec2")
+    on_snapshot([], [SimpleNamespace(type=SimpleNamespace(name="MODIFIED"), document=changed),
+                     SimpleNamespace(type=SimpleNamespace(name="REMOVED"), document=removed)],
+                since)
+
+    assert callback.call_args_list[0][0] == ("recording", {"viewed": True, "id": "rec1"})
+    assert callback.call_args_list[1][0] == ("removed", {"id": "rec2"})
@@ -0,0 +1,72 @@
+"""
+test_response_utils.py
+
+Tests response model serialization and compression.
+"""
+
+import sys
+import os
+import gzip
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import response_utils
+from response_models import RecordingList, ProfileAdapter
+from response_utils import choose_encoding, model_response
+
+
+def test_choose_encoding():
+    """
+    Tests that gzip is chosen when accepted and refused codings are ignored.
+    """
+    with patch("response_utils.brotli", None):
+        assert choose_encoding("gzip, deflate, br") == "gzip"
+        assert choose_encoding("gzip;q=0, deflate") is None
+        assert choose_encoding("*") == "gzip"
+        assert choose_encoding(None) is None
+
+
+def test_recordings_keep_document_shape():
+    """
+    Tests that timestamps are ISO formatted, missing fields are left out and
+    unknown fields are dropped.
+    """
+    session_time = datetime(2025, 5, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+    response = model_response(RecordingList, [
+        {"id": "1", "sessionDateTime": session_time, "viewed": False, "internal": "x"}])
+
+    assert json.loads(response.body) == [
+        {"id": "1", "sessionDateTime": "2025-05-01T12:00:00.123000+00:00", "viewed": False}]
+    assert "content-encoding" not in response.headers
+
+
+def test_large_bodies_are_gzipped():
+    """
+    Tests that bodies over the threshold are compressed and small ones are not.
+    """
+    recordings = [{"id": str(index), "notes": "heart sounds"} for index in range(200)]
+
+    with patch("response_utils.brotli", None):
+        response = model_response(RecordingList, recordings, "gzip", {"ETag": '"v1"'})
+        small = model_response(RecordingList, recordings[:1], "gzip")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"v1"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.body)) == recordings
+    assert len(small.body) < response_utils.COMPRESS_MINIMUM_BYTES
+    assert "content-encoding" not in small.headers
+
+
+def test_profile_keeps_extra_fields():
+    """
+    Tests that profile fields registered by the app are kept.
+    """
+    response = model_response(ProfileAdapter, {"email": "a@b.c", "lastName": "Smith",
+                                               "deviceIDs": ["dev1"]})
+
+    assert json.loads(response.body) == {"email": "a@b.c", "lastName": "Smith",
+                                         "deviceIDs": ["dev1"]}
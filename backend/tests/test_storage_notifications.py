@@ -0,0 +1,116 @@
+"""
+test_storage_notifications.py
+
+Tests parsing and ingesting Cloud Storage object-finalize notifications.
+"""
+
+import sys
+import os
+import base64
+import json
+from unittest.mock import patch, Mock
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+import storage_notifications
+from storage_notifications import (parse_notification, pubsub_push_payload, ingest_object,
+                                   NotificationError, CLOUDEVENT_FINALIZE_TYPE)
+from test_firestore import load_firestore_module
+
+# The real object name check, since the firestore module is mocked here
+is_recording_object = load_firestore_module().is_recording_object
+
+
+def test_parse_pubsub_push():
+    """
+    Tests that the finalized object is read from a Pub/Sub push message and
+    other events are ignored.
+    """
+    payload = pubsub_push_payload("bucket1", "/dev1_abc.wav", size="1024")
+    assert parse_notification({}, payload) == ("bucket1", "/dev1_abc.wav")
+
+    payload["message"]["attributes"]["eventType"] = "OBJECT_DELETE"
+    assert parse_notification({}, payload) is None
+
+
+def test_parse_cloudevents():
+    """
+    Tests binary and structured mode CloudEvents from Eventarc.
+    """
+    resource = {"bucket": "bucket1", "name": "dev1/a.wav"}
+    assert parse_notification({"ce-type": CLOUDEVENT_FINALIZE_TYPE}, resource) == \
+        ("bucket1", "dev1/a.wav")
+    assert parse_notification({}, {"type": CLOUDEVENT_FINALIZE_TYPE, "data": resource}) == \
+        ("bucket1", "dev1/a.wav")
+    assert parse_notification({"ce-type": "google.cloud.storage.object.v1.deleted"},
+                              resource) is None
+
+
+@pytest.mark.parametrize("body", [
+    [],
+    {"unknown": True},
+    {"message": {"attributes": {"eventType": "OBJECT_FINALIZE"}, "data": "not base64!"}},
+    {"type": CLOUDEVENT_FINALIZE_TYPE, "data": {"bucket": "bucket1"}},
+])
+def test_parse_rejects_malformed(body):
+    """
+    Tests that malformed notifications raise NotificationError.
+    """
+    with pytest.raises(NotificationError):
+        parse_notification({}, body)
+
+
+def test_ingest_object():
+    """
+    Tests that only existing recordings in the backend's bucket are ingested,
+    and not the copies the processing stage stores next to them.
+    """
+    with patch("storage_notifications.bucket") as mock_bucket, \
+         patch("storage_notifications.is_recording_object", is_recording_object), \
+         patch("storage_notifications.add_recording", return_value=("rec1", True)) as mock_add:
+        mock_bucket.name = "bucket1"
+
+        assert ingest_object("other", "/dev1_a.wav") is None
+        assert ingest_object("bucket1", "/dev1_a.txt") is None
+        assert ingest_object("bucket1", "cleaned/rec1.wav") is None
+        mock_bucket.get_blob.return_value = None
+        assert ingest_object("bucket1", "/dev1_a.wav") is None
+        mock_add.assert_not_called()
+
+        mock_bucket.get_blob.return_value = Mock()
+        assert ingest_object("bucket1", "/dev1_a.wav") == ("rec1", True)
+        mock_add.assert_called_once_with("/dev1_a.wav")
+
+
+def test_push_token_required_when_configured():
+    """
+    Tests that tokens are only checked when an audience is configured.
+    """
+    assert storage_notifications.verify_push_token(None)
+
+    with patch("storage_notifications.NOTIFICATION_AUDIENCE", "https://backend/notify"), \
+         patch("google.oauth2.id_token.verify_oauth2_token",
+               return_value={"email": "push@example.com", "email_verified": True}) as mock_verify:
+        assert not storage_notifications.verify_push_token(None)
+        assert storage_notifications.verify_push_token("Bearer token")
+        assert mock_verify.call_args[0][0] == "token"
+
+        with patch("storage_notifications.NOTIFICATION_SERVICE_ACCOUNT", "other@example.com"):
+            assert not storage_notifications.verify_push_token("Bearer token")
+
+        mock_verify.side_effect = ValueError("expired")
+        assert not storage_notifications.verify_push_token("Bearer token")
+
+
+def test_payload_data_is_object_resource():
+    """
+    Tests that the stand-in payload carries the object resource as Pub/Sub does.
+    """
+    payload = pubsub_push_payload("bucket1", "/dev1_a.wav", contentType="audio/wav")
+    resource = json.loads(base64.b64decode(payload["message"]["data"]))
+    assert resource["name"] == "/dev1_a.wav"
+    assert resource["contentType"] == "audio/wav"
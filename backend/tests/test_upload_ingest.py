@@ -0,0 +1,146 @@
+"""
+test_upload_ingest.py
+
+Tests spooling, validation and storage of recordings uploaded to the backend.
+"""
+
+import sys
+import os
+import io
+from unittest.mock import patch, Mock
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+mock_firestore = Mock()
+sys.modules["firestore"] = Mock(db=mock_firestore)
+
+import upload_ingest
+from audio_analysis import WavFormatError
+from test_audio_analysis import make_wav, make_firmware_wav
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path):
+    """
+    Points the spool directory at a temporary directory.
+    """
+    with patch("upload_ingest.SPOOL_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+def test_parse_content_range():
+    """
+    Tests piece ranges, status queries and malformed headers.
+    """
+    assert upload_ingest.parse_content_range(None) is None
+    assert upload_ingest.parse_content_range("bytes 0-99/1000") == (0, 99, 1000)
+    assert upload_ingest.parse_content_range("bytes */1000") == (None, None, 1000)
+    for header in ("bytes 10-5/1000", "bytes 0-1000/1000", "items 0-1/2", "bytes 0-1"):
+        with pytest.raises(ValueError):
+            upload_ingest.parse_content_range(header)
+
+
+def test_spool_path_is_scoped_to_user():
+    """
+    Tests that the same upload id maps to different spools for different users.
+    """
+    assert upload_ingest.spool_path("user1", "abc") != upload_ingest.spool_path("user2", "abc")
+    assert upload_ingest.recording_path("dev1", "abc") == "/dev1_abc.wav"
+
+
+def test_spool_append_and_restart():
+    """
+    Tests that pieces are appended and that restarting discards them.
+    """
+    path = upload_ingest.spool_path("user1", "abc")
+    assert upload_ingest.spooled_bytes(path) == 0
+
+    for restart, data in ((True, b"12345"), (False, b"678")):
+        with upload_ingest.open_spool(path, restart) as spool:
+            spool.write(data)
+    assert upload_ingest.spooled_bytes(path) == 8
+
+    with upload_ingest.open_spool(path, True):
+        pass
+    assert upload_ingest.spooled_bytes(path) == 0
+
+
+def test_remove_stale_spools(spool_dir):
+    """
+    Tests that only spools untouched for longer than the TTL are removed.
+    """
+    stale = spool_dir / "old.part"
+    fresh = spool_dir / "new.part"
+    stale.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    os.utime(stale, (0, 0))
+
+    upload_ingest.remove_stale_spools()
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_finalize_upload_stores_and_creates_document(spool_dir):
+    """
+    Tests that a valid upload is written to storage and gets its document.
+    """
+    path = spool_dir / "rec.part"
+    path.write_bytes(make_wav(np.zeros(100, dtype=np.int16)))
+
+    with patch("upload_ingest.bucket") as mock_bucket, \
+         patch("upload_ingest.add_recording", return_value=("rec1", True)) as mock_add:
+        assert upload_ingest.finalize_upload(str(path), "/dev1_abc.wav") == ("rec1", True)
+
+    mock_bucket.blob.assert_called_once_with("/dev1_abc.wav")
+    mock_bucket.blob.return_value.upload_from_filename.assert_called_once_with(
+        str(path), content_type="audio/wav")
+    mock_add.assert_called_once_with("/dev1_abc.wav")
+
+
+def test_finalize_upload_accepts_firmware_recordings(spool_dir):
+    """
+    Tests that an upload as the firmware sends it, shorter than its header
+    declares, is stored rather than rejected.
+    """
+    path = spool_dir / "rec.part"
+    path.write_bytes(make_firmware_wav())
+
+    with patch("upload_ingest.bucket") as mock_bucket, \
+         patch("upload_ingest.add_recording", return_value=("rec1", True)):
+        assert upload_ingest.finalize_upload(str(path), "/dev1_abc.wav") == ("rec1", True)
+
+    mock_bucket.blob.return_value.upload_from_filename.assert_called_once()
+
+
+def test_finalize_upload_rejects_wav_without_samples(spool_dir):
+    """
+    Tests that an upload holding only a header is not stored.
+    """
+    path = spool_dir / "rec.part"
+    path.write_bytes(make_wav(np.zeros(100, dtype=np.int16))[:44])
+
+    with patch("upload_ingest.bucket") as mock_bucket, pytest.raises(WavFormatError):
+        upload_ingest.finalize_upload(str(path), "/dev1_abc.wav")
+    mock_bucket.blob.assert_not_called()
+
+
+def test_process_upload_reads_spool_and_removes_it(spool_dir):
+    """
+    Tests that processing reads the local spool and deletes it afterwards.
+    """
+    path = spool_dir / "rec.part"
+    path.write_bytes(b"RIFF")
+
+    def check_stream(recording_id, file_path, stream):
+        assert isinstance(stream, io.BufferedReader)
+        assert stream.read() == b"RIFF"
+        return True
+
+    with patch("upload_ingest.process_claimed_recording",
+               side_effect=check_stream) as mock_process:
+        upload_ingest.process_upload("rec1", "/dev1_abc.wav", str(path))
+
+    mock_process.assert_called_once()
+    assert not path.exists()
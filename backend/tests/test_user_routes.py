@@ -49,8 +49,9 @@ def mock_firestore_functions():
     mock_users = Mock()
     mock_users.document.return_value = mock_doc
 
-    # Patch the actual users object
+    # Patch the actual users object and start from an empty profile cache
     user_routes.users = mock_users
+    user_routes.user_cache.clear()
 
     return {
         "snapshot": mock_snapshot,
@@ -132,3 +133,69 @@ def test_get_current_user_device(mock_firestore_functions):
 
     result = user_routes.get_current_user_device("abc123")
     assert result == "deviceXYZ"
+
+
+def test_get_user_is_cached(mock_firestore_functions):
+    """
+    Tests that repeated profile lookups only read Firestore once.
+
+    Input:
+        mock_firestore_functions: Dictionary containing Firestore mocks.
+    """
+    doc = mock_firestore_functions["doc"]
+
+    user_routes.get_user("abc123")
+    result = user_routes.get_current_user_device("abc123")
+
+    assert result == "deviceXYZ"
+    doc.get.assert_called_once()
+
+
+def test_update_current_user_device_refreshes_cache(mock_firestore_functions):
+    """
+    Tests that updating the current device writes through to the cache so
+    the next lookup sees the new device without reading Firestore.
+
+    Input:
+        mock_firestore_functions: Dictionary containing Firestore mocks.
+    """
+    doc = mock_firestore_functions["doc"]
+
+    user_routes.get_user("abc123")
+    user_routes.update_current_user_device("abc123", "device123")
+    doc.get.reset_mock()
+
+    assert user_routes.get_current_user_device("abc123") == "device123"
+    doc.get.assert_not_called()
+
+
+def test_create_new_user_populates_cache(mock_firestore_functions):
+    """
+    Tests that a newly created user can be read back without a Firestore read.
+
+    Input:
+        mock_firestore_functions: Dictionary containing Firestore mocks.
+    """
+    doc = mock_firestore_functions["doc"]
+
+    user_routes.create_new_user("new123", {"currentDeviceID": ""})
+
+    assert user_routes.get_user("new123") == {"currentDeviceID": "", "userID": "new123"}
+    doc.get.assert_not_called()
+
+
+def test_get_user_device_ids(mock_firestore_functions):
+    """
+    Tests that a user's devices include both the listed and the current device,
+    and that a user without a profile has none.
+
+    Input:
+        mock_firestore_functions: Dictionary containing Firestore mocks.
+    """
+    snapshot = mock_firestore_functions["snapshot"]
+    snapshot.to_dict.return_value = {"deviceIDs": ["device1"], "currentDeviceID": "device2"}
+
+    assert user_routes.get_user_device_ids("abc123") == {"device1", "device2"}
+
+    snapshot.exists = False
+    assert user_routes.get_user_device_ids("nobody") == set()
@@ -0,0 +1,74 @@
+"""
+test_waveform.py
+
+Tests the waveform peak pyramid and its binary encoding.
+"""
+
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from waveform import PeakPyramid, encode_pyramid, decode_level, BASE_SAMPLES_PER_PEAK, \
+    LEVEL_FACTOR, NUM_LEVELS
+
+
+def test_levels_match_direct_reduction():
+    """
+    Tests that peaks built from uneven chunks match a direct min/max over
+    each window, at every level.
+    """
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-32768, 32767, size=100_000, dtype=np.int16)
+
+    pyramid = PeakPyramid(44100)
+    for chunk in np.array_split(samples, 7):
+        pyramid.add(chunk)
+    levels = pyramid.levels()
+
+    assert len(levels) == NUM_LEVELS
+    for index, (samples_per_peak, mins, maxs) in enumerate(levels):
+        assert samples_per_peak == BASE_SAMPLES_PER_PEAK * LEVEL_FACTOR ** index
+        windows = [samples[i:i + samples_per_peak]
+                   for i in range(0, samples.size, samples_per_peak)]
+        assert mins.size == len(windows)
+        assert np.array_equal(mins, [w.min() >> 8 for w in windows])
+        assert np.array_equal(maxs, [w.max() >> 8 for w in windows])
+
+
+def test_encode_and_decode_level():
+    """
+    Tests that a single level can be read back from the encoded pyramid.
+    """
+    samples = np.tile(np.array([-32768, 32767], dtype=np.int16), 30 * 44100 // 2)
+    pyramid = PeakPyramid(44100)
+    pyramid.add(samples)
+
+    data = encode_pyramid(pyramid)
+    coarse = decode_level(data, NUM_LEVELS - 1)
+
+    assert len(data) < 16 * 1024
+    assert coarse["sample_rate"] == 44100
+    assert coarse["samples_per_peak"] == BASE_SAMPLES_PER_PEAK * LEVEL_FACTOR ** (NUM_LEVELS - 1)
+    peaks = np.frombuffer(coarse["peaks"], dtype=np.int8).reshape(-1, 2)
+    assert peaks.shape[0] == coarse["peak_count"]
+    assert (peaks[:, 0] == -128).all() and (peaks[:, 1] == 127).all()
+
+    with pytest.raises(ValueError):
+        decode_level(data, NUM_LEVELS)
+
+
+def test_decode_level_rejects_truncated_data():
+    """
+    Tests that short or cut off pyramids raise ValueError rather than
+    struct.error, so the endpoint answers 400 instead of failing.
+    """
+    pyramid = PeakPyramid(44100)
+    pyramid.add(np.zeros(44100, dtype=np.int16))
+    data = encode_pyramid(pyramid)
+
+    for short in (b"", data[:6], data[:20], data[:-1]):
+        with pytest.raises(ValueError):
+            decode_level(short, NUM_LEVELS - 1)
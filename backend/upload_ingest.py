@@ -0,0 +1,196 @@
+"""
+upload_ingest.py
+
+Receives recordings uploaded straight to the backend. Upload bodies are
+spooled to local disk as they arrive, so a recording is never held in memory.
+Uploads can be sent in pieces and resumed after a dropped connection: each
+upload has an id chosen by the client and pieces are appended to its spool
+file until the declared total has arrived.
+
+Once complete the spool file is validated, written to Firebase Storage and
+its Firestore document created in one step, so no bucket scan is needed to
+discover it. The spool file is then processed locally and removed.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from firestore import bucket, add_recording
+from audio_analysis import parse_wav_header, WAV_HEADER_BYTES
+from recording_processing import process_claimed_recording
+
+# Where partial and complete uploads are kept until they are processed
+SPOOL_DIR = os.environ.get("INGEST_SPOOL_DIR",
+                           os.path.join(tempfile.gettempdir(), "stethoscope-ingest"))
+
+# Largest upload accepted. A 30 second recording is about 2.6 MB.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+
+# Partial uploads not resumed within this time are deleted
+SPOOL_TTL_SECONDS = 24 * 60 * 60
+
+# Upload ids become part of the storage object name, after the device id and
+# an underscore, so underscores are not allowed in them
+UPLOAD_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+)$")
+
+
+def parse_content_range(header: str):
+    """
+    Parses the Content-Range header of an upload piece.
+
+    Input:
+        header (str): The header value, or None for a single piece upload
+
+    Output:
+        (int, int, int): First byte, last byte (inclusive) and total size.
+        First and last are None for "bytes */total" status queries.
+        None: If there is no header
+
+    Raises:
+        ValueError: If the header is malformed
+    """
+    if header is None:
+        return None
+    match = CONTENT_RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError(f"Malformed Content-Range: {header}")
+
+    total = int(match.group(3))
+    if match.group(1) is None:
+        return None, None, total
+    start, end = int(match.group(1)), int(match.group(2))
+    if end < start or end >= total:
+        raise ValueError(f"Content-Range outside the upload: {header}")
+    return start, end, total
+
+
+def spool_path(user_id: str, upload_id: str) -> str:
+    """
+    Gets the spool file of an upload. Ids are scoped to the uploading user so
+    one user cannot append to another's upload.
+
+    Input:
+        user_id (str): Firebase user id of the uploader
+        upload_id (str): Client chosen upload id
+
+    Output:
+        str: Path of the spool file
+    """
+    digest = hashlib.sha256(f"{user_id}:{upload_id}".encode("utf-8")).hexdigest()
+    return os.path.join(SPOOL_DIR, f"{digest}.part")
+
+
+def recording_path(device_id: str, upload_id: str) -> str:
+    """
+    Gets the storage object name of an uploaded recording, in the same
+    /{device}_{id}.wav layout the firmware uses.
+
+    Input:
+        device_id (str): The uploading device
+        upload_id (str): The upload id
+
+    Output:
+        str: Storage object name
+    """
+    return f"/{device_id}_{upload_id}.wav"
+
+
+def spooled_bytes(path: str) -> int:
+    """
+    Input:
+        path (str): Path of the spool file
+
+    Output:
+        int: Bytes received so far, 0 if the upload has not started
+    """
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def open_spool(path: str, restart: bool):
+    """
+    Opens a spool file for appending, removing stale uploads first.
+
+    Input:
+        path (str): Path of the spool file
+        restart (bool): Discard anything already received
+
+    Output:
+        Binary file object positioned at the end of the spool
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    if restart:
+        remove_stale_spools()
+    return open(path, "wb" if restart else "ab")  # pylint: disable=consider-using-with
+
+
+def remove_spool(path: str):
+    """
+    Deletes a spool file if it exists.
+
+    Input:
+        path (str): Path of the spool file
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale_spools():
+    """
+    Deletes spool files that have not been written to for SPOOL_TTL_SECONDS.
+    """
+    cutoff = time.time() - SPOOL_TTL_SECONDS
+    for entry in os.scandir(SPOOL_DIR):
+        if entry.name.endswith(".part") and entry.stat().st_mtime < cutoff:
+            remove_spool(entry.path)
+
+
+def finalize_upload(path: str, file_path: str):
+    """
+    Validates a complete upload, writes it to Firebase Storage and creates its
+    recording document. Uploads shorter than their header declares are
+    accepted as truncated audio, as the firmware's always are (see
+    audio_analysis.py).
+
+    Input:
+        path (str): Path of the spool file
+        file_path (str): Storage object name for the recording
+
+    Output:
+        (str, bool): The recording id and whether its document was created
+        (False if this upload had already been ingested)
+
+    Raises:
+        WavFormatError: If the upload is not a WAV file the backend can read
+    """
+    with open(path, "rb") as spool:
+        parse_wav_header(spool.read(WAV_HEADER_BYTES), os.path.getsize(path))
+
+    bucket.blob(file_path).upload_from_filename(path, content_type="audio/wav")
+    return add_recording(file_path)
+
+
+def process_upload(recording_id: str, file_path: str, path: str):
+    """
+    Processes an ingested recording from its spool file, then deletes the
+    spool. The recording is claimed first, since the ingest worker may pick
+    up the new pending recording at the same time. If processing fails the
+    recording stays pending and is picked up from storage by the ingest worker.
+
+    Input:
+        recording_id (str): The recording document id
+        file_path (str): Storage object name of the recording
+        path (str): Path of the spool file
+    """
+    try:
+        with open(path, "rb") as spool:
+            process_claimed_recording(recording_id, file_path, spool)
+    finally:
+        remove_spool(path)
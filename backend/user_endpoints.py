@@ -6,8 +6,11 @@ Defines all fast API routes for all user functions necessary
 
 from fastapi import APIRouter, Request, HTTPException
 from auth_utils import verify_token
+from async_utils import run_blocking
 import user_routes
-from firestore import sync_new_files
+from ingest_worker import worker as ingest_worker
+from response_models import ProfileAdapter
+from response_utils import model_response
 
 router = APIRouter()
 
@@ -16,9 +19,8 @@ async def register_user(request: Request):
     """
     Registers a new user in Firestore using the provided data and Firebase Auth token.
     """
-    sync_new_files()
-    
-    user_id = verify_token(request)
+    user_id = await run_blocking(verify_token, request)
+    ingest_worker.kick()
     body = await request.json()
 
     required_fields = ["email", "firstName", "timeZone"]
@@ -31,7 +33,7 @@ async def register_user(request: Request):
     body.setdefault("deviceNicknames", {})
     body.setdefault("currentDeviceID", "")
 
-    user_routes.create_new_user(user_id=user_id, data=body)
+    await run_blocking(user_routes.create_new_user, user_id=user_id, data=body)
     return {"message": f"User {user_id} registered."}
 
 
@@ -40,13 +42,13 @@ async def get_profile(request: Request):
     """
     Retrieves the current user's profile from Firestore based on their Firebase Auth token.
     """
-    sync_new_files()
-
-    uid = verify_token(request)
-    profile = user_routes.get_user(uid)
+    uid = await run_blocking(verify_token, request)
+    profile = await run_blocking(user_routes.get_user, uid)
     if not profile:
         return {"error": "Profile not found"}
-    return profile
+    if profile.get("currentDeviceID"):
+        ingest_worker.kick(profile["currentDeviceID"])
+    return model_response(ProfileAdapter, profile, request.headers.get("accept-encoding"))
 
 
 @router.post("/user/update-device")
@@ -54,11 +56,11 @@ async def update_device(request: Request):
     """
     Updates the user's currentDeviceID field in Firestore.
     """
-    uid = verify_token(request)
+    uid = await run_blocking(verify_token, request)
     body = await request.json()
 
     if "currentDeviceID" not in body:
         raise HTTPException(status_code=400, detail="Missing currentDeviceID")
 
-    user_routes.update_current_user_device(uid, body["currentDeviceID"])
+    await run_blocking(user_routes.update_current_user_device, uid, body["currentDeviceID"])
     return {"message": "Current device updated successfully"}
@@ -4,10 +4,20 @@ user_routes.py
 Defines all routes needed to communicate with Firestore database
 """
 
-
+import os
 from firestore import db
+from cache_utils import TTLCache
+from metrics_utils import track_rpc
+from lazy_utils import LazyProxy
+
+# Created on first use so importing this module does not create the client
+users = LazyProxy(lambda: db.collection("users"))
 
-users = db.collection("users")
+# Profiles are cached per user and refreshed on every write made through this
+# module. Writes made by other workers are picked up once the ttl runs out.
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "300"))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
 
 def create_new_user(user_id: str, data: dict):
     """
@@ -19,11 +29,14 @@ def create_new_user(user_id: str, data: dict):
 
     """
     data["userID"] = user_id
-    users.document(user_id).set(data)
+    with track_rpc("firestore", "set", "users") as rpc:
+        users.document(user_id).set(data)
+        rpc.documents_written = 1
+    user_cache.set(user_id, dict(data))
 
 def get_user(user_id: str):
     """
-        Retrieves a user document from the Firestore 'users' collection.
+        Retrieves a user document, reading Firestore only on a cache miss.
 
         Input:
             user_id (str): The Firebase UID of the user.
@@ -32,10 +45,18 @@ def get_user(user_id: str):
             dict: The user data as a dictionary if the document exists.
             None: If the user document does not exist.
     """
-    data = users.document(user_id).get()
+    profile = user_cache.get(user_id)
+    if profile is not None:
+        return dict(profile)
+
+    with track_rpc("firestore", "get", "users") as rpc:
+        data = users.document(user_id).get()
+        rpc.documents_read = 1
 
     if data.exists:
-        return data.to_dict()
+        profile = data.to_dict()
+        user_cache.set(user_id, profile)
+        return dict(profile)
     return None
 
 def update_current_user_device(user_id: str, device: str):
@@ -48,10 +69,17 @@ def update_current_user_device(user_id: str, device: str):
 
     """
     user_reference = users.document(user_id)
-    curr_data = user_reference.get()
+    with track_rpc("firestore", "get", "users") as rpc:
+        curr_data = user_reference.get()
+        rpc.documents_read = 1
 
     if curr_data.exists:
-        user_reference.update({"currentDeviceID": device})
+        with track_rpc("firestore", "update", "users") as rpc:
+            user_reference.update({"currentDeviceID": device})
+            rpc.documents_written = 1
+        profile = curr_data.to_dict()
+        profile["currentDeviceID"] = device
+        user_cache.set(user_id, profile)
 
 
 def get_current_user_device(user_id: str):
@@ -64,10 +92,29 @@ def get_current_user_device(user_id: str):
         Output:
             currentDeviceID (str): The user's current device 
     """
-    user_reference = users.document(user_id)
-    curr_data = user_reference.get()
+    profile = get_user(user_id)
 
-    if curr_data.exists:
-        data = curr_data.to_dict()
-        return data.get("currentDeviceID")
+    if profile:
+        return profile.get("currentDeviceID")
     return None
+
+
+def get_user_device_ids(user_id: str):
+    """
+        Gets the devices whose recordings a user may access.
+
+        Input:
+            user_id (str): The Firebase UID of the user.
+
+        Output:
+            set: The profile's deviceIDs and its currentDeviceID, empty if the
+            user has no profile.
+    """
+    profile = get_user(user_id)
+    if not profile:
+        return set()
+
+    devices = set(profile.get("deviceIDs") or [])
+    if profile.get("currentDeviceID"):
+        devices.add(profile["currentDeviceID"])
+    return devices
@@ -0,0 +1,171 @@
+"""
+waveform.py
+
+Builds and encodes a multi-resolution min/max peak pyramid for a recording so
+clients can draw its waveform from a few KB instead of the full WAV.
+
+Level 0 holds one min/max pair per BASE_SAMPLES_PER_PEAK samples and every
+following level is LEVEL_FACTOR times coarser. Peaks are stored as int8
+(the top byte of each 16-bit sample), which is plenty for drawing.
+
+Binary layout (little endian):
+    header:   4s magic "WVPK", B version, B level count, H reserved, I sample rate
+    levels:   I samples per peak, I peak count   (one entry per level)
+    data:     int8 min, int8 max pairs for level 0, then level 1, ...
+"""
+
+import struct
+import numpy as np
+
+BASE_SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+NUM_LEVELS = 4
+
+# Pyramids are stored in the recordings bucket under this prefix
+WAVEFORM_PREFIX = "waveforms/"
+
+MAGIC = b"WVPK"
+VERSION = 1
+HEADER_FORMAT = "<4sBBHI"
+LEVEL_FORMAT = "<II"
+
+
+def waveform_path(recording_id: str) -> str:
+    """
+    Gets the storage object name of a recording's pyramid.
+
+    Input:
+        recording_id (str): The recording document id
+
+    Output:
+        str: Storage object name
+    """
+    return f"{WAVEFORM_PREFIX}{recording_id}.bin"
+
+
+class PeakPyramid:
+    """
+    Accumulates level 0 peaks over chunks of 16-bit samples and derives the
+    coarser levels from them.
+    """
+
+    def __init__(self, sample_rate: int):
+        """
+        Input:
+            sample_rate (int): Samples per second
+        """
+        self.sample_rate = sample_rate
+        self._mins = []
+        self._maxs = []
+        self._partial = np.empty(0, dtype=np.int16)
+
+    def add(self, samples: np.ndarray):
+        """
+        Adds a chunk of int16 samples.
+
+        Input:
+            samples (np.ndarray): int16 samples in recording order
+        """
+        buffer = np.concatenate((self._partial, samples))
+        whole = buffer.size - buffer.size % BASE_SAMPLES_PER_PEAK
+        self._add_frames(buffer[:whole])
+        self._partial = buffer[whole:]
+
+    def _add_frames(self, samples: np.ndarray):
+        """
+        Reduces a buffer holding a whole number of peak windows.
+        """
+        if samples.size == 0:
+            return
+        frames = samples.reshape(-1, min(samples.size, BASE_SAMPLES_PER_PEAK))
+        self._mins.append(frames.min(axis=1))
+        self._maxs.append(frames.max(axis=1))
+
+    def levels(self):
+        """
+        Output:
+            list: (samples per peak, int8 mins, int8 maxs) for each level,
+            finest first
+        """
+        self._add_frames(self._partial)
+        self._partial = np.empty(0, dtype=np.int16)
+
+        mins = np.concatenate(self._mins) if self._mins else np.empty(0, dtype=np.int16)
+        maxs = np.concatenate(self._maxs) if self._maxs else np.empty(0, dtype=np.int16)
+
+        levels = []
+        samples_per_peak = BASE_SAMPLES_PER_PEAK
+        for _ in range(NUM_LEVELS):
+            levels.append((samples_per_peak,
+                           (mins >> 8).astype(np.int8),
+                           (maxs >> 8).astype(np.int8)))
+            pad = -mins.size % LEVEL_FACTOR
+            if mins.size:
+                mins = np.pad(mins, (0, pad), mode="edge").reshape(-1, LEVEL_FACTOR).min(axis=1)
+                maxs = np.pad(maxs, (0, pad), mode="edge").reshape(-1, LEVEL_FACTOR).max(axis=1)
+            samples_per_peak *= LEVEL_FACTOR
+        return levels
+
+
+def encode_pyramid(pyramid: PeakPyramid) -> bytes:
+    """
+    Serializes a peak pyramid to the binary layout described above.
+
+    Input:
+        pyramid (PeakPyramid): Pyramid with every chunk added
+
+    Output:
+        bytes: The encoded pyramid
+    """
+    levels = pyramid.levels()
+    parts = [struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(levels), 0, pyramid.sample_rate)]
+    parts += [struct.pack(LEVEL_FORMAT, samples_per_peak, mins.size)
+              for samples_per_peak, mins, _ in levels]
+    for _, mins, maxs in levels:
+        parts.append(np.column_stack((mins, maxs)).tobytes())
+    return b"".join(parts)
+
+
+def decode_level(data: bytes, level: int):
+    """
+    Extracts one level from an encoded pyramid without decoding the others.
+
+    Input:
+        data (bytes): The encoded pyramid
+        level (int): Level to extract, 0 is the finest
+
+    Output:
+        dict: sample_rate, samples_per_peak, peak_count and peaks (interleaved
+        int8 min/max bytes)
+
+    Raises:
+        ValueError: If the data is not a pyramid, is truncated or the level
+        does not exist
+    """
+    header_size = struct.calcsize(HEADER_FORMAT)
+    level_size = struct.calcsize(LEVEL_FORMAT)
+    if len(data) < header_size:
+        raise ValueError("Data is shorter than the header")
+    magic, version, level_count, _, sample_rate = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a waveform pyramid")
+    if not 0 <= level < level_count:
+        raise ValueError(f"Level must be between 0 and {level_count - 1}")
+
+    offset = header_size + level_count * level_size
+    if len(data) < offset:
+        raise ValueError("Data is shorter than the level table")
+    for index in range(level_count):
+        samples_per_peak, count = struct.unpack_from(LEVEL_FORMAT, data,
+                                                     header_size + index * level_size)
+        if index == level:
+            if len(data) < offset + 2 * count:
+                raise ValueError("Level data is truncated")
+            return {
+                "sample_rate": sample_rate,
+                "samples_per_peak": samples_per_peak,
+                "peak_count": count,
+                "peaks": data[offset:offset + 2 * count],
+            }
+        offset += 2 * count
+    raise ValueError("Level not found")